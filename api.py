@@ -0,0 +1,258 @@
+"""
+Lightweight JSON HTTP API over the download engine.
+
+Endpoints:
+    GET  /health                          liveness check
+    GET  /extractors?q=vimeo&limit=50     search supported extractors
+    POST /classify    {"urls": [...]}     route URLs offline
+    POST /jobs        {"urls": [...], "options": {...}}
+    GET  /jobs                            list this client's jobs
+    GET  /jobs/<id>                       job status and counters
+    GET  /jobs/<id>/results?offset=0&limit=100
+    GET  /jobs/<id>/files/<position>/<n>  fetch an output file
+    DELETE /jobs/<id>                     delete a finished job and its files
+    GET  /usage                           this client's quota usage
+    GET  /library?q=&uploader=&offset=0&limit=50   search the output library
+
+Set YTDLP_API_KEY to require a matching X-API-Key header on every request;
+a comma-separated list admits several keys. Quotas (see quotas.py) are
+kept per API key, or per client address when no key is required; jobs
+are visible only to the account that submitted them.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlparse, parse_qs
+
+import engine
+import library
+from quotas import QuotaExceeded, quotas
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Upper bound on request bodies; job submissions are URL lists, not media
+MAX_REQUEST_BODY_BYTES = 16 * 1024 * 1024
+# Public job fields; 'dir' is a server path and stays internal
+JOB_FIELDS = ('id', 'status', 'created_at', 'started_at', 'finished_at', 'settings',
+              'total', 'succeeded', 'failed', 'skipped', 'error', 'eta_seconds')
+# Characters replaced in the plain filename= fallback of Content-Disposition
+_UNSAFE_FILENAME_RE = re.compile(r'[^\x20-\x7e]|["\\]')
+
+
+def public_job(job):
+    return {key: job[key] for key in JOB_FIELDS}
+
+
+def content_disposition(filename):
+    """Attachment header value: an ASCII filename for old clients, the exact name per RFC 5987."""
+    fallback = _UNSAFE_FILENAME_RE.sub('_', filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "ytdlp-downloader-api"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BODY_BYTES:
+            raise ApiError(413, "Request body too large")
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+
+    def check_api_key(self):
+        keys = self.server.api_keys
+        if keys and self.headers.get("X-API-Key") not in keys:
+            raise ApiError(401, "Missing or invalid API key")
+
+    def account(self):
+        """Quota account of this request: its API key's fingerprint, else the client address."""
+        key = self.headers.get("X-API-Key")
+        if self.server.api_keys and key:
+            return "key:" + hashlib.sha256(key.encode()).hexdigest()[:12]
+        return "ip:" + self.client_address[0]
+
+    def dispatch(self, method):
+        parsed = urlparse(self.path)
+        parts = [p for p in parsed.path.split('/') if p]
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        try:
+            self.check_api_key()
+            route = getattr(self, f"{method.lower()}_{parts[0]}" if parts else "", None)
+            if route is None:
+                raise ApiError(404, "Not found")
+            route(parts[1:], query)
+        except ApiError as e:
+            self.send_json(e.status, {'error': e.message})
+        except QuotaExceeded as e:
+            self.send_json(429, {'error': f"Quota exceeded: {e}"})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except ConnectionError:
+            # The client went away mid-response
+            pass
+        except Exception as e:
+            traceback.print_exc()
+            self.send_json(500, {'error': f"Internal server error: {type(e).__name__}"})
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    # ----- routes -----
+
+    def get_health(self, parts, query):
+        self.send_json(200, {'status': "ok", 'ffmpeg': engine.check_ffmpeg_availability()})
+
+    def get_extractors(self, parts, query):
+        matches, total = engine.search_extractors(query.get('q', ''), limit=int(query.get('limit', 50)))
+        self.send_json(200, {
+            'total': total,
+            'extractors': [
+                {'name': e['name'], 'description': e['description'],
+                 'domains': e['domains'], 'working': e['working']}
+                for e in matches
+            ],
+        })
+
+    def post_classify(self, parts, query):
+        payload = self.read_json()
+        urls = payload.get('urls') if isinstance(payload, dict) else None
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise ApiError(400, "'urls' must be a list of URLs")
+        results = []
+        for url in urls:
+            is_valid, message = engine.validate_url(url)
+            extractor = engine.classify_url(url) if is_valid else None
+            results.append({
+                'url': url,
+                'supported': is_valid,
+                'message': message,
+                'extractor': extractor['name'] if extractor else None,
+                'identity': list(engine.url_identity(url)) if is_valid else None,
+            })
+        self.send_json(200, {'results': results})
+
+    def post_jobs(self, parts, query):
+        if parts:
+            raise ApiError(404, "Not found")
+        payload = self.read_json()
+        urls = payload.get('urls')
+        if not isinstance(urls, list):
+            raise ApiError(400, "'urls' must be a list of URLs")
+        job_id = engine.submit_job(urls, payload.get('options'), account=self.account())
+        self.send_json(202, public_job(engine.get_job(job_id)))
+
+    def get_jobs(self, parts, query):
+        account = self.account()
+        if not parts:
+            jobs = [public_job(j) for j in engine.list_jobs() if j['account'] == account]
+            self.send_json(200, {'jobs': jobs})
+            return
+        job = engine.get_job(parts[0])
+        # Other accounts' jobs are indistinguishable from unknown ones, as in DELETE
+        if job is None or job['account'] != account:
+            raise ApiError(404, "Unknown job")
+        if len(parts) == 1:
+            self.send_json(200, public_job(job))
+        elif parts[1] == "results" and len(parts) == 2:
+            results = engine.read_batch_results(
+                job['dir'],
+                offset=int(query.get('offset', 0)),
+                limit=min(int(query.get('limit', 100)), 1000),
+                etas=engine.job_etas(job['id'])
+            )
+            self.send_json(200, {'job': public_job(job), 'results': results})
+        elif parts[1] == "files" and len(parts) == 4:
+            self.send_job_file(job['id'], int(parts[2]), int(parts[3]))
+        else:
+            raise ApiError(404, "Not found")
+
+    def delete_jobs(self, parts, query):
+        if len(parts) != 1:
+            raise ApiError(404, "Not found")
+        if not engine.delete_job(parts[0], account=self.account()):
+            raise ApiError(404, "Unknown job")
+        self.send_json(200, {'deleted': parts[0]})
+
+    def get_usage(self, parts, query):
+        account = self.account()
+        self.send_json(200, dict(quotas.usage(account), account=account))
+
+    def get_library(self, parts, query):
+        if not library.enabled():
+            raise ApiError(404, "No output library is configured")
+        items, total = library.search(
+            query.get('q'), query.get('uploader'),
+            offset=int(query.get('offset', 0)), limit=min(int(query.get('limit', 50)), 1000)
+        )
+        # Library paths are server-side; clients get names and sizes
+        for item in items:
+            del item['path']
+        self.send_json(200, {'total': total, 'items': items})
+
+    def send_job_file(self, job_id, position, file_index):
+        found = engine.job_file_path(job_id, position, file_index)
+        if found is None:
+            raise ApiError(404, "Unknown file")
+        filename, file_path = found
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(file_path)))
+        self.send_header("Content-Disposition", content_disposition(filename))
+        self.end_headers()
+        # Stream from disk; outputs can be far larger than memory
+        with open(file_path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, api_key=None, verbose=False):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    api_key = api_key if api_key is not None else os.environ.get("YTDLP_API_KEY")
+    server.api_keys = {key.strip() for key in (api_key or "").split(",") if key.strip()}
+    server.verbose = verbose
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, api_key=None, verbose=True):
+    server = make_server(host, port, api_key, verbose)
+    print(f"Serving download API on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,4 +1,5 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import subprocess
 import os
 import tempfile
@@ -10,13 +11,54 @@ import requests
 from urllib.parse import urlparse
 import time
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import platform
 import sys
 import zipfile
 import stat
 import tarfile
 import threading
+import uuid
+
+from engine import (
+    AUDIO_FORMATS,
+    BATCH_FILE_TYPES,
+    BATCH_SCHEDULES,
+    DOWNLOAD_TYPES,
+    GENERIC_URL_MESSAGE,
+    MAX_FILE_SIZES,
+    OUTPUT_TEMPLATE,
+    VIDEO_QUALITIES,
+    batch_estimate,
+    batch_parallelism_controller,
+    build_extractor_index,
+    canonicalize_urls,
+    categorize_error,
+    classify_url,
+    count_batch_file_urls,
+    download_with_ytdlp_api,
+    export_batch_report,
+    iter_batch_file,
+    iter_batch_jobs,
+    largest_batch_files,
+    network_options,
+    new_canonicalize_stats,
+    open_batch_state,
+    plan_audio_extraction,
+    rendition_choices,
+    run_batch,
+    search_extractors,
+    section_options,
+    transcode_codec,
+    validate_url,
+)
+from estimator import estimate_batch_seconds, format_seconds, throughput_stats
+import history
+import library
+from jobqueue import batch_progress, enqueue_urls, iter_batch_results, open_queue
+from proxypool import pool as proxy_pool
+from quotas import QuotaExceeded, quotas
+from scheduler import scheduler as download_scheduler
+from transfer import bandwidth_stats
 
 # =============================================================================
 # CONFIGURATION CONSTANTS
@@ -27,35 +69,8 @@ import threading
 MAX_SAFE_FILE_SIZE_MB = 100
 MAX_SAFE_FILE_SIZE_BYTES = MAX_SAFE_FILE_SIZE_MB * 1024 * 1024
 
-# FFmpeg status tracking
-_ffmpeg_status = {"checked": False, "available": False, "message": ""}
-
-
-def check_ffmpeg_availability():
-    """Check if ffmpeg is available without blocking startup."""
-    global _ffmpeg_status
-    if _ffmpeg_status["checked"]:
-        return _ffmpeg_status["available"]
-
-    _ffmpeg_status["checked"] = True
-    if shutil.which("ffmpeg"):
-        _ffmpeg_status["available"] = True
-        _ffmpeg_status["message"] = "FFmpeg found in PATH"
-    else:
-        _ffmpeg_status["available"] = False
-        _ffmpeg_status["message"] = "FFmpeg not found. Some features may be limited."
-
-    return _ffmpeg_status["available"]
-
-
-def get_ffmpeg_status():
-    """Get the current ffmpeg status message."""
-    check_ffmpeg_availability()
-    return _ffmpeg_status
-
-
-# Check ffmpeg availability (non-blocking)
-check_ffmpeg_availability()
+# Batches larger than this only report failures and counters, not every URL
+BATCH_VERBOSE_LIMIT = 100
 
 def cleanup_temp_dir_robust(temp_dir):
     if not temp_dir or not os.path.exists(temp_dir):
@@ -121,9 +136,20 @@ def create_yt_dlp_progress_hook(progress_bar, status_text=None):
     """
     Create a progress hook for yt-dlp that updates a Streamlit progress bar.
 
-    This replaces the need to parse stdout with regex.
+    This replaces the need to parse stdout with regex. yt-dlp may call it
+    from fragment download threads, so each call runs with the script's run
+    context and updates are serialised.
     """
+    ctx = get_script_run_ctx()
+    lock = threading.Lock()
+
     def progress_hook(d):
+        if ctx is not None and get_script_run_ctx(suppress_warning=True) is None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        with lock:
+            update_progress(d)
+
+    def update_progress(d):
         if d['status'] == 'downloading':
             # Calculate progress
             total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
@@ -148,92 +174,10 @@ def create_yt_dlp_progress_hook(progress_bar, status_text=None):
             if status_text:
                 status_text.text("Download complete, processing...")
 
+    progress_hook.thread_safe = True
     return progress_hook
 
 
-def download_with_ytdlp_api(url, output_dir, options, progress_bar=None, status_text=None):
-    """
-    Download using yt-dlp Python API instead of subprocess.
-
-    Returns dict with 'success', 'files', 'error' keys.
-    """
-    ydl_opts = {
-        'outtmpl': os.path.join(output_dir, '%(title).100s-%(id)s.%(ext)s'),
-        'restrictfilenames': True,
-        'quiet': True,
-        'no_warnings': True,
-    }
-
-    # Add progress hook if progress bar provided
-    if progress_bar:
-        ydl_opts['progress_hooks'] = [create_yt_dlp_progress_hook(progress_bar, status_text)]
-
-    # Apply download type options
-    download_type = options.get('download_type', 'Video + Audio')
-    quality = options.get('quality', 'Best Available')
-    audio_format = options.get('audio_format', 'mp3')
-
-    if download_type == "Audio Only":
-        ydl_opts['format'] = 'bestaudio/best'
-        ydl_opts['postprocessors'] = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': audio_format,
-        }]
-    elif download_type == "Video Only":
-        ydl_opts['format'] = 'bestvideo'
-    else:
-        # Video + Audio
-        if quality != "Best Available":
-            quality_map = {
-                "1080p": "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
-                "720p": "bestvideo[height<=720]+bestaudio/best[height<=720]",
-                "480p": "bestvideo[height<=480]+bestaudio/best[height<=480]",
-                "360p": "bestvideo[height<=360]+bestaudio/best[height<=360]"
-            }
-            ydl_opts['format'] = quality_map.get(quality, 'best')
-        else:
-            ydl_opts['format'] = 'bestvideo+bestaudio/best'
-
-    # Additional options
-    if options.get('download_subs'):
-        ydl_opts['writesubtitles'] = True
-        ydl_opts['subtitleslangs'] = ['en']
-
-    if options.get('download_thumbnail'):
-        ydl_opts['writethumbnail'] = True
-
-    if options.get('embed_metadata') and check_ffmpeg_availability():
-        ydl_opts['postprocessors'] = ydl_opts.get('postprocessors', [])
-        ydl_opts['postprocessors'].append({'key': 'FFmpegMetadata'})
-
-    if options.get('max_file_size') and options['max_file_size'] != "No Limit":
-        size_map = {"100MB": 100*1024*1024, "500MB": 500*1024*1024,
-                    "1GB": 1000*1024*1024, "2GB": 2000*1024*1024}
-        ydl_opts['max_filesize'] = size_map.get(options['max_file_size'])
-
-    # Playlist options
-    if options.get('playlist_start', 1) > 1:
-        ydl_opts['playliststart'] = options['playlist_start']
-    if options.get('playlist_end', 0) > 0:
-        ydl_opts['playlistend'] = options['playlist_end']
-
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-
-        # Collect downloaded files
-        files = []
-        for root, _, filenames in os.walk(output_dir):
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                files.append((filename, file_path, os.path.getsize(file_path)))
-
-        return {'success': True, 'files': files, 'error': None}
-
-    except Exception as e:
-        return {'success': False, 'files': [], 'error': str(e)}
-
-
 st.set_page_config(
     layout="wide",
     page_title="YT-DLP Downloader",
@@ -723,6 +667,20 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def advanced_download_options():
+    """Engine options from the Advanced Settings expander, as last rendered."""
+    advanced = st.session_state.get('advanced_settings') or {}
+    proxies = advanced.get('proxies', []) if advanced.get('use_proxy') else []
+    return {
+        'rate_limit': advanced.get('rate_limit', 0),
+        # One proxy is used as is; several form a pool the job rotates through
+        'proxy': proxies[0] if len(proxies) == 1 else '',
+        'proxies': proxies if len(proxies) > 1 else [],
+        'custom_format': advanced.get('custom_format', ''),
+        'filename_template': advanced.get('filename_template', ''),
+        'library': advanced.get('library', False),
+    }
+
 @st.cache_data
 def check_dependencies():
     deps = {
@@ -750,17 +708,6 @@ def check_dependencies():
         pass
     return deps
 
-def validate_url(url):
-    if not url:
-        return False, "URL cannot be empty"
-    try:
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return False, "Invalid URL format. Please include http:// or https://"
-        return True, "URL format is valid"
-    except:
-        return False, "Invalid URL format"
-
 def parse_progress(line):
     progress_info = {}
     progress_match = re.search(r'\[download\]\s+(\d+\.?\d*)%.*?(\d+\.?\d*\w+/s)', line)
@@ -772,57 +719,15 @@ def parse_progress(line):
         progress_info['eta'] = eta_match.group(1)
     return progress_info
 
-def categorize_error(error_message):
-    error_lower = error_message.lower()
-    if 'network' in error_lower or 'connection' in error_lower or 'timeout' in error_lower:
-        return "Network Error", "Check your internet connection and try again."
-    elif 'login' in error_lower or 'authentication' in error_lower or 'private' in error_lower:
-        if 'instagram' in error_lower and 'stories' in error_lower:
-            return "Instagram Story Restriction", "Instagram stories often require login. Try a public post or reel."
-        return "Authentication Required", "This content requires login, which is disabled. Try a different video."
-    elif 'format' in error_lower and 'not available' in error_lower:
-        return "Format Error", "Try a different quality setting."
-    elif 'ffmpeg' in error_lower:
-        return "FFmpeg Error", "FFmpeg is required. Check the System tab to install it."
-    elif 'instagram' in error_lower:
-        return "Instagram Restriction", "Instagram content may have restrictions. Try a different URL."
-    elif 'youtube' in error_lower:
-        return "YouTube Restriction", "Some YouTube videos are restricted. Try a different video."
-    elif 'unsupported' in error_lower or 'not a valid' in error_lower:
-        return "URL Error", "The URL is invalid or from an unsupported site."
-    elif 'permission denied' in error_lower or 'cannot write' in error_lower:
-        return "Permission Error", "Check write permissions to the output directory."
-    elif 'invalid option' in error_lower or 'unknown option' in error_lower:
-        return "Configuration Error", "Check the advanced options."
-    elif 'live stream' in error_lower or 'cannot download live' in error_lower:
-        return "Live Stream Error", "Live streams cannot be downloaded."
-    elif 'rate limit' in error_lower or 'too many requests' in error_lower:
-        return "Rate Limit Error", "Too many requests. Try again later."
-    elif 'video unavailable' in error_lower or 'deleted' in error_lower:
-        return "Content Error", "The video is unavailable or deleted."
-    elif 'no subtitles' in error_lower or 'subtitles not found' in error_lower:
-        return "Subtitle Error", "Subtitles are not available."
-    elif 'disk full' in error_lower or 'no space left' in error_lower:
-        return "Disk Space Error", "Free up disk space and try again."
-    elif 'ssl' in error_lower or 'certificate' in error_lower:
-        return "SSL Error", "Update certificates or check network settings."
-    elif 'proxy' in error_lower:
-        return "Proxy Error", "Check proxy configuration."
-    elif 'invalid character' in error_lower or 'filename too long' in error_lower:
-        return "Filename Error", "Change the filename template in advanced settings."
-    elif 'index out of range' in error_lower or 'invalid playlist index' in error_lower:
-        return "Playlist Error", "Check playlist indices."
-    elif 'file too large' in error_lower or 'exceeds max size' in error_lower:
-        return "File Size Error", "Try lower quality or increase the limit."
-    else:
-        return "Unknown Error", "An unexpected error occurred."
-
 if 'video_info' not in st.session_state:
     st.session_state.video_info = None
 if 'is_playlist_url' not in st.session_state:
     st.session_state.is_playlist_url = False
-if 'download_history' not in st.session_state:
-    st.session_state.download_history = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
+if 'session_id' not in st.session_state:
+    # This browser session's share in the server-wide download scheduler
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Simple mobile detection using user agent
 user_agent = st.get_option("server.enableCORS")
@@ -879,7 +784,9 @@ with tab1:
             fetch_clicked = st.button("Fetch Info", use_container_width=True, disabled=not url)
     if url:
         is_valid, message = validate_url(url)
-        if is_valid:
+        if is_valid and message == GENERIC_URL_MESSAGE:
+            st.warning(message)
+        elif is_valid:
             st.success(f"{message}")
         else:
             st.error(f"{message}")
@@ -934,19 +841,19 @@ with tab1:
         if st.session_state.get('is_mobile', False):
             download_type = st.selectbox(
                 "Download Type",
-                ["Video + Audio", "Audio Only", "Video Only"]
+                DOWNLOAD_TYPES
             )
             if download_type != "Audio Only":
                 quality = st.selectbox(
                     "Video Quality",
-                    ["Best Available", "1080p", "720p", "480p", "360p"]
+                    VIDEO_QUALITIES
                 )
             else:
                 quality = "Best Available"
             if download_type == "Audio Only":
                 audio_format = st.selectbox(
                     "Audio Format",
-                    ["mp3", "aac", "m4a", "opus", "flac"]
+                    AUDIO_FORMATS
                 )
             else:
                 audio_format = "mp3"
@@ -955,13 +862,13 @@ with tab1:
             with option_col1:
                 download_type = st.selectbox(
                     "Download Type",
-                    ["Video + Audio", "Audio Only", "Video Only"]
+                    DOWNLOAD_TYPES
                 )
             with option_col2:
                 if download_type != "Audio Only":
                     quality = st.selectbox(
                         "Video Quality",
-                        ["Best Available", "1080p", "720p", "480p", "360p"]
+                        VIDEO_QUALITIES
                     )
                 else:
                     quality = "Best Available"
@@ -969,15 +876,28 @@ with tab1:
                 if download_type == "Audio Only":
                     audio_format = st.selectbox(
                         "Audio Format",
-                        ["mp3", "aac", "m4a", "opus", "flac"]
+                        AUDIO_FORMATS
                     )
                 else:
                     audio_format = "mp3"
+        if download_type == "Audio Only" and not st.session_state.is_playlist_url:
+            audio_plan = plan_audio_extraction(info, audio_format)
+            if audio_plan and audio_plan['action'] == 'copy':
+                st.caption(f"⚡ Source audio is already {audio_plan['source_codec']}: "
+                           f"it will be copied into .{audio_format} without re-encoding.")
+            elif audio_plan:
+                st.caption(f"🔄 Source audio is {audio_plan['source_codec']}: "
+                           f"it will be transcoded to {audio_format}.")
         with st.expander("➕ Additional Options"):
             # Mobile-friendly additional options layout
             if st.session_state.get('is_mobile', False):
                 download_subs = st.checkbox("Download Subtitles")
                 download_thumbnail = st.checkbox("Download Thumbnail")
+                embed_files = st.checkbox(
+                    "Embed in File",
+                    disabled=not deps['ffmpeg'] or not (download_subs or download_thumbnail),
+                    help="Embed the subtitles and thumbnail in the media file, in the same FFmpeg pass as metadata"
+                )
                 if st.session_state.is_playlist_url:
                     playlist_start = st.number_input("Start from video #", min_value=1, value=1)
                     playlist_end = st.number_input("End at video # (0 = all)", min_value=0, value=0)
@@ -985,15 +905,36 @@ with tab1:
                     playlist_start = 1
                     playlist_end = 0
                 embed_metadata = st.checkbox("Add Metadata", disabled=not deps['ffmpeg'])
+                fast_formats = st.checkbox(
+                    "Fast Mode",
+                    disabled=download_type != "Video + Audio",
+                    help="Download a single file instead of merging video and audio when one exists at the same quality"
+                )
+                parallel_transcode = st.checkbox(
+                    "Parallel Transcode",
+                    disabled=download_type != "Audio Only" or not deps['ffmpeg'],
+                    help="Split long (20+ min) flac transcodes into segments encoded on all CPU cores"
+                )
                 max_file_size = st.selectbox(
                     "Max File Size",
-                    ["No Limit", "100MB", "500MB", "1GB", "2GB"]
+                    MAX_FILE_SIZES
+                )
+                renditions = st.multiselect(
+                    "Extra Renditions",
+                    rendition_choices(download_type, audio_format),
+                    disabled=not deps['ffmpeg'],
+                    help="Also produce these from the same download and a single FFmpeg decode"
                 )
             else:
                 option_col1, option_col2 = st.columns(2)
                 with option_col1:
                     download_subs = st.checkbox("Download Subtitles")
                     download_thumbnail = st.checkbox("Download Thumbnail")
+                    embed_files = st.checkbox(
+                        "Embed in File",
+                        disabled=not deps['ffmpeg'] or not (download_subs or download_thumbnail),
+                        help="Embed the subtitles and thumbnail in the media file, in the same FFmpeg pass as metadata"
+                    )
                     if st.session_state.is_playlist_url:
                         playlist_start = st.number_input("Start from video #", min_value=1, value=1)
                         playlist_end = st.number_input("End at video # (0 = all)", min_value=0, value=0)
@@ -1002,14 +943,62 @@ with tab1:
                         playlist_end = 0
                 with option_col2:
                     embed_metadata = st.checkbox("Add Metadata", disabled=not deps['ffmpeg'])
+                    fast_formats = st.checkbox(
+                        "Fast Mode",
+                        disabled=download_type != "Video + Audio",
+                        help="Download a single file instead of merging video and audio when one exists at the same quality"
+                    )
+                    parallel_transcode = st.checkbox(
+                        "Parallel Transcode",
+                        disabled=download_type != "Audio Only" or not deps['ffmpeg'],
+                        help="Split long (20+ min) flac transcodes into segments encoded on all CPU cores"
+                    )
                     max_file_size = st.selectbox(
                         "Max File Size",
-                        ["No Limit", "100MB", "500MB", "1GB", "2GB"]
+                        MAX_FILE_SIZES
+                    )
+                    renditions = st.multiselect(
+                        "Extra Renditions",
+                        rendition_choices(download_type, audio_format),
+                        disabled=not deps['ffmpeg'],
+                        help="Also produce these from the same download and a single FFmpeg decode"
                     )
+        with st.expander("✂️ Clip & Chapters"):
+            clip_start = st.text_input(
+                "Start Time",
+                placeholder="e.g. 1:30",
+                help="Only the fragments covering the selected range or chapters are downloaded"
+            )
+            clip_end = st.text_input("End Time", placeholder="e.g. 2:45")
+            video_chapters = [] if st.session_state.is_playlist_url else [
+                chapter['title'] for chapter in info.get('chapters') or [] if chapter.get('title')
+            ]
+            if video_chapters:
+                selected_chapters = st.multiselect("Chapters", video_chapters)
+            else:
+                selected_chapters = []
+                if not st.session_state.is_playlist_url:
+                    st.caption("This video has no chapters.")
+            split_chapters = st.checkbox(
+                "Split by Chapters",
+                disabled=not deps['ffmpeg'],
+                help="Also save each chapter as its own file"
+            )
+            clip_chapters = [f"^{re.escape(title)}$" for title in selected_chapters]
+            try:
+                section_options("", clip_start, clip_end, clip_chapters)
+                clip_error = None
+            except ValueError as e:
+                clip_error = str(e)
+                st.error(clip_error)
+        advanced_error = (st.session_state.get('advanced_settings') or {}).get('error')
+        if advanced_error:
+            st.error(f"Advanced Settings: {advanced_error}")
         st.markdown("---")
         # Mobile-friendly download button layout
         if st.session_state.get('is_mobile', False):
-            if st.button("Start Download", type="primary", use_container_width=True):
+            if st.button("Start Download", type="primary", use_container_width=True,
+                         disabled=bool(clip_error or advanced_error)):
                 if not deps['yt-dlp']:
                     st.error("yt-dlp is required but not installed!")
                 else:
@@ -1018,7 +1007,8 @@ with tab1:
         else:
             download_col1, download_col2, download_col3 = st.columns([2, 2, 2])
             with download_col2:
-                if st.button("Start Download", type="primary", use_container_width=True):
+                if st.button("Start Download", type="primary", use_container_width=True,
+                             disabled=bool(clip_error or advanced_error)):
                     if not deps['yt-dlp']:
                         st.error("yt-dlp is required but not installed!")
                     else:
@@ -1039,9 +1029,18 @@ with tab1:
                 'download_subs': download_subs,
                 'download_thumbnail': download_thumbnail,
                 'embed_metadata': embed_metadata and deps['ffmpeg'],
+                'fast_formats': fast_formats,
+                'embed': embed_files and deps['ffmpeg'],
+                'renditions': renditions,
+                'parallel_transcode': parallel_transcode,
+                'start_time': clip_start,
+                'end_time': clip_end,
+                'chapters': clip_chapters,
+                'split_chapters': split_chapters,
                 'max_file_size': max_file_size,
                 'playlist_start': playlist_start if st.session_state.is_playlist_url else 1,
                 'playlist_end': playlist_end if st.session_state.is_playlist_url else 0,
+                **advanced_download_options(),
             }
 
             # Use yt-dlp Python API instead of subprocess
@@ -1049,8 +1048,8 @@ with tab1:
                 url=url,
                 output_dir=temp_dir,
                 options=download_options,
-                progress_bar=progress_bar,
-                status_text=status_text
+                progress_hooks=[create_yt_dlp_progress_hook(progress_bar, status_text)],
+                session=st.session_state.session_id
             )
 
             if result['success'] and result['files']:
@@ -1083,13 +1082,8 @@ with tab1:
                     with col2:
                         st.markdown(f"**{size / 1024 / 1024:.1f} MB**")
 
-                st.session_state.download_history.insert(0, {
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "url": url[:50] + "..." if len(url) > 50 else url,
-                    "title": st.session_state.video_info.get('title', 'Unknown')[:30] + "...",
-                    "files": len(downloaded_files),
-                    "status": "Success"
-                })
+                st.session_state.download_count += 1
+                st.session_state.total_downloaded_size += total_size
             else:
                 st.error("Download failed!")
                 if result['error']:
@@ -1122,37 +1116,75 @@ with tab2:
                 st.warning("Could not clean up all old temporary files.")
     st.markdown("## Batch Download")
     st.markdown("Download multiple videos at once with the same settings.")
+    batch_input_mode = st.radio(
+        "Input",
+        ["Paste URLs", "Upload File"],
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+    urls_list = []
+    batch_upload = None
     col1, col2 = st.columns([2, 1])
     with col1:
-        batch_urls = st.text_area(
-            "📝 Video URLs (one per line)",
-            height=150,
-            placeholder="https://www.youtube.com/watch?v=dQw4w9WgXcQ\nhttps://www.youtube.com/watch?v=example2"
-        )
-        urls_list = [u.strip() for u in batch_urls.split('\n') if u.strip()]
+        if batch_input_mode == "Upload File":
+            batch_upload = st.file_uploader(
+                "📄 URL list (.txt, .csv or .jsonl)",
+                type=BATCH_FILE_TYPES,
+                help="Large lists are streamed from disk: only a small window of downloads is queued at a time"
+            )
+            if batch_upload is not None:
+                st.info(f"{batch_upload.name} ({batch_upload.size / 1024:.1f} KB) ready for download")
+                st.caption("URLs are validated and deduplicated while the batch runs.")
+        else:
+            batch_urls = st.text_area(
+                "📝 Video URLs (one per line)",
+                height=150,
+                placeholder="https://www.youtube.com/watch?v=dQw4w9WgXcQ\nhttps://www.youtube.com/watch?v=example2"
+            )
+            urls_list = [u.strip() for u in batch_urls.split('\n') if u.strip()]
+        rejected_urls = []
         if urls_list:
+            # Route every URL offline so unsupported sites never reach the executor
+            checked_urls = [(u, validate_url(u)) for u in urls_list]
+            urls_list = [u for u, (is_valid, _) in checked_urls if is_valid]
+            rejected_urls = [(u, message) for u, (is_valid, message) in checked_urls if not is_valid]
+        if urls_list:
+            # Collapse different spellings of the same video before scheduling
+            canonical = canonicalize_urls(urls_list)
+            urls_list = canonical['urls']
             st.info(f"{len(urls_list)} URL{'s' if len(urls_list) > 1 else ''} ready for download")
+            if canonical['merged']:
+                st.caption(f"Merged {canonical['merged']} duplicate URL(s) pointing to the same video")
+        if rejected_urls:
+            st.warning(f"{len(rejected_urls)} URL(s) rejected before download")
+            with st.expander("Show rejected URLs"):
+                for rejected_url, message in rejected_urls[:100]:
+                    st.text(f"{rejected_url[:80]} - {message}")
+                if len(rejected_urls) > 100:
+                    st.text(f"... and {len(rejected_urls) - 100} more")
     with col2:
         if urls_list:
             st.markdown("**📊 Quick Preview:**")
             for i, url in enumerate(urls_list[:3], 1):
+                extractor = classify_url(url)
                 domain = url.split('/')[2] if '/' in url else url
-                st.text(f"{i}. {domain}")
+                st.text(f"{i}. {domain} ({extractor['name'] if extractor else 'generic'})")
             if len(urls_list) > 3:
                 st.text(f"... and {len(urls_list) - 3} more")
-    if urls_list:
+    batch_ready = bool(urls_list) or batch_upload is not None
+    if batch_ready:
         st.markdown("### Batch Download Settings")
         setting_col1, setting_col2, setting_col3 = st.columns(3)
         with setting_col1:
             batch_download_type = st.selectbox(
                 "📹 Download Type",
-                ["Video + Audio", "Audio Only", "Video Only"]
+                DOWNLOAD_TYPES
             )
         with setting_col2:
             if batch_download_type != "Audio Only":
                 batch_quality = st.selectbox(
                     "🎯 Video Quality",
-                    ["Best Available", "1080p", "720p", "480p", "360p"]
+                    VIDEO_QUALITIES
                 )
             else:
                 batch_quality = "Best Available"
@@ -1160,7 +1192,8 @@ with tab2:
             if batch_download_type == "Audio Only":
                 batch_audio_format = st.selectbox(
                     "Audio Format",
-                    ["mp3", "aac", "m4a", "opus", "flac"]
+                    AUDIO_FORMATS,
+                    help="Sources already in this codec are preferred and copied without re-encoding"
                 )
             else:
                 batch_audio_format = "mp3"
@@ -1169,11 +1202,36 @@ with tab2:
             with batch_col1:
                 batch_subs = st.checkbox("📝 Download Subtitles")
                 batch_thumbnail = st.checkbox("🖼️ Download Thumbnails")
+                batch_embed = st.checkbox(
+                    "Embed in File",
+                    disabled=not deps.get('ffmpeg', False) or not (batch_subs or batch_thumbnail),
+                    help="Embed the subtitles and thumbnails in the media files, in the same FFmpeg pass as metadata"
+                )
                 batch_metadata = st.checkbox("Add Metadata", disabled=not deps.get('ffmpeg', False))
+                batch_expand_playlists = st.checkbox(
+                    "Expand Playlists",
+                    help="Replace playlist URLs with their videos and skip videos already in the list"
+                )
+                batch_fast_formats = st.checkbox(
+                    "Fast Mode",
+                    disabled=batch_download_type != "Video + Audio",
+                    help="Download a single file instead of merging video and audio when one exists at the same quality"
+                )
+                batch_parallel_transcode = st.checkbox(
+                    "Parallel Transcode",
+                    disabled=batch_download_type != "Audio Only" or not deps.get('ffmpeg', False),
+                    help="Split long (20+ min) flac transcodes into segments encoded on all CPU cores"
+                )
             with batch_col2:
                 batch_max_size = st.selectbox(
                     "📏 Max File Size (per file)",
-                    ["No Limit", "100MB", "500MB", "1GB", "2GB"]
+                    MAX_FILE_SIZES
+                )
+                batch_renditions = st.multiselect(
+                    "Extra Renditions",
+                    rendition_choices(batch_download_type, batch_audio_format),
+                    disabled=not deps.get('ffmpeg', False),
+                    help="Also produce these from each download and a single FFmpeg decode"
                 )
                 batch_timeout = st.slider(
                     "Timeout per URL (minutes)",
@@ -1184,41 +1242,138 @@ with tab2:
                     min_value=1, max_value=10, value=3,
                     help="Number of simultaneous downloads"
                 )
-    if urls_list and not st.session_state.get("batch_download_trigger", False):
+                batch_auto_parallel = st.checkbox(
+                    "Auto-tune Parallelism",
+                    help="Start at the slider value and add or remove downloads while the batch runs, "
+                         "based on throughput, CPU, memory and errors"
+                )
+                batch_schedule = st.selectbox(
+                    "Download Order",
+                    BATCH_SCHEDULES,
+                    help="Any order but In Order first fetches every URL's metadata in parallel, "
+                         "failing unavailable URLs right away and sizing the rest"
+                )
+                batch_run_on = st.selectbox(
+                    "Run On",
+                    ["This Server", "Worker Queue"],
+                    help="Worker Queue hands the batch to `python cli.py worker` processes on any node"
+                )
+        with st.expander("✂️ Clip & Chapters"):
+            batch_clip_start = st.text_input(
+                "Start Time",
+                placeholder="e.g. 1:30",
+                key="batch_clip_start",
+                help="Only the fragments covering the selected range or chapters are downloaded"
+            )
+            batch_clip_end = st.text_input("End Time", placeholder="e.g. 2:45", key="batch_clip_end")
+            batch_chapter_pattern = st.text_input(
+                "Chapter Titles",
+                placeholder="e.g. intro|highlights",
+                help="Download only chapters whose titles match this regular expression"
+            )
+            batch_split_chapters = st.checkbox(
+                "Split by Chapters",
+                key="batch_split_chapters",
+                disabled=not deps.get('ffmpeg', False),
+                help="Also save each chapter as its own file"
+            )
+            batch_chapters = [batch_chapter_pattern] if batch_chapter_pattern.strip() else []
+            try:
+                section_options("", batch_clip_start, batch_clip_end, batch_chapters)
+                batch_clip_error = None
+            except ValueError as e:
+                batch_clip_error = str(e)
+                st.error(batch_clip_error)
+    if batch_ready and not st.session_state.get("batch_download_trigger", False):
         st.markdown("---")
-        estimated_time = len(urls_list) * 2 / (st.session_state.get('batch_parallel', 3) or 3)
-        st.info(f"Estimated time: ~{int(estimated_time)} minutes for {len(urls_list)} URL(s)")
-        if len(urls_list) > 10:
-            st.warning("Large batch detected! Consider reducing parallel downloads if issues occur.")
+        advanced_error = (st.session_state.get('advanced_settings') or {}).get('error')
+        if advanced_error:
+            st.error(f"Advanced Settings: {advanced_error}")
+        if urls_list:
+            estimated_time = estimate_batch_seconds(
+                urls_list, batch_parallel,
+                transcode_codec({'download_type': batch_download_type, 'audio_format': batch_audio_format})
+            )
+            st.info(f"Estimated time: ~{format_seconds(estimated_time)} for {len(urls_list)} URL(s) "
+                    f"with {batch_parallel} parallel downloads")
+        if (len(urls_list) > 10 or batch_upload is not None) and not batch_auto_parallel:
+            st.warning("Large batch detected! Consider reducing parallel downloads, or enable Auto-tune Parallelism.")
         start_col1, start_col2, start_col3 = st.columns([1, 2, 1])
         with start_col2:
-            if st.button("Start Batch Download", type="primary", use_container_width=True):
+            if st.button("Start Batch Download", type="primary", use_container_width=True,
+                         disabled=bool(batch_clip_error or advanced_error)):
                 if not deps.get('yt-dlp', False):
                     st.error("yt-dlp is required but not installed!")
                 else:
-                    st.session_state.batch_download_trigger = True
-                    st.session_state.batch_urls_list = urls_list
                     st.session_state.batch_temp_dir = tempfile.mkdtemp(prefix="ytdlp_batch_")
-                    st.session_state.batch_settings = {
+                    batch_input_path = None
+                    if batch_upload is not None:
+                        # Spool the upload to disk so the batch can parse it lazily
+                        ext = os.path.splitext(batch_upload.name)[1].lower() or ".txt"
+                        batch_input_path = os.path.join(st.session_state.batch_temp_dir, f"input{ext}")
+                        with open(batch_input_path, "wb") as f:
+                            shutil.copyfileobj(batch_upload, f)
+                    batch_options = {
                         'download_type': batch_download_type,
                         'quality': batch_quality,
                         'audio_format': batch_audio_format,
                         'subs': batch_subs,
                         'thumbnail': batch_thumbnail,
                         'metadata': batch_metadata,
+                        'embed': batch_embed and deps.get('ffmpeg', False),
+                        'renditions': batch_renditions,
+                        'parallel_transcode': batch_parallel_transcode,
+                        'start_time': batch_clip_start,
+                        'end_time': batch_clip_end,
+                        'chapters': batch_chapters,
+                        'split_chapters': batch_split_chapters,
                         'max_size': batch_max_size,
                         'timeout': batch_timeout * 60,
-                        'parallel': batch_parallel
+                        'parallel': batch_parallel,
+                        'auto_parallel': batch_auto_parallel,
+                        'schedule': batch_schedule,
+                        'expand_playlists': batch_expand_playlists,
+                        'fast_formats': batch_fast_formats,
+                        **advanced_download_options(),
                     }
+                    if batch_run_on == "Worker Queue":
+                        with st.spinner("Adding URLs to the worker queue..."):
+                            queue_conn = open_queue()
+                            queue_stats = new_canonicalize_stats()
+                            queue_source = iter_batch_file(batch_input_path) if batch_input_path else urls_list
+                            st.session_state.queue_batch_id = enqueue_urls(
+                                queue_conn, queue_source, batch_options, stats=queue_stats
+                            )
+                            queue_conn.close()
+                        st.session_state.queue_batch_stats = queue_stats
+                    else:
+                        st.session_state.batch_download_trigger = True
+                        st.session_state.batch_urls_list = urls_list
+                        st.session_state.batch_settings = dict(batch_options, input_path=batch_input_path)
                     st.rerun()
     if st.session_state.get("batch_download_trigger", False):
         urls_to_process = st.session_state.get("batch_urls_list", [])
         batch_temp_dir = st.session_state.get("batch_temp_dir")
         batch_settings = st.session_state.get("batch_settings", {})
-        total_urls = len(urls_to_process)
+        batch_input_path = batch_settings.get('input_path')
+        if batch_input_path:
+            batch_source = iter_batch_file(batch_input_path)
+            total_urls = count_batch_file_urls(batch_input_path)
+        else:
+            batch_source = iter(urls_to_process)
+            total_urls = len(urls_to_process)
+        batch_state = open_batch_state(batch_temp_dir)
+        batch_stats = new_canonicalize_stats()
+        batch_jobs = iter_batch_jobs(
+            batch_state, batch_source,
+            expand_playlists=batch_settings.get('expand_playlists', False),
+            stats=batch_stats
+        )
+        show_each_result = total_urls <= BATCH_VERBOSE_LIMIT
         st.markdown("---")
         st.markdown("## Batch Download in Progress")
-        st.markdown(f"Processing {total_urls} URL(s) with {batch_settings.get('parallel', 3)} parallel downloads...")
+        auto_note = ", auto-tuned" if batch_settings.get('auto_parallel') else ""
+        st.markdown(f"Processing {total_urls} URL(s) with {batch_settings.get('parallel', 3)} parallel downloads{auto_note}...")
 
         # Progress tracking
         progress_container = st.container()
@@ -1227,124 +1382,67 @@ with tab2:
             current_status = st.empty()
             results_container = st.container()
 
-        # Function to download a single URL using yt-dlp Python API
-        def download_single_url(url, temp_dir, settings, task_id):
-            # Create unique subdirectory for each task
-            task_temp_dir = os.path.join(temp_dir, f"task_{task_id}")
-            os.makedirs(task_temp_dir, exist_ok=True)
-
-            # Build yt-dlp options
-            ydl_opts = {
-                'outtmpl': os.path.join(task_temp_dir, '%(title).100s-%(id)s.%(ext)s'),
-                'restrictfilenames': True,
-                'quiet': True,
-                'no_warnings': True,
-            }
-
-            download_type = settings.get('download_type', 'Video + Audio')
-            quality = settings.get('quality', 'Best Available')
-            audio_format = settings.get('audio_format', 'mp3')
+        # Process URLs in parallel, keeping only a bounded window of futures
+        batch_counts = {'processed': 0, 'success': 0, 'failed': 0, 'shown_failures': 0}
+        batch_eta = batch_estimate(total_urls, batch_settings)
+        batch_controller = batch_parallelism_controller(batch_settings)
+        eta_status = st.empty()
+
+        def show_batch_eta():
+            etas = sorted(batch_eta.etas().values())[:batch_eta.parallel]
+            next_done = ", ".join(f"~{format_seconds(eta)}" for eta in etas)
+            workers = ""
+            if batch_controller is not None:
+                workers = f" · {batch_controller.target} parallel downloads ({batch_controller.reason})"
+            eta_status.caption(
+                f"About {format_seconds(batch_eta.remaining_seconds())} left"
+                + (f" · next to finish in {next_done}" if next_done else "")
+                + workers
+            )
 
-            if download_type == "Audio Only":
-                ydl_opts['format'] = 'bestaudio/best'
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': audio_format,
-                }]
-            elif download_type == "Video Only":
-                ydl_opts['format'] = 'bestvideo'
+        def show_batch_result(position, result):
+            batch_counts['processed'] += 1
+            idx = batch_counts['processed']
+            # Expanded playlists and skipped URLs change the total as the batch streams
+            expected_total = max(total_urls + batch_stats['expanded_videos'] - batch_stats['playlists_expanded'], 1)
+            accounted = idx + batch_stats['merged'] + batch_stats.get('rejected', 0)
+            batch_eta.total = expected_total - batch_stats['merged'] - batch_stats.get('rejected', 0)
+            overall_progress.progress(min(accounted / expected_total, 1.0))
+            current_status.info(f"Processed {idx}/{expected_total}: {result['url'][:60]}...")
+            if result['status'] == "success":
+                batch_counts['success'] += 1
+                st.session_state.download_count += 1
+                st.session_state.total_downloaded_size += sum(size for _, _, size in result.get('files', []))
             else:
-                if quality != "Best Available":
-                    quality_map = {
-                        "1080p": "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
-                        "720p": "bestvideo[height<=720]+bestaudio/best[height<=720]",
-                        "480p": "bestvideo[height<=480]+bestaudio/best[height<=480]",
-                        "360p": "bestvideo[height<=360]+bestaudio/best[height<=360]"
-                    }
-                    ydl_opts['format'] = quality_map.get(quality, 'best')
-                else:
-                    ydl_opts['format'] = 'bestvideo+bestaudio/best'
-
-            if settings.get('subs', False):
-                ydl_opts['writesubtitles'] = True
-                ydl_opts['subtitleslangs'] = ['en']
-
-            if settings.get('thumbnail', False):
-                ydl_opts['writethumbnail'] = True
-
-            if settings.get('metadata', False) and check_ffmpeg_availability():
-                ydl_opts['postprocessors'] = ydl_opts.get('postprocessors', [])
-                ydl_opts['postprocessors'].append({'key': 'FFmpegMetadata'})
-
-            max_size = settings.get('max_size', 'No Limit')
-            if max_size != "No Limit":
-                size_map = {"100MB": 100*1024*1024, "500MB": 500*1024*1024,
-                            "1GB": 1000*1024*1024, "2GB": 2000*1024*1024}
-                ydl_opts['max_filesize'] = size_map.get(max_size)
-
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    title = info.get('title', 'Unknown') if info else 'Unknown'
-                    if len(title) > 50:
-                        title = title[:47] + "..."
-
-                # Collect downloaded files
-                files = []
-                for root, _, filenames in os.walk(task_temp_dir):
-                    for filename in filenames:
-                        file_path = os.path.join(root, filename)
-                        files.append((filename, file_path, os.path.getsize(file_path)))
-
-                return {"url": url, "title": title, "status": "success", "files": files}
-
-            except Exception as e:
-                error_type, error_solution = categorize_error(str(e))
-                return {"url": url, "title": "Failed", "status": "error", "error": f"{error_type}: {error_solution}"}
-
-        # Process URLs in parallel
-        success_count = 0
-        fail_count = 0
-        skip_count = 0
-        all_downloaded_files = []
-        results = []
-
-        with ThreadPoolExecutor(max_workers=batch_settings.get('parallel', 3)) as executor:
-            future_to_url = {
-                executor.submit(download_single_url, url, batch_temp_dir, batch_settings, idx): url
-                for idx, url in enumerate(urls_to_process) if validate_url(url)[0]
-            }
-            for idx, future in enumerate(as_completed(future_to_url), 1):
-                result = future.result()
-                results.append(result)
-                current_progress = idx / total_urls
-                overall_progress.progress(current_progress)
-                current_status.info(f"Processed {idx}/{total_urls}: {result['url'][:60]}...")
-                with results_container:
-                    if result['status'] == "success":
+                batch_counts['failed'] += 1
+            with results_container:
+                if result['status'] == "success":
+                    if show_each_result:
                         st.success(f"[{idx}/{total_urls}] {result['title']}")
-                        success_count += 1
-                        all_downloaded_files.extend(result.get('files', []))
-                        st.session_state.download_history.insert(0, {
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "url": result['url'][:50] + "..." if len(result['url']) > 50 else result['url'],
-                            "title": result['title'],
-                            "files": len(result.get('files', [])),
-                            "status": "Success"
-                        })
-                    elif result['status'] == "timeout":
+                elif result['status'] == "timeout":
+                    if batch_counts['shown_failures'] < BATCH_VERBOSE_LIMIT:
                         st.error(f"[{idx}/{total_urls}] Timeout - took longer than {batch_settings.get('timeout', 900)//60} minutes")
-                        fail_count += 1
-                    else:
+                        batch_counts['shown_failures'] += 1
+                else:
+                    if batch_counts['shown_failures'] < BATCH_VERBOSE_LIMIT:
                         st.error(f"[{idx}/{total_urls}] {result['title']}: {result.get('error', 'Unknown error')}")
-                        fail_count += 1
-                        st.session_state.download_history.insert(0, {
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "url": result['url'][:50] + "..." if len(result['url']) > 50 else result['url'],
-                            "title": "Failed",
-                            "files": 0,
-                            "status": "Failed"
-                        })
+                        batch_counts['shown_failures'] += 1
+
+        try:
+            with quotas.admit(st.session_state.session_id, batch_temp_dir):
+                run_batch(batch_jobs, batch_temp_dir, batch_settings, state=batch_state,
+                          on_result=show_batch_result, estimate=batch_eta, on_tick=show_batch_eta,
+                          controller=batch_controller, session=st.session_state.session_id,
+                          account=st.session_state.session_id)
+        except QuotaExceeded as e:
+            st.error(f"Batch not started - quota exceeded: {e}")
+        eta_status.empty()
+        idx = batch_counts['processed']
+        success_count = batch_counts['success']
+        fail_count = batch_counts['failed']
+        shown_failures = batch_counts['shown_failures']
+        skip_count = batch_stats['merged'] + batch_stats.get('rejected', 0)
+        batch_files, batch_file_count = largest_batch_files(batch_state)
 
         # Final results
         overall_progress.progress(1.0)
@@ -1352,22 +1450,44 @@ with tab2:
             current_status.success(f"Batch Complete! {success_count} succeeded, {fail_count} failed, {skip_count} skipped")
         else:
             current_status.error(f"Batch Complete. No downloads succeeded. {fail_count} failed, {skip_count} skipped")
+        if batch_stats['playlists_expanded']:
+            st.info(
+                f"Expanded {batch_stats['playlists_expanded']} playlist(s) into "
+                f"{batch_stats['expanded_videos']} video(s); merged {batch_stats['merged']} duplicate(s)"
+            )
+        for failed_url, error in batch_stats['expand_errors'][:BATCH_VERBOSE_LIMIT]:
+            error_type, _ = categorize_error(error)
+            st.warning(f"Could not expand {failed_url[:60]}: {error_type}. Downloaded it as-is.")
+        if not show_each_result and fail_count > shown_failures:
+            st.caption(f"{fail_count - shown_failures} more failure(s) are listed in the batch report.")
+        st.download_button(
+            "Download Batch Report (CSV)",
+            data=export_batch_report(batch_state),
+            file_name="batch_report.csv",
+            mime="text/csv",
+            key="batch_report_download"
+        )
 
-        # Show downloadable files
-        if all_downloaded_files:
+        # Show downloadable files, largest first, without loading every row into memory
+        batch_state.close()
+        if batch_files:
             st.markdown("### Download Your Files")
-            st.markdown(f"**{len(all_downloaded_files)} file(s) ready for download:**")
+            st.markdown(f"**{batch_file_count} file(s) ready for download:**")
+            if batch_file_count > len(batch_files):
+                st.caption(
+                    f"Showing the {len(batch_files)} largest files. "
+                    f"All files are saved in `{batch_temp_dir}`."
+                )
 
             # Warn about large files
-            large_files_count = sum(1 for f in all_downloaded_files if f[2] > MAX_SAFE_FILE_SIZE_BYTES)
+            large_files_count = sum(1 for f in batch_files if f[2] > MAX_SAFE_FILE_SIZE_BYTES)
             if large_files_count > 0:
                 st.warning(
                     f"{large_files_count} file(s) exceed {MAX_SAFE_FILE_SIZE_MB}MB. "
                     f"Large files cannot be downloaded via browser due to memory constraints."
                 )
 
-            all_downloaded_files.sort(key=lambda x: x[2], reverse=True)
-            for idx, (filename, file_path, file_size) in enumerate(all_downloaded_files, 1):
+            for idx, (filename, file_path, file_size) in enumerate(batch_files, 1):
                 col1, col2 = st.columns([4, 1])
                 with col1:
                     # Use safe file serving with size checks
@@ -1395,6 +1515,56 @@ with tab2:
                     st.error("Failed to clean up some files.")
         st.session_state.batch_download_trigger = False
         st.session_state.batch_urls_list = []
+    if st.session_state.get("queue_batch_id"):
+        queue_batch_id = st.session_state.queue_batch_id
+        st.markdown("---")
+        st.markdown("## Queued Batch")
+        queue_stats = st.session_state.get("queue_batch_stats", {})
+        if queue_stats.get('merged') or queue_stats.get('rejected'):
+            st.caption(
+                f"Merged {queue_stats.get('merged', 0)} duplicate(s), "
+                f"rejected {queue_stats.get('rejected', 0)} unsupported URL(s)"
+            )
+        queue_conn = open_queue()
+        queue_counts = batch_progress(queue_conn, queue_batch_id)
+        finished = queue_counts['done'] + queue_counts['failed']
+        st.progress(finished / queue_counts['total'] if queue_counts['total'] else 1.0)
+        queue_col1, queue_col2, queue_col3, queue_col4 = st.columns(4)
+        queue_col1.metric("Queued", queue_counts['queued'])
+        queue_col2.metric("Running", queue_counts['leased'])
+        queue_col3.metric("Done", queue_counts['done'])
+        queue_col4.metric("Failed", queue_counts['failed'])
+        st.caption(f"Batch ID: `{queue_batch_id}` · start workers with `python cli.py worker`")
+        queue_shown = 0
+        for queue_result in iter_batch_results(queue_conn, queue_batch_id):
+            if queue_shown >= BATCH_VERBOSE_LIMIT:
+                st.caption(f"Showing the first {BATCH_VERBOSE_LIMIT} results. Use `python cli.py queue-status {queue_batch_id}` for all.")
+                break
+            queue_shown += 1
+            if queue_result['queue_status'] == "failed":
+                st.error(f"{queue_result['url'][:60]}: {queue_result.get('error', 'Unknown error')}")
+                continue
+            if queue_result['queue_status'] != "done":
+                continue
+            for filename, file_path, file_size in queue_result.get('files', []):
+                if os.path.exists(file_path):
+                    serve_file_safely(
+                        file_path=file_path,
+                        filename=filename,
+                        file_size=file_size,
+                        button_key=f"queue_download_{hash(file_path)}"
+                    )
+                else:
+                    st.text(f"{filename} - on {queue_result.get('node', 'worker')}: {file_path}")
+        queue_conn.close()
+        refresh_col, forget_col = st.columns(2)
+        with refresh_col:
+            if st.button("Refresh Queue Status", use_container_width=True):
+                st.rerun()
+        with forget_col:
+            if st.button("Hide Queued Batch", use_container_width=True):
+                st.session_state.queue_batch_id = None
+                st.rerun()
     st.markdown("---")
     st.markdown("## 🔧 Advanced Settings")
     with st.expander("Network & Custom Settings"):
@@ -1403,10 +1573,21 @@ with tab2:
             st.markdown("**Network Options**")
             use_proxy = st.checkbox("Use Proxy")
             if use_proxy:
-                proxy_url = st.text_input("Proxy URL:", placeholder="http://proxy:port")
+                proxy_text = st.text_area(
+                    "Proxy URL(s), one per line:",
+                    placeholder="http://proxy1:port\nsocks5://proxy2:port",
+                    help="With several proxies, each download gets the fastest healthy one "
+                         "and moves to another on proxy errors"
+                )
             else:
-                proxy_url = ""
-            rate_limit = st.slider("Rate Limit (KB/s)", 0, 10000, 0, step=100)
+                proxy_text = ""
+            proxies = [line.strip() for line in proxy_text.splitlines() if line.strip()]
+            rate_limit = st.slider("Rate Limit (KB/s)", 0, 10000, 0, step=100,
+                                   help="Per download; 0 = no limit beyond the server-wide cap")
+            bandwidth = bandwidth_stats()
+            if bandwidth['cap']:
+                st.caption(f"Server-wide cap: {bandwidth['cap'] // 1024} KB/s shared by "
+                           f"{bandwidth['transfers']} active transfer(s)")
         with adv_col2:
             st.markdown("**🎛️ Custom Format**")
             custom_format = st.text_input(
@@ -1415,16 +1596,45 @@ with tab2:
             )
             filename_template = st.text_input(
                 "Filename Template:",
-                value="%(title)s.%(ext)s"
+                value=OUTPUT_TEMPLATE
             )
+            keep_in_library = False
+            if library.enabled():
+                keep_in_library = st.checkbox(
+                    "Keep in Library", value=True,
+                    help=f"Move finished files into the persistent library at {library.LIBRARY_DIR} "
+                         "instead of deleting them after download"
+                )
+        try:
+            for proxy in proxies:
+                network_options(proxy)
+            network_options(custom_format=custom_format.strip())
+            section_options("", filename_template=filename_template.strip())
+            advanced_error = None
+        except ValueError as e:
+            advanced_error = str(e)
+            st.error(advanced_error)
         if custom_format or use_proxy or rate_limit > 0:
-            st.info("💡 These settings apply to single downloads.")
+            st.info("💡 These settings apply to single and batch downloads.")
+        proxy_health = proxy_pool.stats()
+        if proxy_health:
+            st.markdown("**Proxy Pool**")
+            st.dataframe([{
+                'Proxy': entry['proxy'],
+                'Latency (ms)': round(entry['latency'] * 1000) if entry['latency'] else None,
+                'Throughput (KB/s)': round(entry['throughput'] / 1024) if entry['throughput'] else None,
+                'Error Rate': f"{entry['error_rate']:.0%}",
+                'Active Jobs': entry['active'],
+                'Status': "Evicted" if entry['evicted'] else "Healthy",
+            } for entry in proxy_health], use_container_width=True)
     st.session_state.advanced_settings = {
-        'custom_format': custom_format,
-        'filename_template': filename_template,
+        'custom_format': custom_format.strip(),
+        'filename_template': filename_template.strip(),
         'use_proxy': use_proxy,
-        'proxy_url': proxy_url,
-        'rate_limit': rate_limit
+        'proxies': proxies,
+        'rate_limit': rate_limit,
+        'library': keep_in_library,
+        'error': advanced_error,
     }
 
 with tab3:
@@ -1469,33 +1679,121 @@ with tab3:
         st.info("Download in progress...")
     else:
         st.info("No active downloads")
+    slots = download_scheduler.stats()
+    running_total = sum(slots['running'].values())
+    waiting_total = sum(slots['waiting'].values())
+    st.caption(
+        f"Server-wide: {running_total} of {slots['max_downloads']} download slots in use by "
+        f"{len(slots['running'])} session(s), {waiting_total} waiting"
+        + (f" (longest {slots['longest_wait']:.0f}s)" if waiting_total else "")
+        + f"; this session runs {slots['running'].get(st.session_state.session_id, 0)}"
+    )
 
 with tab4:
     st.markdown("### 📚 Download History")
-    if st.session_state.download_history:
-        for i, entry in enumerate(st.session_state.download_history[:10]):
+    hist_col1, hist_col2, hist_col3 = st.columns([3, 1, 1])
+    with hist_col1:
+        history_query = st.text_input("Search History", placeholder="Start of a title or URL, or a video ID", key="history_query")
+    with hist_col2:
+        history_status = st.selectbox("Status", ["All", "Success", "Failed"], key="history_status")
+    with hist_col3:
+        history_mine = st.checkbox("This session only", key="history_mine")
+    history_filter = (history_query, history_status, history_mine)
+    if st.session_state.get('history_filter') != history_filter:
+        st.session_state.history_filter = history_filter
+        st.session_state.history_page = 0
+    history_session = st.session_state.session_id if history_mine else None
+    entries, history_total = history.search(
+        history_query.strip() or None,
+        {"Success": "success", "Failed": "error"}.get(history_status),
+        history_session,
+        offset=st.session_state.history_page * history.PAGE_SIZE,
+    )
+    if entries:
+        for i, entry in enumerate(entries):
             with st.container():
                 col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
                 with col1:
-                    st.write(f"**{entry['title']}**")
+                    st.write(f"**{entry['title'] or entry['media_id'] or 'Unknown'}**")
                     st.caption(entry['url'])
                 with col2:
-                    st.write(entry['timestamp'])
+                    st.write(datetime.fromtimestamp(entry['started_at']).strftime("%Y-%m-%d %H:%M:%S"))
+                    st.caption(
+                        f"{entry['extractor'] or 'Unknown'} · {entry['source'] or 'download'} · "
+                        f"{entry['finished_at'] - entry['started_at']:.0f}s"
+                    )
                 with col3:
                     st.write(f"{entry['files']} files")
+                    if entry['bytes']:
+                        st.caption(f"{entry['bytes'] / 1024 / 1024:.1f} MB")
                 with col4:
-                    if entry['status'] == 'Success':
+                    if entry['status'] == 'success':
                         st.markdown('<p class="centered-success">Success</p>', unsafe_allow_html=True)
                     else:
                         st.markdown('<p class="centered-error">Failed</p>', unsafe_allow_html=True)
-                if i < len(st.session_state.download_history) - 1:
+                        st.caption(entry['error_category'] or "Unknown error")
+                if i < len(entries) - 1:
                     st.divider()
-        if st.button("🗑️ Clear History"):
-            st.session_state.download_history = []
+        page_count = (history_total - 1) // history.PAGE_SIZE + 1
+        page_col1, page_col2, page_col3 = st.columns([1, 2, 1])
+        with page_col1:
+            if st.button("Newer", disabled=st.session_state.history_page == 0, use_container_width=True):
+                st.session_state.history_page -= 1
+                st.rerun()
+        with page_col2:
+            st.caption(f"Page {st.session_state.history_page + 1} of {page_count} · {history_total} download(s)")
+        with page_col3:
+            if st.button("Older", disabled=st.session_state.history_page >= page_count - 1,
+                         use_container_width=True):
+                st.session_state.history_page += 1
+                st.rerun()
+        if st.button("🗑️ Clear This Session's History"):
+            history.clear(st.session_state.session_id)
+            st.session_state.history_page = 0
             st.success("History cleared!")
             st.rerun()
     else:
-        st.info("📝 No download history yet.")
+        st.info("📝 No download history yet." if not any(history_filter) else "No downloads match.")
+
+    st.markdown("---")
+    st.markdown("#### Statistics")
+    stats_period = st.selectbox("Period", ["Last 24 Hours", "Last 7 Days", "Last 30 Days", "All Time"],
+                                index=1, key="history_stats_period")
+    period_days = {"Last 24 Hours": 1, "Last 7 Days": 7, "Last 30 Days": 30}.get(stats_period)
+    history_stats = history.stats(
+        since=time.time() - period_days * 86400 if period_days else None, session=history_session
+    )
+    if history_stats['downloads']:
+        stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
+        stat_col1.metric("Downloads", history_stats['downloads'])
+        stat_col2.metric("Failure Rate", f"{history_stats['failures'] / history_stats['downloads']:.0%}")
+        stat_col3.metric("Downloaded", f"{history_stats['bytes'] / 1024 ** 3:.2f} GB")
+        stat_col4.metric(
+            "Avg Throughput",
+            f"{history_stats['throughput'] / 1024 / 1024:.2f} MB/s" if history_stats['throughput'] else "-"
+        )
+        if len(history_stats['days']) > 1:
+            st.caption("Downloads per day")
+            st.bar_chart([{"Day": day['day'], "Downloads": day['downloads']} for day in history_stats['days']],
+                         x="Day", y="Downloads")
+        breakdown_col1, breakdown_col2 = st.columns(2)
+        with breakdown_col1:
+            st.markdown("**Failures by Category**")
+            if history_stats['failure_categories']:
+                st.table([{"Category": category, "Failures": count}
+                          for category, count in history_stats['failure_categories']])
+            else:
+                st.caption("No failures")
+        with breakdown_col2:
+            st.markdown("**Top Extractors**")
+            st.table([
+                {"Extractor": row['extractor'], "Downloads": row['downloads'],
+                 "Success": f"{row['successes'] / row['downloads']:.0%}",
+                 "GB": f"{row['bytes'] / 1024 ** 3:.2f}"}
+                for row in history_stats['extractors']
+            ])
+    else:
+        st.caption("No downloads in this period.")
 
 with tab5:
     st.markdown("### 🔧 System Information")
@@ -1566,8 +1864,9 @@ with st.sidebar:
         st.success("Preset: 720p Video")
     st.markdown("---")
     st.markdown("#### 🕒 Recent URLs")
-    if st.session_state.download_history:
-        recent_urls = list(set([entry['url'] for entry in st.session_state.download_history[:5]]))
+    recent_entries, _ = history.search(session=st.session_state.session_id, limit=5)
+    if recent_entries:
+        recent_urls = list(dict.fromkeys(entry['url'] for entry in recent_entries))
         for i, recent_url in enumerate(recent_urls[:3]):
             if st.button(f"🔗 {recent_url[:20]}...", use_container_width=True, key=f"recent_url_btn_{i}_{recent_url}"):
                 st.session_state.quick_url = recent_url
@@ -1584,14 +1883,26 @@ with st.sidebar:
     - Facebook, Vimeo
     - And 1000+ more!
     """)
-    if st.button("View All Platforms", use_container_width=True):
-        try:
-            result = subprocess.run(['yt-dlp', '--list-extractors'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                extractors = result.stdout.split('\n')[:50]
-                st.info(f"Supports {len(extractors)}+ platforms")
-        except:
-            st.info("Run `yt-dlp --list-extractors` to see all platforms")
+    platform_query = st.text_input(
+        "Search Platforms",
+        placeholder="e.g. vimeo, soundcloud.com",
+        key="platform_search"
+    )
+    if platform_query:
+        matches, match_count = search_extractors(platform_query, limit=25)
+        st.caption(f"{match_count} of {len(build_extractor_index()['extractors'])} extractors match")
+        for extractor in matches:
+            domains = ", ".join(extractor['domains'][:3])
+            label = f"**{extractor['name']}**"
+            if domains:
+                label += f" · {domains}"
+            if not extractor['working']:
+                label += " · _broken_"
+            st.markdown(label)
+        if match_count > len(matches):
+            st.caption(f"... and {match_count - len(matches)} more")
+    else:
+        st.info(f"Supports {len(build_extractor_index()['extractors'])} extractors")
 
 
 st.markdown("---")
@@ -1636,6 +1947,7 @@ def init_session_state():
         st.session_state.app_initialized = True
         st.session_state.download_count = 0
         st.session_state.total_downloaded_size = 0
+        st.session_state.start_time = time.time()
     
     # Simple mobile detection based on screen width
     # This is a basic approach - in a real app you'd use proper user agent detection
@@ -1647,6 +1959,9 @@ init_session_state()
 # Mobile detection toggle for testing (hidden in production)
 with st.expander("🔧 Developer Options", expanded=False):
     st.session_state.is_mobile = st.checkbox("Force Mobile Layout", value=st.session_state.get('is_mobile', False))
+    st.session_state.show_performance = st.checkbox(
+        "Show Performance Stats", value=st.session_state.get('show_performance', False)
+    )
 
 if st.session_state.get('show_performance', False):
     with st.expander("📊 Performance Stats"):
@@ -1659,6 +1974,31 @@ if st.session_state.get('show_performance', False):
         with perf_col3:
             uptime = time.time() - st.session_state.get('start_time', time.time())
             st.metric("Session Time", f"{int(uptime//60)}m {int(uptime%60)}s")
+        usage = quotas.usage(st.session_state.session_id)
+        st.caption("Session quotas")
+        quota_col1, quota_col2, quota_col3 = st.columns(3)
+        with quota_col1:
+            st.metric("Running Jobs", f"{usage['jobs']} / {usage['max_jobs'] or '∞'}")
+        with quota_col2:
+            window_limit = f"{usage['bytes_per_window'] / 1024 ** 3:.0f} GB" if usage['bytes_per_window'] else "∞"
+            st.metric(f"Downloaded (last {usage['window_seconds'] // 60} min)",
+                      f"{usage['window_bytes'] / 1024 ** 3:.2f} GB / {window_limit}")
+        with quota_col3:
+            disk_limit = f"{usage['disk_limit'] / 1024 ** 3:.0f} GB" if usage['disk_limit'] else "∞"
+            st.metric("Disk Used", f"{usage['disk_bytes'] / 1024 ** 3:.2f} GB / {disk_limit}")
+        measured = throughput_stats()
+        if measured['hosts']:
+            st.caption("Measured throughput (used for time estimates)")
+            st.dataframe([{
+                "Host": h['host'] or "(unknown)",
+                "Jobs": h['jobs'],
+                "Throughput": f"{h['throughput'] / 1024 / 1024:.1f} MB/s",
+                "Typical Size": f"{h['job_bytes'] / 1024 / 1024:.1f} MB",
+                "Setup": f"{h['overhead']:.1f}s" if h['overhead'] is not None else "-",
+            } for h in measured['hosts']], hide_index=True)
+        if measured['codecs']:
+            st.caption("Post-processing speed: " + ", ".join(
+                f"{codec} {speed:.0f}x realtime" for codec, speed in measured['codecs'].items()))
 
 with st.expander("⌨️ Keyboard Shortcuts"):
     st.markdown("""
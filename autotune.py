@@ -0,0 +1,144 @@
+"""
+Autotuning of batch download parallelism.
+
+A ParallelismController hill-climbs the number of concurrent downloads in
+one batch. Every MEASURE_SECONDS it compares the batch's aggregate
+throughput with the previous step: it adds a worker while that still pays
+off (SCALE_UP_GAIN more bytes/s), and steps back and holds for a while
+once the last worker added nothing. CPU saturation (FFmpeg
+post-processing), memory pressure and a burst of network or rate-limit
+errors each take a worker away whatever the throughput.
+
+psutil is optional; without it only throughput and errors are used.
+"""
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Length of one measurement step
+MEASURE_SECONDS = 10.0
+# Throughput gain an extra worker must bring to be kept
+SCALE_UP_GAIN = 1.10
+# Steps to hold after backing off before probing upward again
+HOLD_STEPS = 6
+# System-wide CPU and memory use (percent) at which a worker is taken away
+CPU_HIGH = 90.0
+MEMORY_HIGH = 85.0
+# Share of results in a step failing with a load-related error that takes a worker away
+ERROR_RATE_HIGH = 0.25
+MIN_RESULTS_FOR_ERROR_RATE = 4
+# Error categories (see engine.categorize_error) that more concurrency can cause
+LOAD_ERRORS = ("Network Error", "Rate Limit Error", "Proxy Error", "SSL Error")
+
+
+class ParallelismController:
+    """
+    Target number of concurrent downloads for one batch.
+
+    Feed it with hook() progress hooks and record_result(); call update()
+    regularly (run_batch does every tick) and run `target` downloads.
+    """
+
+    def __init__(self, start, maximum, minimum=1):
+        self._lock = threading.Lock()
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = max(minimum, min(start, maximum))
+        self.reason = "starting"
+        self.rate = None
+        self._bytes = 0
+        self._results = 0
+        self._load_errors = 0
+        self._step_started = time.time()
+        self._last_rate = None
+        self._probing = False
+        self._hold = 0
+        if psutil is not None:
+            # Primes the counter so the first step's reading covers the step
+            psutil.cpu_percent(interval=None)
+
+    def hook(self):
+        """Progress hook for one job, adding its received bytes to the step's total."""
+        received = {}
+
+        def update(d):
+            if d['status'] not in ('downloading', 'finished'):
+                return
+            filename = d.get('filename')
+            downloaded = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            with self._lock:
+                delta = downloaded - received.get(filename, 0)
+                received[filename] = downloaded
+                if delta > 0:
+                    self._bytes += delta
+        update.thread_safe = True
+        return update
+
+    def record_result(self, result):
+        with self._lock:
+            self._results += 1
+            if result['status'] != "success" and str(result.get('error', '')).startswith(LOAD_ERRORS):
+                self._load_errors += 1
+
+    def update(self, busy=True):
+        """
+        Close the current step if MEASURE_SECONDS have passed and adjust target.
+
+        busy says whether the batch kept every target worker occupied; an
+        idle batch (running out of jobs) is not grown. Returns target.
+        """
+        now = time.time()
+        with self._lock:
+            elapsed = now - self._step_started
+            if elapsed < MEASURE_SECONDS:
+                return self.target
+            rate = self._bytes / elapsed
+            results, load_errors = self._results, self._load_errors
+            self._bytes = self._results = self._load_errors = 0
+            self._step_started = now
+        self.rate = rate
+
+        pressure = self._pressure(results, load_errors)
+        if pressure:
+            self._step_down(pressure)
+        elif self._probing and self._last_rate and rate < self._last_rate * SCALE_UP_GAIN:
+            self._step_down(f"worker {self.target} added no throughput")
+        elif self._hold:
+            self._hold -= 1
+            self._probing = False
+        elif busy and self.target < self.maximum:
+            self.target += 1
+            self._probing = True
+            self.reason = f"probing {self.target} workers"
+        else:
+            self._probing = False
+        self._last_rate = rate
+        return self.target
+
+    def stats(self):
+        return {'target': self.target, 'rate': self.rate, 'reason': self.reason}
+
+    def _step_down(self, reason):
+        self.target = max(self.minimum, self.target - 1)
+        self._probing = False
+        self._hold = HOLD_STEPS
+        self.reason = reason
+
+    @staticmethod
+    def _pressure(results, load_errors):
+        """Why the system cannot take the current load, or None."""
+        if results >= MIN_RESULTS_FOR_ERROR_RATE and load_errors / results >= ERROR_RATE_HIGH:
+            return f"{load_errors} of {results} downloads hit network or rate-limit errors"
+        if psutil is None:
+            return None
+        cpu = psutil.cpu_percent(interval=None)
+        if cpu >= CPU_HIGH:
+            return f"CPU at {cpu:.0f}%"
+        memory = psutil.virtual_memory().percent
+        if memory >= MEMORY_HIGH:
+            return f"memory at {memory:.0f}%"
+        return None
@@ -0,0 +1,481 @@
+"""
+Command line interface for the download engine.
+
+    python cli.py download URL [URL ...] [-o DIR] [--type "Audio Only"] ...
+    python cli.py serve [--host 127.0.0.1] [--port 8765]
+    python cli.py submit URL [URL ...] [--server URL]
+    python cli.py status JOB_ID [--wait] [--server URL]
+    python cli.py fetch JOB_ID [-o DIR] [--server URL]
+    python cli.py enqueue URL [URL ...] [--queue PATH]
+    python cli.py worker [--queue PATH] [-o DIR] [--parallel N]
+    python cli.py queue-status BATCH_ID [--queue PATH]
+    python cli.py subscribe URL [-o DIR] [--every HOURS] [--db PATH]
+    python cli.py sync [ID ...] [--full] [--watch] [--db PATH]
+    python cli.py subscriptions [--db PATH]
+    python cli.py unsubscribe ID [--db PATH]
+    python cli.py library [QUERY] [--uploader NAME]
+    python cli.py bench-transcode FILE [--audio-format flac] [--workers N]
+
+download runs locally through the same batch runner as the Batch tab; the
+submit/status/fetch commands talk to a running API server; enqueue, worker
+and queue-status use the shared job queue (see jobqueue.py). subscribe and
+sync mirror playlists and channels incrementally (see subscriptions.py).
+library searches the persistent output library (see library.py).
+bench-transcode compares single-process and segment-parallel audio
+transcoding of a local file.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+
+import engine
+import jobqueue
+import library
+import postprocess
+import scheduler
+import subscriptions
+import transfer
+
+DEFAULT_SERVER = os.environ.get("YTDLP_API_URL", "http://127.0.0.1:8765")
+# Seconds between polls for status --wait
+POLL_INTERVAL = 2
+
+
+def add_download_options(parser):
+    parser.add_argument("--type", dest="download_type", choices=engine.DOWNLOAD_TYPES,
+                        default=engine.DEFAULT_BATCH_SETTINGS['download_type'])
+    parser.add_argument("--quality", choices=engine.VIDEO_QUALITIES,
+                        default=engine.DEFAULT_BATCH_SETTINGS['quality'])
+    parser.add_argument("--audio-format", choices=engine.AUDIO_FORMATS,
+                        default=engine.DEFAULT_BATCH_SETTINGS['audio_format'])
+    parser.add_argument("--max-size", choices=engine.MAX_FILE_SIZES,
+                        default=engine.DEFAULT_BATCH_SETTINGS['max_size'])
+    parser.add_argument("--parallel", type=int, default=engine.DEFAULT_BATCH_SETTINGS['parallel'])
+    parser.add_argument("--auto-parallel", action="store_true",
+                        help="Start at --parallel and tune the number of simultaneous downloads "
+                             "from throughput, CPU, memory and errors (up to %d)" % engine.MAX_PARALLEL_DOWNLOADS)
+    parser.add_argument("--schedule", choices=engine.BATCH_SCHEDULES,
+                        default=engine.DEFAULT_BATCH_SETTINGS['schedule'],
+                        help="Download order; anything but 'In Order' prefetches all metadata first")
+    parser.add_argument("--subs", action="store_true", help="Download English subtitles")
+    parser.add_argument("--thumbnail", action="store_true", help="Download thumbnails")
+    parser.add_argument("--metadata", action="store_true", help="Embed metadata (needs FFmpeg)")
+    parser.add_argument("--embed", action="store_true",
+                        help="Embed downloaded subtitles and thumbnails in the media file (needs FFmpeg)")
+    parser.add_argument("--expand-playlists", action="store_true",
+                        help="Replace playlist URLs with their videos before downloading")
+    parser.add_argument("--rendition", dest="renditions", action="append", default=[],
+                        choices=engine.rendition_choices("Video + Audio"),
+                        help="Also produce this audio format or height from the same download (repeatable)")
+    parser.add_argument("--start", dest="start_time", help="Download from this time ([HH:]MM:SS or seconds)")
+    parser.add_argument("--end", dest="end_time", help="Download up to this time ([HH:]MM:SS or seconds)")
+    parser.add_argument("--chapter", dest="chapters", action="append", default=[],
+                        help="Download only chapters whose titles match this regex (repeatable)")
+    parser.add_argument("--split-chapters", action="store_true", help="Also save each chapter as its own file")
+    parser.add_argument("--parallel-transcode", action="store_true",
+                        help="Transcode long flac audio in parallel segments (needs FFmpeg)")
+    parser.add_argument("--fast-formats", action="store_true",
+                        help="Skip the video/audio merge when a single file has the same quality")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Per-download limit in KB/s (0 = none)")
+    parser.add_argument("--proxy", dest="proxies", action="append", default=[],
+                        help="Proxy URL, e.g. http://host:port or socks5://host:port; repeat to rotate "
+                             "through a health-checked pool (default: $YTDLP_PROXIES)")
+    parser.add_argument("--format", dest="custom_format", default="",
+                        help="yt-dlp format spec overriding --type/--quality, e.g. 'bv*+ba/b'")
+    parser.add_argument("--library", action="store_true",
+                        help="Keep finished files in the output library ($YTDLP_LIBRARY_DIR)")
+    parser.add_argument("--filename-template", default="",
+                        help="yt-dlp output template (default: %s)" % engine.OUTPUT_TEMPLATE.replace('%', '%%'))
+
+
+def add_bandwidth_option(parser):
+    parser.add_argument("--bandwidth-cap", type=int, default=None,
+                        help="Cap on all downloads in this process together, in KB/s "
+                             "(default: $YTDLP_BANDWIDTH_CAP or none)")
+
+
+def options_from_args(args):
+    return {
+        'download_type': args.download_type,
+        'quality': args.quality,
+        'audio_format': args.audio_format,
+        'max_size': args.max_size,
+        'parallel': args.parallel,
+        'auto_parallel': args.auto_parallel,
+        'schedule': args.schedule,
+        'subs': args.subs,
+        'thumbnail': args.thumbnail,
+        'metadata': args.metadata,
+        'embed': args.embed,
+        'expand_playlists': args.expand_playlists,
+        'fast_formats': args.fast_formats,
+        'renditions': args.renditions,
+        'parallel_transcode': args.parallel_transcode,
+        'start_time': args.start_time,
+        'end_time': args.end_time,
+        'chapters': args.chapters,
+        'split_chapters': args.split_chapters,
+        'rate_limit': args.rate_limit,
+        'proxy': args.proxies[0] if len(args.proxies) == 1 else '',
+        'proxies': args.proxies if len(args.proxies) > 1 else [],
+        'custom_format': args.custom_format,
+        'filename_template': args.filename_template,
+        'library': args.library,
+    }
+
+
+def collect_urls(args):
+    """URLs from the command line followed by those in --input, read lazily."""
+    yield from args.urls
+    if args.input:
+        yield from engine.iter_batch_file(args.input)
+
+
+def print_json(payload):
+    print(json.dumps(payload, indent=2))
+
+
+def cmd_download(args):
+    settings = engine.normalize_batch_settings(options_from_args(args))
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    # Deduplication is per run: rerunning into the same directory retries every URL
+    state_dir = tempfile.mkdtemp(prefix="ytdlp-batch-")
+    state = engine.open_batch_state(state_dir)
+    stats = engine.new_canonicalize_stats()
+    failures = 0
+    total = len(args.urls) + (engine.count_batch_file_urls(args.input) if args.input else 0)
+    estimate = engine.batch_estimate(total, settings)
+
+    def on_result(position, result):
+        nonlocal failures
+        if result['status'] != "success":
+            failures += 1
+        # Expanded playlists and skipped URLs change the total as the batch streams
+        estimate.total = (total + stats['expanded_videos'] - stats['playlists_expanded']
+                          - stats['merged'] - stats.get('rejected', 0))
+        print(json.dumps({
+            'url': result['url'],
+            'status': result['status'],
+            'title': result.get('title'),
+            'error': result.get('error'),
+            'files': [path for _, path, _ in result.get('files', [])],
+            'batch_eta_seconds': round(estimate.remaining_seconds()),
+        }), flush=True)
+
+    jobs = engine.iter_batch_jobs(state, collect_urls(args), settings['expand_playlists'], stats)
+    try:
+        engine.run_batch(jobs, output_dir, settings, state=state, on_result=on_result, estimate=estimate)
+    finally:
+        state.close()
+        shutil.rmtree(state_dir, ignore_errors=True)
+    skipped = stats['merged'] + stats.get('rejected', 0)
+    print(f"{failures} failed, {skipped} skipped", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def cmd_serve(args):
+    import api
+    api.serve(args.host, args.port, api_key=args.api_key)
+    return 0
+
+
+def api_request(args, method, path, **kwargs):
+    headers = {}
+    api_key = args.api_key or os.environ.get("YTDLP_API_KEY")
+    if api_key:
+        headers["X-API-Key"] = api_key
+    response = requests.request(method, args.server.rstrip('/') + path, headers=headers, timeout=30, **kwargs)
+    if response.status_code >= 400:
+        try:
+            message = response.json().get('error')
+        except ValueError:
+            message = response.text
+        raise SystemExit(f"API error {response.status_code}: {message}")
+    return response
+
+
+def cmd_submit(args):
+    urls = list(collect_urls(args))
+    job = api_request(args, "POST", "/jobs", json={'urls': urls, 'options': options_from_args(args)}).json()
+    print(job['id'])
+    return 0
+
+
+def cmd_status(args):
+    while True:
+        job = api_request(args, "GET", f"/jobs/{args.job_id}").json()
+        if not args.wait or job['status'] in ("finished", "failed"):
+            break
+        time.sleep(POLL_INTERVAL)
+    print_json(job)
+    return 0 if job['status'] != "failed" else 1
+
+
+def cmd_fetch(args):
+    os.makedirs(args.output, exist_ok=True)
+    offset = 0
+    fetched = 0
+    while True:
+        page = api_request(args, "GET", f"/jobs/{args.job_id}/results", params={'offset': offset}).json()
+        results = page['results']
+        if not results:
+            break
+        for result in results:
+            for index, file_info in enumerate(result['files']):
+                target = os.path.join(args.output, os.path.basename(file_info['name']))
+                path = f"/jobs/{args.job_id}/files/{result['position']}/{index}"
+                with api_request(args, "GET", path, stream=True) as response, open(target, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                print(target)
+                fetched += 1
+        offset += len(results)
+    print(f"Fetched {fetched} file(s)", file=sys.stderr)
+    return 0
+
+
+def cmd_enqueue(args):
+    conn = jobqueue.open_queue(args.queue)
+    stats = engine.new_canonicalize_stats()
+    batch_id = jobqueue.enqueue_urls(conn, collect_urls(args), options_from_args(args), stats=stats)
+    counts = jobqueue.batch_progress(conn, batch_id)
+    conn.close()
+    print(batch_id)
+    print(f"{counts['total']} job(s) queued, {stats['merged']} merged, {stats['rejected']} rejected",
+          file=sys.stderr)
+    return 0
+
+
+def cmd_worker(args):
+
+    def on_result(job, result):
+        print(json.dumps({'batch_id': job['batch_id'], 'url': job['url'], 'status': result['status'],
+                          'error': result.get('error')}), flush=True)
+
+    try:
+        jobqueue.run_worker(args.queue, args.output, args.parallel, worker_id=args.worker_id,
+                            on_result=on_result)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_queue_status(args):
+    conn = jobqueue.open_queue(args.queue)
+    progress = jobqueue.batch_progress(conn, args.batch_id)
+    failures = [
+        {'url': r['url'], 'error': r.get('error'), 'node': r.get('node')}
+        for r in jobqueue.iter_batch_results(conn, args.batch_id, status="failed")
+    ]
+    conn.close()
+    print_json({'batch_id': args.batch_id, 'progress': progress, 'failures': failures})
+    return 0
+
+
+def cmd_subscribe(args):
+    conn = subscriptions.open_subscriptions(args.db)
+    try:
+        subscription_id = subscriptions.add_subscription(
+            conn, args.url, args.output, options_from_args(args), int(args.every * 3600)
+        )
+    finally:
+        conn.close()
+    print(subscription_id)
+    return 0
+
+
+def cmd_unsubscribe(args):
+    conn = subscriptions.open_subscriptions(args.db)
+    try:
+        subscriptions.remove_subscription(conn, args.subscription_id)
+    finally:
+        conn.close()
+    return 0
+
+
+def cmd_subscriptions(args):
+    conn = subscriptions.open_subscriptions(args.db)
+    subs = subscriptions.list_subscriptions(conn)
+    conn.close()
+    fields = ('id', 'url', 'output_dir', 'interval_seconds', 'last_sync', 'last_result', 'archived')
+    print_json([{key: sub[key] for key in fields} for sub in subs])
+    return 0
+
+
+def print_sync_result(result):
+    print(json.dumps({'url': result['url'], 'status': result['status'], 'title': result.get('title'),
+                      'error': result.get('error')}), flush=True)
+
+
+def cmd_sync(args):
+    if args.watch:
+        def on_sync(subscription, summary):
+            print(json.dumps(dict(summary, subscription=subscription['id'])), file=sys.stderr, flush=True)
+
+        try:
+            subscriptions.run_scheduler(args.db, on_sync=on_sync, on_result=print_sync_result)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    conn = subscriptions.open_subscriptions(args.db)
+    ids = args.subscription_ids or [sub['id'] for sub in subscriptions.list_subscriptions(conn)]
+    failures = 0
+    try:
+        for subscription_id in ids:
+            summary = subscriptions.sync_subscription(conn, subscription_id, args.full, print_sync_result)
+            failures += summary['failed']
+            print(json.dumps(dict(summary, subscription=subscription_id)), file=sys.stderr)
+    finally:
+        conn.close()
+    return 1 if failures else 0
+
+
+def cmd_library(args):
+    if not library.enabled():
+        raise ValueError("No output library is configured; set YTDLP_LIBRARY_DIR")
+    items, total = library.search(args.query, args.uploader, limit=args.limit)
+    print_json({'total': total, 'items': items})
+    return 0
+
+
+def cmd_bench_transcode(args):
+    if not os.path.isfile(args.file):
+        raise ValueError(f"No such file: {args.file}")
+    print_json(postprocess.benchmark_transcode(args.file, args.audio_format, args.workers))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="yt-dlp downloader engine")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="Download URLs locally")
+    download.add_argument("urls", nargs="*")
+    download.add_argument("-i", "--input", help="URL list file (.txt, .csv or .jsonl)")
+    download.add_argument("-o", "--output", default="downloads", help="Output directory")
+    add_download_options(download)
+    add_bandwidth_option(download)
+    download.set_defaults(func=cmd_download)
+
+    serve = commands.add_parser("serve", help="Run the JSON HTTP API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--api-key", help="Require this X-API-Key (default: $YTDLP_API_KEY)")
+    add_bandwidth_option(serve)
+    serve.add_argument("--max-downloads", type=int, default=None,
+                       help="Downloads running at once across all jobs, shared fairly between them "
+                            "(default: $YTDLP_MAX_DOWNLOADS or %d)" % scheduler.MAX_DOWNLOADS)
+    serve.add_argument("--scheduler-weights", type=scheduler.parse_weights, default=None,
+                       help="Fair-share weights as ACCOUNT=WEIGHT,... with accounts as GET /usage reports "
+                            "them (default: $YTDLP_SCHEDULER_WEIGHTS)")
+    serve.set_defaults(func=cmd_serve)
+
+    for name, func, help_text in (
+        ("submit", cmd_submit, "Submit a job to an API server"),
+        ("status", cmd_status, "Show a job's status"),
+        ("fetch", cmd_fetch, "Download a job's output files"),
+    ):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("--server", default=DEFAULT_SERVER, help="API base URL (default: $YTDLP_API_URL)")
+        sub.add_argument("--api-key", help="X-API-Key to send (default: $YTDLP_API_KEY)")
+        if name == "submit":
+            sub.add_argument("urls", nargs="*")
+            sub.add_argument("-i", "--input", help="URL list file (.txt, .csv or .jsonl)")
+            add_download_options(sub)
+        else:
+            sub.add_argument("job_id")
+        if name == "status":
+            sub.add_argument("--wait", action="store_true", help="Poll until the job finishes")
+        if name == "fetch":
+            sub.add_argument("-o", "--output", default="downloads", help="Output directory")
+        sub.set_defaults(func=func)
+
+    queue_help = f"Queue database (default: {jobqueue.QUEUE_PATH})"
+    enqueue = commands.add_parser("enqueue", help="Add URLs to the shared worker queue")
+    enqueue.add_argument("urls", nargs="*")
+    enqueue.add_argument("-i", "--input", help="URL list file (.txt, .csv or .jsonl)")
+    enqueue.add_argument("--queue", default=jobqueue.QUEUE_PATH, help=queue_help)
+    add_download_options(enqueue)
+    enqueue.set_defaults(func=cmd_enqueue)
+
+    worker = commands.add_parser("worker", help="Process jobs from the shared worker queue")
+    worker.add_argument("--queue", default=jobqueue.QUEUE_PATH, help=queue_help)
+    worker.add_argument("-o", "--output", default=None, help="Output directory (shared storage for delivery)")
+    worker.add_argument("--parallel", type=int, default=engine.DEFAULT_BATCH_SETTINGS['parallel'])
+    worker.add_argument("--worker-id", default=None, help="Stable name for this worker's leases")
+    add_bandwidth_option(worker)
+    worker.set_defaults(func=cmd_worker)
+
+    queue_status = commands.add_parser("queue-status", help="Show progress of a queued batch")
+    queue_status.add_argument("batch_id")
+    queue_status.add_argument("--queue", default=jobqueue.QUEUE_PATH, help=queue_help)
+    queue_status.set_defaults(func=cmd_queue_status)
+
+    db_help = f"Subscriptions database (default: {subscriptions.SYNC_PATH})"
+    subscribe = commands.add_parser("subscribe", help="Mirror a playlist or channel incrementally")
+    subscribe.add_argument("url")
+    subscribe.add_argument("-o", "--output", default="downloads", help="Output directory")
+    subscribe.add_argument("--every", type=float, default=0,
+                           help="Sync every this many hours under sync --watch (0 = only when run)")
+    subscribe.add_argument("--db", default=subscriptions.SYNC_PATH, help=db_help)
+    add_download_options(subscribe)
+    subscribe.set_defaults(func=cmd_subscribe)
+
+    sync = commands.add_parser("sync", help="Download new entries of subscribed playlists and channels")
+    sync.add_argument("subscription_ids", nargs="*", type=int, metavar="ID",
+                      help="Subscriptions to sync (default: all)")
+    sync.add_argument("--full", action="store_true",
+                      help="Enumerate whole playlists instead of stopping at known entries")
+    sync.add_argument("--watch", action="store_true", help="Keep running, syncing subscriptions as they fall due")
+    sync.add_argument("--db", default=subscriptions.SYNC_PATH, help=db_help)
+    add_bandwidth_option(sync)
+    sync.set_defaults(func=cmd_sync)
+
+    subs = commands.add_parser("subscriptions", help="List subscriptions and their last sync")
+    subs.add_argument("--db", default=subscriptions.SYNC_PATH, help=db_help)
+    subs.set_defaults(func=cmd_subscriptions)
+
+    unsubscribe = commands.add_parser("unsubscribe", help="Remove a subscription (its files are kept)")
+    unsubscribe.add_argument("subscription_id", type=int)
+    unsubscribe.add_argument("--db", default=subscriptions.SYNC_PATH, help=db_help)
+    unsubscribe.set_defaults(func=cmd_unsubscribe)
+
+    library_parser = commands.add_parser("library", help="Search the output library")
+    library_parser.add_argument("query", nargs="?", help="Start of a title, or an exact video id")
+    library_parser.add_argument("--uploader", help="Only this uploader's videos")
+    library_parser.add_argument("--limit", type=int, default=50)
+    library_parser.set_defaults(func=cmd_library)
+
+    bench = commands.add_parser("bench-transcode", help="Benchmark segment-parallel audio transcoding")
+    bench.add_argument("file", help="Local media file (ideally 20+ minutes long)")
+    bench.add_argument("--audio-format", choices=postprocess.SEGMENTABLE_CODECS, default="flac")
+    bench.add_argument("--workers", type=int, default=None, help="Parallel segments (default: CPU count)")
+    bench.set_defaults(func=cmd_bench_transcode)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'bandwidth_cap', None) is not None:
+        transfer.set_bandwidth_cap(args.bandwidth_cap)
+    if getattr(args, 'max_downloads', None) is not None:
+        scheduler.scheduler.set_limit(args.max_downloads)
+    if getattr(args, 'scheduler_weights', None) is not None:
+        scheduler.scheduler.set_weights(args.scheduler_weights)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1819 @@
+"""
+Download engine shared by the Streamlit UI, the HTTP API and the CLI.
+
+Nothing in this module imports Streamlit, so it can be used headless.
+"""
+import os
+import re
+import csv
+import io
+import json
+import heapq
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+import shutil
+
+import yt_dlp
+
+from yt_dlp.postprocessor import FFmpegSplitChaptersPP
+from yt_dlp.utils import download_range_func, parse_duration
+
+from postprocess import SinglePassFFmpegPP
+import autotune
+import estimator
+import history
+import library
+import manifest
+from quotas import QuotaExceeded, quotas
+from scheduler import scheduler
+from transfer import shared_session
+import ydlpool
+from proxypool import DEFAULT_PROXIES, pool as proxy_pool
+
+# =============================================================================
+# CONFIGURATION CONSTANTS
+# =============================================================================
+
+DOWNLOAD_TYPES = ["Video + Audio", "Audio Only", "Video Only"]
+VIDEO_QUALITIES = ["Best Available", "1080p", "720p", "480p", "360p"]
+AUDIO_FORMATS = ["mp3", "aac", "m4a", "opus", "flac"]
+MAX_FILE_SIZES = ["No Limit", "100MB", "500MB", "1GB", "2GB"]
+# Batch download order; anything but "In Order" prefetches metadata first
+BATCH_SCHEDULES = ["In Order", "Shortest First", "Largest First", "Round-Robin by Host"]
+
+# Settings understood by download_single_url() and the batch runner
+DEFAULT_BATCH_SETTINGS = {
+    'download_type': "Video + Audio",
+    'quality': "Best Available",
+    'audio_format': "mp3",
+    'subs': False,
+    'thumbnail': False,
+    'metadata': False,
+    'max_size': "No Limit",
+    'timeout': 15 * 60,
+    'parallel': 3,
+    'expand_playlists': False,
+    'fast_formats': False,
+    'embed': False,
+    'renditions': [],
+    'parallel_transcode': False,
+    'start_time': None,
+    'end_time': None,
+    'chapters': [],
+    'split_chapters': False,
+    'rate_limit': 0,
+    'proxy': '',
+    'proxies': [],
+    'custom_format': '',
+    'filename_template': '',
+    'schedule': "In Order",
+    'auto_parallel': False,
+    # Keep finished files in the persistent library (needs YTDLP_LIBRARY_DIR)
+    'library': False,
+}
+MAX_PARALLEL_DOWNLOADS = 10
+
+# =============================================================================
+# FFMPEG
+# =============================================================================
+
+# FFmpeg status tracking
+_ffmpeg_status = {"checked": False, "available": False, "message": ""}
+
+
+def check_ffmpeg_availability():
+    """Check if ffmpeg is available without blocking startup."""
+    global _ffmpeg_status
+    if _ffmpeg_status["checked"]:
+        return _ffmpeg_status["available"]
+
+    _ffmpeg_status["checked"] = True
+    if shutil.which("ffmpeg"):
+        _ffmpeg_status["available"] = True
+        _ffmpeg_status["message"] = "FFmpeg found in PATH"
+    else:
+        _ffmpeg_status["available"] = False
+        _ffmpeg_status["message"] = "FFmpeg not found. Some features may be limited."
+
+    return _ffmpeg_status["available"]
+
+
+def get_ffmpeg_status():
+    """Get the current ffmpeg status message."""
+    check_ffmpeg_availability()
+    return _ffmpeg_status
+
+
+# Check ffmpeg availability (non-blocking)
+check_ffmpeg_availability()
+
+# =============================================================================
+# DOWNLOADS
+# =============================================================================
+
+# Source codec that audio extraction can remux (stream copy) into each output format
+AUDIO_COPY_CODECS = {'mp3': 'mp3', 'aac': 'aac', 'm4a': 'aac', 'opus': 'opus', 'flac': 'flac'}
+# yt-dlp format filters selecting a source stream in each codec
+_AUDIO_CODEC_FILTERS = {
+    'aac': '[acodec^=mp4a]',
+    'mp3': '[acodec=mp3]',
+    'opus': '[acodec=opus]',
+    'flac': '[acodec=flac]',
+}
+
+
+def audio_format_selector(audio_format):
+    """
+    Format selector for audio extraction that prefers a source already in the
+    target codec, so extraction copies the stream instead of re-encoding.
+    """
+    codec_filter = _AUDIO_CODEC_FILTERS.get(AUDIO_COPY_CODECS.get(audio_format))
+    if not codec_filter:
+        return 'bestaudio/best'
+    return f'bestaudio{codec_filter}/bestaudio/best'
+
+
+def audio_codec_family(acodec):
+    """Normalize a yt-dlp acodec string ('mp4a.40.2', 'opus', ...) to a codec name."""
+    if not acodec or acodec == 'none':
+        return None
+    acodec = acodec.lower()
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+    return acodec.split('.')[0]
+
+
+def plan_audio_extraction(info, audio_format):
+    """
+    Predict how audio extraction will handle an extracted video.
+
+    Mirrors audio_format_selector() over info['formats'] (sorted worst to best
+    by yt-dlp). Returns a dict with 'action' ('copy' or 'transcode'),
+    'source_codec' and 'format_id', or None if the formats are unknown.
+    """
+    formats = [f for f in (info or {}).get('formats') or [] if audio_codec_family(f.get('acodec'))]
+    if not formats:
+        return None
+    audio_only = [f for f in formats if f.get('vcodec') == 'none'] or formats
+    target = AUDIO_COPY_CODECS.get(audio_format)
+    matching = [f for f in audio_only if audio_codec_family(f.get('acodec')) == target]
+    chosen = (matching or audio_only)[-1]
+    source_codec = audio_codec_family(chosen.get('acodec'))
+    return {
+        'action': 'copy' if source_codec == target else 'transcode',
+        'source_codec': source_codec,
+        'format_id': chosen.get('format_id'),
+    }
+
+
+# Height cap for each VIDEO_QUALITIES choice (None = no cap)
+QUALITY_HEIGHTS = {"Best Available": None, "1080p": 1080, "720p": 720, "480p": 480, "360p": 360}
+# Fast format planning costs, in bytes-equivalents: setting up one HTTP request,
+# and the floor for an ffmpeg merge (which rewrites every downloaded byte)
+FAST_CONNECTION_COST = 512 * 1024
+FAST_MERGE_MIN_COST = 8 * 1024 * 1024
+
+# Bare YoutubeDL used only to compile format specs chosen by plan_fast_format()
+_format_spec_ydl = None
+_format_spec_lock = threading.Lock()
+
+
+def video_format_selector(quality, fast=False):
+    """
+    yt-dlp format for a Video + Audio download at the given quality.
+
+    With fast=True, returns a callable that picks the cheapest format (or
+    video+audio pair) reaching the same height; see plan_fast_format().
+    """
+    height = QUALITY_HEIGHTS.get(quality)
+    if height is None:
+        spec = 'bestvideo+bestaudio/best'
+    else:
+        spec = f"bestvideo[height<={height}]+bestaudio/best[height<={height}]"
+    if not fast:
+        return spec
+
+    def select_fast_format(ctx):
+        fast_spec = plan_fast_format(ctx['formats'], height)
+        return _compile_format_spec(fast_spec or spec)(ctx)
+
+    return select_fast_format
+
+
+def _compile_format_spec(spec):
+    global _format_spec_ydl
+    with _format_spec_lock:
+        if _format_spec_ydl is None:
+            _format_spec_ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+    return _format_spec_ydl.build_format_selector(spec)
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') != 'none'
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') != 'none'
+
+
+def _infer_duration(formats):
+    """Duration in seconds implied by any format with both a size and a bitrate."""
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if size and fmt.get('tbr'):
+            return size * 8 / (fmt['tbr'] * 1000)
+    return None
+
+
+def _estimated_bytes(fmt, duration):
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return size or 0
+
+
+def _request_count(fmt):
+    """HTTP requests needed for a format: one per fragment, else one."""
+    return len(fmt.get('fragments') or ()) or 1
+
+
+def plan_fast_format(formats, max_height=None):
+    """
+    Choose the cheapest download reaching the best height up to max_height.
+
+    Candidates are progressive formats at that height and video-only formats
+    at that height paired with the best audio-only format. Each is scored by
+    estimated bytes, FAST_CONNECTION_COST per HTTP request and, for pairs, a
+    merge pass. formats is yt-dlp's list, sorted worst to best. Returns a
+    format spec such as '18' or '137+140', or None if heights are unknown.
+    """
+    videos = [f for f in formats if _has_video(f) and f.get('height')
+              and (max_height is None or f['height'] <= max_height)]
+    if not videos:
+        return None
+    target_height = max(f['height'] for f in videos)
+    audio_only = [f for f in formats if not _has_video(f) and _has_audio(f)]
+    best_audio = audio_only[-1] if audio_only else None
+    duration = _infer_duration(formats)
+
+    candidates = []
+    for rank, fmt in enumerate(videos):
+        if fmt['height'] != target_height:
+            continue
+        size = _estimated_bytes(fmt, duration)
+        cost = size + FAST_CONNECTION_COST * _request_count(fmt)
+        if _has_audio(fmt):
+            candidates.append((cost, -rank, fmt['format_id']))
+        elif best_audio:
+            audio_size = _estimated_bytes(best_audio, duration)
+            cost += audio_size + FAST_CONNECTION_COST * _request_count(best_audio)
+            cost += max(size + audio_size, FAST_MERGE_MIN_COST)
+            candidates.append((cost, -rank, f"{fmt['format_id']}+{best_audio['format_id']}"))
+    if not candidates:
+        return None
+    # Ties go to the format yt-dlp ranks higher
+    return min(candidates)[2]
+
+
+def rendition_choices(download_type, audio_format=None):
+    """
+    Extra renditions (see SinglePassFFmpegPP) that make sense for a download
+    type, excluding the main audio format of an Audio Only download.
+    """
+    heights = [quality for quality in VIDEO_QUALITIES if QUALITY_HEIGHTS.get(quality)]
+    if download_type == "Audio Only":
+        return [fmt for fmt in AUDIO_FORMATS if fmt != audio_format]
+    if download_type == "Video Only":
+        return heights
+    return heights + AUDIO_FORMATS
+
+
+def plan_postprocessing(download_type, audio_format, metadata=False, embed_thumbnail=False,
+                        embed_subtitles=False, renditions=(), parallel_transcode=False):
+    """
+    Plan the FFmpeg steps for a download as one SinglePassFFmpegPP.
+
+    Returns its keyword arguments, or None when nothing needs FFmpeg.
+    Metadata and embedding are dropped when FFmpeg is missing; audio
+    extraction and renditions are kept so the download fails with an
+    FFmpeg error. parallel_transcode lets long audio transcodes use every core.
+    """
+    ffmpeg = check_ffmpeg_availability()
+    main_audio = audio_format if download_type == "Audio Only" else None
+    steps = {
+        'audio_codec': main_audio,
+        'add_metadata': bool(metadata and ffmpeg),
+        'embed_thumbnail': bool(embed_thumbnail and ffmpeg),
+        'embed_subtitles': bool(embed_subtitles and ffmpeg and download_type != "Audio Only"),
+        'renditions': [r for r in dict.fromkeys(renditions or ()) if r != main_audio],
+        'segment_workers': os.cpu_count() if parallel_transcode and main_audio else None,
+    }
+    return steps if any(steps.values()) else None
+
+
+# Output names; sections and split chapters get their own so they don't collide
+OUTPUT_TEMPLATE = '%(title).100s-%(id)s.%(ext)s'
+SECTION_SUFFIX = '-%(section_start)ds-%(section_end)ds'
+CHAPTER_SUFFIX = '-%(section_number)03d-%(section_title).60s'
+PROXY_SCHEMES = ('http', 'https', 'socks4', 'socks4a', 'socks5', 'socks5h')
+
+
+def parse_timestamp(value):
+    """
+    Seconds from a time such as 90, '90', '1:30' or '1:02:03.5'.
+
+    Returns None for a blank value; raises ValueError if it cannot be parsed.
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    seconds = value if isinstance(value, (int, float)) else parse_duration(str(value).strip())
+    if seconds is None or seconds < 0:
+        raise ValueError(f"Invalid time: {value!r}. Use seconds or [HH:]MM:SS")
+    return float(seconds)
+
+
+def with_suffix(template, suffix):
+    """Insert suffix before a template's '.%(ext)s' (or append it)."""
+    if template.endswith('.%(ext)s'):
+        return template[:-len('.%(ext)s')] + suffix + '.%(ext)s'
+    return template + suffix
+
+
+def validate_filename_template(template):
+    """Check a user filename template; raises ValueError if unusable."""
+    error = yt_dlp.YoutubeDL.validate_outtmpl(template)
+    if error:
+        raise ValueError(f"Invalid filename template: {error}")
+    parts = template.replace('\\', '/').split('/')
+    if os.path.isabs(template) or '..' in parts:
+        raise ValueError("Filename template must stay inside the download folder")
+    return template
+
+
+def section_options(output_dir, start_time=None, end_time=None, chapters=None, split_chapters=False,
+                    filename_template=None):
+    """
+    yt-dlp options to fetch only a time range and/or chapters whose titles
+    match the given regexes, and to name output and split chapter files.
+
+    Only the fragments covering the requested sections are downloaded.
+    filename_template replaces OUTPUT_TEMPLATE; sections and chapters add
+    their suffix to it. Raises ValueError for bad times, patterns or templates.
+    """
+    start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    if start is not None and end is not None and end <= start:
+        raise ValueError("End time must be after start time")
+    try:
+        chapter_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in chapters or ()]
+    except re.error as e:
+        raise ValueError(f"Invalid chapter pattern: {e}")
+
+    template = validate_filename_template(filename_template) if filename_template else OUTPUT_TEMPLATE
+
+    opts = {}
+    outtmpl = {'default': os.path.join(output_dir, template)}
+    if filename_template:
+        opts['outtmpl'] = outtmpl
+    ranges = [(start or 0, end if end is not None else float('inf'))] if start or end is not None else []
+    if ranges or chapter_patterns:
+        opts['download_ranges'] = download_range_func(chapter_patterns, ranges)
+        outtmpl['default'] = os.path.join(output_dir, with_suffix(template, SECTION_SUFFIX))
+        opts['outtmpl'] = outtmpl
+    if split_chapters:
+        outtmpl['chapter'] = os.path.join(output_dir, with_suffix(template, CHAPTER_SUFFIX))
+        opts['outtmpl'] = outtmpl
+    return opts
+
+
+def validate_proxy(proxy):
+    """Check a proxy URL; raises ValueError if malformed."""
+    parsed = urlparse(proxy)
+    if parsed.scheme not in PROXY_SCHEMES or not parsed.hostname:
+        raise ValueError(f"Invalid proxy URL: {proxy!r}. Use e.g. http://host:port or socks5://host:port")
+    return proxy
+
+
+def network_options(proxy=None, custom_format=None):
+    """
+    yt-dlp options for the advanced settings: a proxy URL and a custom
+    format spec that replaces the one picked from type and quality.
+
+    Raises ValueError for a malformed proxy or format spec.
+    """
+    opts = {}
+    if proxy:
+        opts['proxy'] = validate_proxy(proxy)
+    if custom_format:
+        try:
+            _compile_format_spec(custom_format)
+        except (SyntaxError, ValueError) as e:
+            raise ValueError(f"Invalid custom format: {str(e).splitlines()[0]}")
+        opts['format'] = custom_format
+    return opts
+
+
+# Single-download option names that differ from the batch setting names
+SINGLE_OPTION_NAMES = {
+    'download_subs': 'subs',
+    'download_thumbnail': 'thumbnail',
+    'embed_metadata': 'metadata',
+    'max_file_size': 'max_size',
+}
+# Options a profile carries besides DEFAULT_BATCH_SETTINGS
+PROFILE_EXTRA_KEYS = ('playlist_start', 'playlist_end')
+MAX_CACHED_PROFILES = 64
+SIZE_LIMITS = {"100MB": 100*1024*1024, "500MB": 500*1024*1024,
+               "1GB": 1000*1024*1024, "2GB": 2000*1024*1024}
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def ydl_profile(settings):
+    """
+    Build the yt-dlp options profile for download settings (batch keys,
+    plus playlist_start/playlist_end), cached by their canonical form.
+
+    Returns a dict with 'key', 'params' (YoutubeDL params without output
+    template, hooks or proxy), 'outtmpl' (templates relative to the output
+    directory), 'postprocessing', 'split_chapters', 'rate_limit' (bytes/s)
+    and 'proxies'. Raises ValueError for invalid settings.
+    """
+    relevant = {k: v for k, v in settings.items() if k in DEFAULT_BATCH_SETTINGS or k in PROFILE_EXTRA_KEYS}
+    key = json.dumps(relevant, sort_keys=True, default=str)
+    with _profiles_lock:
+        if key in _profiles:
+            return _profiles[key]
+
+    params = {
+        'restrictfilenames': True,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    download_type = settings.get('download_type', 'Video + Audio')
+    quality = settings.get('quality', 'Best Available')
+    audio_format = settings.get('audio_format', 'mp3')
+
+    if download_type == "Audio Only":
+        params['format'] = audio_format_selector(audio_format)
+    elif download_type == "Video Only":
+        params['format'] = 'bestvideo'
+    else:
+        params['format'] = video_format_selector(quality, settings.get('fast_formats', False))
+
+    if settings.get('subs', False):
+        params['writesubtitles'] = True
+        params['subtitleslangs'] = ['en']
+
+    if settings.get('thumbnail', False):
+        params['writethumbnail'] = True
+
+    max_size = settings.get('max_size') or "No Limit"
+    if max_size != "No Limit":
+        params['max_filesize'] = SIZE_LIMITS.get(max_size)
+
+    if (settings.get('playlist_start') or 1) > 1:
+        params['playliststart'] = settings['playlist_start']
+    if (settings.get('playlist_end') or 0) > 0:
+        params['playlistend'] = settings['playlist_end']
+
+    sections = section_options(
+        '', settings.get('start_time'), settings.get('end_time'),
+        settings.get('chapters'), settings.get('split_chapters', False), settings.get('filename_template'),
+    )
+    outtmpl = sections.pop('outtmpl', {'default': OUTPUT_TEMPLATE})
+    params.update(sections)
+    params.update(network_options(settings.get('proxy'), settings.get('custom_format')))
+
+    profile = {
+        'key': key,
+        'params': params,
+        'outtmpl': outtmpl,
+        'postprocessing': plan_postprocessing(
+            download_type, audio_format, settings.get('metadata', False),
+            settings.get('embed', False) and settings.get('thumbnail', False),
+            settings.get('embed', False) and settings.get('subs', False),
+            settings.get('renditions'),
+            settings.get('parallel_transcode', False),
+        ),
+        'split_chapters': bool(settings.get('split_chapters', False)),
+        'rate_limit': (settings.get('rate_limit') or 0) * 1024,
+        'proxies': job_proxies(settings),
+    }
+    with _profiles_lock:
+        if len(_profiles) >= MAX_CACHED_PROFILES:
+            _profiles.pop(next(iter(_profiles)))
+        _profiles[key] = profile
+    return profile
+
+
+def run_download(url, output_dir, settings, progress_hooks=None, download=True, info=None, output=None):
+    """
+    Download url into output_dir with a pooled YoutubeDL (see ydlpool) for
+    the settings' profile, through the proxy pool if configured.
+
+    With download=False only the metadata is extracted (formats are still
+    selected); a previously extracted info dict can be passed to skip
+    extraction. output is an OutputManifest (see manifest.py) to collect
+    the files produced. Returns yt-dlp's info dict; raises on failure.
+    """
+    profile = ydl_profile(settings)
+    outtmpl = {kind: os.path.join(output_dir, template) for kind, template in profile['outtmpl'].items()}
+
+    def run(opts):
+        # Transfer and post-processing times feed the estimator's history
+        measured = {'bytes': 0, 'seconds': 0.0, 'first_byte': None, 'pp_started': None, 'pp_seconds': 0.0}
+
+        def measure_download(d):
+            if d['status'] == 'downloading' and measured['first_byte'] is None:
+                measured['first_byte'] = time.time()
+            elif d['status'] == 'finished' and d.get('elapsed'):
+                measured['bytes'] += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+                measured['seconds'] += d['elapsed']
+
+        def measure_postprocessing(d):
+            if d['status'] == 'started':
+                measured['pp_started'] = time.time()
+            elif d['status'] == 'finished' and measured['pp_started']:
+                measured['pp_seconds'] += time.time() - measured['pp_started']
+                measured['pp_started'] = None
+
+        measure_download.thread_safe = True
+        hooks = opts.pop('progress_hooks', []) + [measure_download]
+        key = (profile['key'], opts.get('proxy'))
+        started = time.time()
+        with ydlpool.checkout(key, opts, outtmpl, hooks, profile['rate_limit']) as ydl:
+            ydl.add_postprocessor_hook(measure_postprocessing)
+            if output is not None:
+                ydl.add_postprocessor_hook(output.hook)
+            if profile['postprocessing']:
+                ydl.add_post_processor(SinglePassFFmpegPP(ydl, **profile['postprocessing']))
+            if profile['split_chapters']:
+                ydl.add_post_processor(FFmpegSplitChaptersPP(ydl))
+            if info is not None:
+                result = ydl.process_ie_result(info, download=download)
+            else:
+                result = ydl.extract_info(url, download=download)
+        if measured['first_byte'] is not None:
+            estimator.record_download(estimator.url_host(url), measured['bytes'], measured['seconds'],
+                                      overhead=measured['first_byte'] - started)
+        if measured['pp_seconds'] and result and result.get('duration'):
+            estimator.record_transcode(transcode_codec(settings), result['duration'], measured['pp_seconds'])
+        return result
+
+    params = dict(profile['params'], progress_hooks=list(progress_hooks or []))
+    return run_with_proxies(params, profile['proxies'], run)
+
+
+def transcode_codec(settings):
+    """Post-processing speed class of a download: its audio format, or 'video'."""
+    if settings.get('download_type') == "Audio Only":
+        return settings.get('audio_format', "mp3")
+    return "video"
+
+
+def record_history(url, started, info=None, files=(), error=None, settings=None, session=None, source=None):
+    """Add a finished download to the persistent history (see history.py)."""
+    if info:
+        extractor, media_id = info.get('extractor_key'), info.get('id')
+    else:
+        extractor, media_id = url_identity(url)
+    history.record(
+        url, "error" if error else "success", started,
+        extractor=extractor, media_id=str(media_id) if media_id is not None else None,
+        title=info.get('title') if info else None,
+        files=len(files), nbytes=sum(size for _, _, size in files),
+        error=error[:1000] if error else None,
+        error_category=categorize_error(error)[0] if error else None,
+        options=settings, session=session, source=source,
+    )
+
+
+def download_with_ytdlp_api(url, output_dir, options, progress_hooks=None, session=None):
+    """
+    Download using yt-dlp Python API instead of subprocess.
+
+    Runs as an interactive download of session in the shared scheduler and,
+    when a session is given, within its quotas; the outcome is recorded in
+    the download history.
+    Returns dict with 'success', 'files', 'manifest' (see manifest.py) and
+    'error' keys.
+    """
+    # The UI passes a progress hook that drives a progress bar
+    settings = {SINGLE_OPTION_NAMES.get(key, key): value for key, value in options.items()}
+    started = time.time()
+    try:
+        if session:
+            quotas.start_job(session, output_dir)
+        try:
+            with scheduler.slot(session or uuid.uuid4().hex, interactive=True):
+                output = manifest.OutputManifest()
+                info = run_download(url, output_dir, settings, progress_hooks, output=output)
+        finally:
+            if session:
+                quotas.finish_job(session)
+
+        entries = output.entries()
+        if settings.get('library') and info:
+            entries = library.add(info, entries)
+        files = manifest.as_files(entries)
+        if session:
+            quotas.record_download(session, sum(size for _, _, size in files))
+        record_history(url, started, info, files, settings=settings, session=session, source="single")
+
+        return {'success': True, 'files': files, 'manifest': entries, 'error': None}
+
+    except QuotaExceeded as e:
+        error = f"Quota exceeded: {e}"
+    except Exception as e:
+        error = str(e)
+    record_history(url, started, error=error, settings=settings, session=session, source="single")
+    return {'success': False, 'files': [], 'manifest': [], 'error': error}
+
+
+def job_proxies(options):
+    """
+    Proxies a job rotates through: its own 'proxies' list, else the
+    YTDLP_PROXIES pool unless it pins a single 'proxy'.
+    """
+    if options.get('proxies'):
+        return list(options['proxies'])
+    return [] if options.get('proxy') else list(DEFAULT_PROXIES)
+
+
+def run_with_proxies(ydl_opts, proxies, run):
+    """
+    Call run(ydl_opts), routing it through the proxy pool when proxies are given.
+
+    Each attempt gets the pool's best proxy not yet tried by this job; a
+    Proxy Error (see categorize_error) marks that proxy as failing and moves
+    the job to the next one. Successful runs report their throughput.
+    """
+    if not proxies:
+        return run(ydl_opts)
+    tried = []
+    last_error = None
+    while True:
+        proxy = proxy_pool.choose(proxies, exclude=tried)
+        if proxy is None:
+            raise RuntimeError(f"No healthy proxy left in the proxy pool (last error: {last_error})")
+        tried.append(proxy)
+        received = []
+
+        def count_bytes(d):
+            if d['status'] == 'finished':
+                received.append(d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+
+        count_bytes.thread_safe = True
+        hooks = list(ydl_opts.get('progress_hooks') or []) + [count_bytes]
+        started = time.time()
+        try:
+            result = run(dict(ydl_opts, proxy=proxy, progress_hooks=hooks))
+        except Exception as e:
+            if categorize_error(str(e))[0] != "Proxy Error":
+                raise
+            proxy_pool.report(proxy, False)
+            last_error = e
+            continue
+        finally:
+            proxy_pool.release(proxy)
+        elapsed = time.time() - started
+        proxy_pool.report(proxy, True, throughput=sum(received) / elapsed if elapsed > 0 else None)
+        return result
+
+
+def categorize_error(error_message):
+    error_lower = error_message.lower()
+    # Checked first: proxy failures also mention connections and timeouts
+    if 'proxy' in error_lower:
+        return "Proxy Error", "Check proxy configuration."
+    elif 'quota' in error_lower:
+        return "Quota Exceeded", "Wait for running downloads to finish, or free disk space by clearing old downloads."
+    elif 'network' in error_lower or 'connection' in error_lower or 'timeout' in error_lower:
+        return "Network Error", "Check your internet connection and try again."
+    elif 'login' in error_lower or 'authentication' in error_lower or 'private' in error_lower:
+        if 'instagram' in error_lower and 'stories' in error_lower:
+            return "Instagram Story Restriction", "Instagram stories often require login. Try a public post or reel."
+        return "Authentication Required", "This content requires login, which is disabled. Try a different video."
+    elif 'format' in error_lower and 'not available' in error_lower:
+        return "Format Error", "Try a different quality setting."
+    elif 'ffmpeg' in error_lower:
+        return "FFmpeg Error", "FFmpeg is required. Check the System tab to install it."
+    elif 'instagram' in error_lower:
+        return "Instagram Restriction", "Instagram content may have restrictions. Try a different URL."
+    elif 'youtube' in error_lower:
+        return "YouTube Restriction", "Some YouTube videos are restricted. Try a different video."
+    elif 'unsupported' in error_lower or 'not a valid' in error_lower:
+        return "URL Error", "The URL is invalid or from an unsupported site."
+    elif 'permission denied' in error_lower or 'cannot write' in error_lower:
+        return "Permission Error", "Check write permissions to the output directory."
+    elif 'invalid option' in error_lower or 'unknown option' in error_lower:
+        return "Configuration Error", "Check the advanced options."
+    elif 'live stream' in error_lower or 'cannot download live' in error_lower:
+        return "Live Stream Error", "Live streams cannot be downloaded."
+    elif 'rate limit' in error_lower or 'too many requests' in error_lower:
+        return "Rate Limit Error", "Too many requests. Try again later."
+    elif 'video unavailable' in error_lower or 'deleted' in error_lower:
+        return "Content Error", "The video is unavailable or deleted."
+    elif 'no subtitles' in error_lower or 'subtitles not found' in error_lower:
+        return "Subtitle Error", "Subtitles are not available."
+    elif 'disk full' in error_lower or 'no space left' in error_lower:
+        return "Disk Space Error", "Free up disk space and try again."
+    elif 'ssl' in error_lower or 'certificate' in error_lower:
+        return "SSL Error", "Update certificates or check network settings."
+    elif 'invalid character' in error_lower or 'filename too long' in error_lower:
+        return "Filename Error", "Change the filename template in advanced settings."
+    elif 'index out of range' in error_lower or 'invalid playlist index' in error_lower:
+        return "Playlist Error", "Check playlist indices."
+    elif 'file too large' in error_lower or 'exceeds max size' in error_lower:
+        return "File Size Error", "Try lower quality or increase the limit."
+    else:
+        return "Unknown Error", "An unexpected error occurred."
+
+
+# =============================================================================
+# EXTRACTOR INDEX - offline URL routing without network calls
+# =============================================================================
+
+# Built once per process by build_extractor_index()
+_extractor_index = None
+_extractor_index_lock = threading.Lock()
+# Hosts whose candidate extractors are remembered (least recently used dropped first)
+HOST_CANDIDATE_CACHE = 4096
+_host_candidates_lock = threading.Lock()
+# validate_url() message for URLs only yt-dlp's generic extractor will try
+GENERIC_URL_MESSAGE = "No dedicated extractor matches this URL; yt-dlp will try its generic extractor"
+
+# Tokens that appear in nearly every URL pattern and carry no routing signal
+_EXTRACTOR_TOKEN_STOPWORDS = {'www', 'com', 'net', 'org', 'http', 'https'}
+_VERBOSE_COMMENT_RE = re.compile(r'(?<!\\)#[^\n]*')
+_CASE_CLASS_RE = re.compile(r'\[([a-zA-Z])([a-zA-Z])\]')
+_CHAR_CLASS_RE = re.compile(r'(?<!\\)\[(?:\\.|[^\]\\])*\]')
+# A literal made optional ('tiktokv?') ends the token before it
+_OPTIONAL_CHAR_RE = re.compile(r'[a-z0-9]\?')
+_PATTERN_NOISE_RE = re.compile(r'\\[a-zA-Z]|\(\?P?<[^>]*>|\(\?P=\w+\)|\[[^\]]*\]|\{[0-9,]*\}')
+_PATTERN_TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9-]*')
+_PATTERN_DOMAIN_RE = re.compile(r'(?:[a-z0-9-]+\\\.)+[a-z]{2,}')
+_FILE_EXTENSIONS = {'swf', 'html', 'htm', 'php', 'aspx', 'json', 'js', 'xml', 'mp4', 'mp3', 'm3u8', 'mpd'}
+
+
+def _extractor_patterns(ie):
+    """Return the _VALID_URL regex source(s) of an extractor class as a list."""
+    valid_url = getattr(ie, '_VALID_URL', None)
+    if isinstance(valid_url, str):
+        return [valid_url]
+    if isinstance(valid_url, (list, tuple)):
+        return [p for p in valid_url if isinstance(p, str)]
+    return []
+
+
+def _pattern_literals(pattern):
+    """
+    Reduce a _VALID_URL regex to its literal text.
+
+    Verbose-mode comments, escapes, group names and character classes are
+    dropped; case-insensitive pairs like [yY] collapse to the lowercase letter.
+    """
+    pattern = _CASE_CLASS_RE.sub(
+        lambda m: m.group(1).lower() if m.group(1).lower() == m.group(2).lower() else ' ',
+        pattern
+    )
+    if pattern.startswith('(?x)'):
+        # A '#' inside a character class ([^/?#]) is literal, not a comment
+        pattern = _VERBOSE_COMMENT_RE.sub(' ', _CHAR_CLASS_RE.sub(' ', pattern))
+    return pattern
+
+
+def _pattern_tokens(pattern):
+    literals = _OPTIONAL_CHAR_RE.sub(' ', _PATTERN_NOISE_RE.sub(' ', _pattern_literals(pattern)).lower())
+    return {t for t in _PATTERN_TOKEN_RE.findall(literals)
+            if t not in _EXTRACTOR_TOKEN_STOPWORDS}
+
+
+def _pattern_domains(pattern):
+    literals = _pattern_literals(pattern).lower()
+    domains = {d.replace('\\.', '.') for d in _PATTERN_DOMAIN_RE.findall(literals)}
+    return {d for d in domains if d.rsplit('.', 1)[-1] not in _FILE_EXTENSIONS}
+
+
+def build_extractor_index():
+    """
+    Build an in-process index of every yt-dlp extractor, once per process.
+
+    Each extractor is recorded with its name, description, the domains found in
+    its URL patterns and the literal tokens of those patterns. Tokens map back to
+    extractor positions so a URL only has to be tested against the handful of
+    extractors whose patterns mention its host, in yt-dlp's own priority order.
+    """
+    global _extractor_index
+    if _extractor_index is not None:
+        return _extractor_index
+    with _extractor_index_lock:
+        if _extractor_index is None:
+            _extractor_index = _build_extractor_index()
+    return _extractor_index
+
+
+def _build_extractor_index():
+    extractors = []
+    by_token = {}
+    # Single-letter tokens ('x' of x.com) only route hosts with that exact label
+    by_label = {}
+    unindexed = []
+    # Extractors without a literal domain may match any host (self-hosted platforms)
+    any_host = []
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == 'Generic':
+            continue
+        position = len(extractors)
+        patterns = _extractor_patterns(ie)
+        tokens = set()
+        domains = set()
+        for pattern in patterns:
+            tokens |= _pattern_tokens(pattern)
+            domains |= _pattern_domains(pattern)
+        extractors.append({
+            'key': ie.ie_key(),
+            'name': ie.IE_NAME,
+            'description': ie.IE_DESC or '',
+            'domains': sorted(domains),
+            'working': ie.working(),
+            'return_type': getattr(ie, '_RETURN_TYPE', None),
+            'ie': ie,
+        })
+        if not tokens:
+            unindexed.append(position)
+        if not domains:
+            any_host.append(position)
+        for token in tokens:
+            target = by_token if len(token) >= 2 else by_label
+            target.setdefault(token, []).append(position)
+
+    return {
+        'extractors': extractors,
+        'by_token': by_token,
+        'by_label': by_label,
+        'unindexed': unindexed,
+        'any_host': any_host,
+        'max_token_len': max((len(t) for t in by_token), default=0),
+        'host_candidates': OrderedDict(),
+    }
+
+
+def _host_candidates(index, host):
+    """Positions of extractors whose URL patterns mention a substring of host."""
+    cache = index['host_candidates']
+    with _host_candidates_lock:
+        cached = cache.get(host)
+        if cached is not None:
+            cache.move_to_end(host)
+            return cached
+    by_token = index['by_token']
+    max_len = index['max_token_len']
+    positions = set(index['unindexed'])
+    for start in range(len(host)):
+        for end in range(start + 2, min(len(host), start + max_len) + 1):
+            matches = by_token.get(host[start:end])
+            if matches:
+                positions.update(matches)
+    for label in host.split('.'):
+        positions.update(index['by_label'].get(label, ()))
+    cached = tuple(sorted(positions))
+    with _host_candidates_lock:
+        cache[host] = cached
+        if len(cache) > HOST_CANDIDATE_CACHE:
+            cache.popitem(last=False)
+    return cached
+
+
+def classify_url(url):
+    """
+    Determine offline which yt-dlp extractor will handle a URL.
+
+    Returns the extractor record from build_extractor_index(), or None when only
+    the generic page scraper would be tried. No network request is made: this is
+    the same suitable() check yt-dlp runs before extraction, narrowed by host.
+    """
+    index = build_extractor_index()
+    extractors = index['extractors']
+    try:
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower() if parsed.scheme in ('http', 'https') else ''
+    except ValueError:
+        host = ''
+
+    if host:
+        for position in _host_candidates(index, host):
+            if extractors[position]['ie'].suitable(url):
+                return extractors[position]
+        # Patterns with wildcard hosts (self-hosted platforms) are not reachable
+        # through host tokens; only those need checking for an unmatched host.
+        fallback = (extractors[position] for position in index['any_host'])
+    else:
+        # Custom schemes (ytsearch:, at:// and the like): a full priority-order scan
+        fallback = extractors
+    for extractor in fallback:
+        if extractor['ie'].suitable(url):
+            return extractor
+    return None
+
+
+def search_extractors(query, limit=50):
+    """Search the extractor index by name, description or domain."""
+    extractors = build_extractor_index()['extractors']
+    query = query.strip().lower()
+    if not query:
+        return extractors[:limit], len(extractors)
+    matches = [
+        e for e in extractors
+        if query in e['name'].lower()
+        or query in e['description'].lower()
+        or any(query in d for d in e['domains'])
+    ]
+    return matches[:limit], len(matches)
+
+
+def validate_url(url):
+    if not url:
+        return False, "URL cannot be empty"
+    try:
+        parsed = urlparse(url)
+        if not parsed.scheme or not parsed.netloc:
+            return False, "Invalid URL format. Please include http:// or https://"
+    except:
+        return False, "Invalid URL format"
+    extractor = classify_url(url)
+    if extractor is None:
+        # Direct media links, embedded players and self-hosted sites are left to Generic
+        return True, GENERIC_URL_MESSAGE
+    return True, f"Supported by the {extractor['name']} extractor"
+
+def url_identity(url):
+    """
+    Resolve a URL to an (extractor, id) key offline.
+
+    Different spellings of the same video (youtu.be, m.youtube.com, shorts,
+    extra query parameters) share a key. URLs whose extractor has no id in the
+    URL fall back to a normalized form of the URL itself.
+    """
+    extractor = classify_url(url)
+    if extractor is not None:
+        try:
+            media_id = extractor['ie'].get_temp_id(url)
+        except Exception:
+            media_id = None
+        if media_id:
+            return (extractor['key'], str(media_id))
+    parsed = urlparse(url)
+    normalized = parsed._replace(
+        scheme=parsed.scheme.lower(),
+        netloc=parsed.netloc.lower(),
+        fragment=''
+    ).geturl()
+    return (extractor['key'] if extractor else None, normalized)
+
+
+def is_playlist_candidate(url):
+    """Whether the extractor for a URL can return a playlist rather than one video."""
+    extractor = classify_url(url)
+    return extractor is not None and extractor['return_type'] in ('playlist', 'any', None)
+
+
+def expand_playlist(url):
+    """
+    List the member videos of a playlist URL without downloading them.
+
+    Uses a flat extraction, so only the playlist pages are fetched. Returns a
+    list of (identity, url) tuples, or None when the URL is a single video.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not info or info.get('_type') != 'playlist':
+        return None
+    members = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        if not entry_url:
+            continue
+        if entry.get('ie_key') and entry.get('id'):
+            identity = (entry['ie_key'], str(entry['id']))
+        else:
+            identity = url_identity(entry_url)
+        members.append((identity, entry_url))
+    return members
+
+
+def new_canonicalize_stats():
+    return {'merged': 0, 'playlists_expanded': 0, 'expanded_videos': 0, 'expand_errors': []}
+
+
+def iter_unique_urls(urls, claim, expand_playlists=False, stats=None):
+    """
+    Stream (claim_result, url) for each distinct video in an iterable of URLs.
+
+    claim(identity, url) is called once per candidate and returns a falsy value
+    for identities that were already seen, so callers decide where the seen-set
+    lives (memory for pasted lists, the batch state database for uploads).
+    With expand_playlists, playlist URLs are replaced by their member videos;
+    this needs network access.
+    """
+    if stats is None:
+        stats = new_canonicalize_stats()
+    for url in urls:
+        members = None
+        if expand_playlists and is_playlist_candidate(url):
+            try:
+                members = expand_playlist(url)
+            except Exception as e:
+                stats['expand_errors'].append((url, str(e)))
+        if members is None:
+            members = [(url_identity(url), url)]
+        else:
+            stats['playlists_expanded'] += 1
+            stats['expanded_videos'] += len(members)
+        for identity, member_url in members:
+            claimed = claim(identity, member_url)
+            if claimed:
+                yield claimed, member_url
+            else:
+                stats['merged'] += 1
+
+
+def canonicalize_urls(urls, expand_playlists=False):
+    """
+    Collapse a batch URL list to one URL per distinct video.
+
+    With expand_playlists, playlist URLs are replaced by their member videos
+    so a video listed both on its own and inside a playlist is only
+    downloaded once.
+
+    Returns dict with 'urls', 'merged', 'playlists_expanded', 'expanded_videos'
+    and 'expand_errors' keys.
+    """
+    seen = set()
+
+    def claim(identity, _url):
+        if identity in seen:
+            return False
+        seen.add(identity)
+        return True
+
+    stats = new_canonicalize_stats()
+    unique_urls = [u for _, u in iter_unique_urls(urls, claim, expand_playlists, stats)]
+    return dict(stats, urls=unique_urls)
+
+
+# =============================================================================
+# BATCH INGEST - lazily parsed inputs and on-disk per-URL state
+# =============================================================================
+
+BATCH_FILE_TYPES = ["txt", "csv", "jsonl"]
+# Futures kept in flight per parallel worker; the rest of the batch waits on disk
+BATCH_SUBMIT_WINDOW_FACTOR = 2
+# Metadata extractions run at once while prefetching a scheduled batch
+PREFETCH_PARALLEL = 16
+# Prefetched info dicts kept for reuse at download time, and how long they
+# stay fresh (media URLs in them eventually expire)
+PREFETCH_INFO_CACHE = 256
+PREFETCH_INFO_TTL = 15 * 60
+# Scheduled jobs read from the batch state per query
+SCHEDULE_PAGE_SIZE = 500
+# Longest gap between on_tick calls while a batch runs
+BATCH_TICK_SECONDS = 2.0
+# Largest files returned by largest_batch_files() by default
+BATCH_MAX_FILE_BUTTONS = 50
+
+
+def iter_batch_file(path):
+    """
+    Lazily yield URLs from an uploaded batch file.
+
+    .txt: one URL per line. .csv: the 'url' column if there is a header with
+    one, otherwise the first column. .jsonl: a 'url' field per object, or a
+    bare JSON string per line. Blank lines and '#' comments are skipped.
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        if ext == 'csv':
+            reader = csv.reader(f)
+            url_column = 0
+            for row_number, row in enumerate(reader):
+                if not row:
+                    continue
+                if row_number == 0:
+                    header = [cell.strip().lower() for cell in row]
+                    if 'url' in header:
+                        url_column = header.index('url')
+                        continue
+                if url_column < len(row) and row[url_column].strip():
+                    yield row[url_column].strip()
+        elif ext == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    record = record.get('url')
+                if isinstance(record, str) and record.strip():
+                    yield record.strip()
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+
+
+def count_batch_file_urls(path):
+    return sum(1 for _ in iter_batch_file(path))
+
+
+def open_batch_state(state_dir):
+    """
+    Open (creating if needed) the SQLite file holding per-URL batch state.
+
+    One row per source URL: its (extractor, id) identity, status
+    (pending/success/error/rejected), title, error and output files.
+    """
+    conn = sqlite3.connect(os.path.join(state_dir, "batch_state.sqlite"))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS batch_urls (
+            position INTEGER PRIMARY KEY AUTOINCREMENT,
+            identity TEXT UNIQUE,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            title TEXT,
+            error TEXT,
+            files TEXT,
+            updated_at REAL
+        )
+    """)
+    # Metadata estimates filled in by prefetch_batch(), and output manifests
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(batch_urls)")}
+    for column, column_type in (('est_bytes', 'INTEGER'), ('duration', 'REAL'), ('host', 'TEXT'),
+                                ('manifest', 'TEXT')):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE batch_urls ADD COLUMN {column} {column_type}")
+    conn.commit()
+    return conn
+
+
+def claim_batch_url(conn, identity, url):
+    """Insert a URL into the batch state; returns its position, or None if a duplicate."""
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO batch_urls (identity, url, updated_at) VALUES (?, ?, ?)",
+        (json.dumps(list(identity)), url, time.time())
+    )
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def reject_batch_url(conn, url, message):
+    conn.execute(
+        "INSERT INTO batch_urls (url, status, error, updated_at) VALUES (?, 'rejected', ?, ?)",
+        (url, message, time.time())
+    )
+
+
+def record_batch_result(conn, position, result):
+    conn.execute(
+        "UPDATE batch_urls SET status = ?, title = ?, error = ?, files = ?, manifest = ?, updated_at = ? "
+        "WHERE position = ?",
+        (
+            result['status'],
+            result.get('title'),
+            result.get('error'),
+            json.dumps(result.get('files', [])),
+            json.dumps(result.get('manifest', [])),
+            time.time(),
+            position,
+        )
+    )
+    conn.commit()
+
+
+def iter_batch_jobs(conn, urls, expand_playlists=False, stats=None):
+    """
+    Stream (position, url) jobs for a batch, recording every URL on disk.
+
+    URLs are validated offline, deduplicated against the state database and
+    optionally expanded from playlists as they are consumed, so only the
+    current submission window is ever held in memory.
+    """
+    if stats is None:
+        stats = new_canonicalize_stats()
+    stats.setdefault('rejected', 0)
+
+    def valid_urls():
+        for url in urls:
+            is_valid, message = validate_url(url)
+            if is_valid:
+                yield url
+            else:
+                stats['rejected'] += 1
+                reject_batch_url(conn, url, message)
+
+    def claim(identity, url):
+        return claim_batch_url(conn, identity, url)
+
+    for position, url in iter_unique_urls(valid_urls(), claim, expand_playlists, stats):
+        yield position, url
+
+
+def record_batch_estimate(conn, position, est_bytes, duration, host):
+    conn.execute(
+        "UPDATE batch_urls SET est_bytes = ?, duration = ?, host = ?, updated_at = ? WHERE position = ?",
+        (est_bytes, duration, host, time.time(), position)
+    )
+
+
+def scheduled_batch_jobs(conn, schedule):
+    """
+    (position, url) of a batch's pending URLs in schedule order.
+
+    Shortest/Largest First order by estimated download size (unknown sizes
+    last); Round-Robin by Host takes one URL per host in turn. The order is
+    fixed up front in a temporary table, as results are written to
+    batch_urls while the batch runs, and read back SCHEDULE_PAGE_SIZE jobs
+    at a time.
+    """
+    order = {
+        "Shortest First": "est_bytes IS NULL, est_bytes, position",
+        "Largest First": "est_bytes IS NULL, est_bytes DESC, position",
+        "Round-Robin by Host": "ROW_NUMBER() OVER (PARTITION BY host ORDER BY position), position",
+    }.get(schedule, "position")
+    conn.execute("DROP TABLE IF EXISTS temp.batch_schedule")
+    conn.execute("CREATE TEMP TABLE batch_schedule (seq INTEGER PRIMARY KEY, position INTEGER, url TEXT)")
+    conn.execute(
+        "INSERT INTO temp.batch_schedule (position, url) "
+        f"SELECT position, url FROM batch_urls WHERE status = 'pending' ORDER BY {order}"
+    )
+    seq = 0
+    while True:
+        page = conn.execute(
+            "SELECT seq, position, url FROM temp.batch_schedule WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, SCHEDULE_PAGE_SIZE)
+        ).fetchall()
+        if not page:
+            return
+        for seq, position, url in page:
+            yield position, url
+
+
+def batch_state_counts(conn):
+    return dict(conn.execute("SELECT status, COUNT(*) FROM batch_urls GROUP BY status").fetchall())
+
+
+def largest_batch_files(conn, limit=BATCH_MAX_FILE_BUTTONS):
+    """Return the largest output files of a batch, and the total file count."""
+    def iter_files():
+        for (files_json,) in conn.execute("SELECT files FROM batch_urls WHERE status = 'success'"):
+            for filename, file_path, file_size in json.loads(files_json or "[]"):
+                yield filename, file_path, file_size
+
+    total = 0
+    largest = []
+    for entry in iter_files():
+        total += 1
+        if len(largest) < limit:
+            heapq.heappush(largest, (entry[2], entry))
+        else:
+            heapq.heappushpop(largest, (entry[2], entry))
+    return [entry for _, entry in sorted(largest, reverse=True)], total
+
+
+def export_batch_report(conn):
+    """Render the per-URL batch state as CSV bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["url", "status", "title", "error", "files"])
+    for url, status, title, error, files_json in conn.execute(
+        "SELECT url, status, title, error, files FROM batch_urls ORDER BY position"
+    ):
+        file_count = len(json.loads(files_json)) if files_json else 0
+        writer.writerow([url, status, title or "", error or "", file_count])
+    return buffer.getvalue().encode('utf-8')
+
+
+# =============================================================================
+# BATCH RUNNER
+# =============================================================================
+
+def download_single_url(url, temp_dir, settings, task_id, info=None, progress_hooks=None, session=None):
+    """
+    Download one batch URL into its own task directory.
+
+    settings uses the batch keys (see DEFAULT_BATCH_SETTINGS); info is a
+    prefetched info dict to download from instead of extracting again.
+    The outcome is recorded in the download history under session.
+    Returns dict with 'url', 'title', 'status' and either 'files' and
+    'manifest' (see manifest.py) or 'error' keys.
+    """
+    # Create unique subdirectory for each task
+    task_temp_dir = os.path.join(temp_dir, f"task_{task_id}")
+    os.makedirs(task_temp_dir, exist_ok=True)
+    started = time.time()
+
+    try:
+        output = manifest.OutputManifest()
+        info = run_download(url, task_temp_dir, settings, progress_hooks, info=info, output=output)
+        title = info.get('title', 'Unknown') if info else 'Unknown'
+        if len(title) > 50:
+            title = title[:47] + "..."
+
+        entries = output.entries()
+        if settings.get('library') and info:
+            entries = library.add(info, entries)
+        files = manifest.as_files(entries)
+        record_history(url, started, info, files, settings=settings, session=session, source="batch")
+
+        return {"url": url, "title": title, "status": "success", "files": files, "manifest": entries}
+
+    except Exception as e:
+        record_history(url, started, error=str(e), settings=settings, session=session, source="batch")
+        error_type, error_solution = categorize_error(str(e))
+        return {"url": url, "title": "Failed", "status": "error", "error": f"{error_type}: {error_solution}"}
+
+
+def normalize_batch_settings(options=None):
+    """
+    Merge options over DEFAULT_BATCH_SETTINGS and validate them.
+
+    Raises ValueError with a user-facing message for unknown keys or values.
+    """
+    settings = dict(DEFAULT_BATCH_SETTINGS)
+    for key, value in (options or {}).items():
+        if key not in DEFAULT_BATCH_SETTINGS:
+            raise ValueError(f"Unknown option: {key}")
+        settings[key] = value
+    choices = {
+        'download_type': DOWNLOAD_TYPES,
+        'quality': VIDEO_QUALITIES,
+        'audio_format': AUDIO_FORMATS,
+        'max_size': MAX_FILE_SIZES,
+        'schedule': BATCH_SCHEDULES,
+    }
+    for key, allowed in choices.items():
+        if settings[key] not in allowed:
+            raise ValueError(f"Invalid {key}: {settings[key]!r}. Choose from {', '.join(allowed)}")
+    try:
+        settings['parallel'] = int(settings['parallel'])
+        settings['timeout'] = int(settings['timeout'])
+        settings['rate_limit'] = int(settings['rate_limit'] or 0)
+    except (TypeError, ValueError):
+        raise ValueError("parallel, timeout and rate_limit must be integers")
+    if settings['rate_limit'] < 0:
+        raise ValueError("rate_limit must be 0 (unlimited) or a positive number of KB/s")
+    if not 1 <= settings['parallel'] <= MAX_PARALLEL_DOWNLOADS:
+        raise ValueError(f"parallel must be between 1 and {MAX_PARALLEL_DOWNLOADS}")
+    for key in ('subs', 'thumbnail', 'metadata', 'embed', 'expand_playlists', 'fast_formats',
+                'parallel_transcode', 'split_chapters', 'library'):
+        settings[key] = bool(settings[key])
+    if settings['library'] and not library.enabled():
+        raise ValueError("No output library is configured; set YTDLP_LIBRARY_DIR")
+    if not isinstance(settings['renditions'], (list, tuple)):
+        raise ValueError("renditions must be a list")
+    allowed = rendition_choices(settings['download_type'])
+    for rendition in settings['renditions']:
+        if rendition not in allowed:
+            raise ValueError(f"Invalid rendition {rendition!r} for {settings['download_type']}. "
+                             f"Choose from {', '.join(allowed)}")
+    settings['renditions'] = list(settings['renditions'])
+    if not isinstance(settings['chapters'], (list, tuple)):
+        raise ValueError("chapters must be a list")
+    settings['chapters'] = [str(pattern) for pattern in settings['chapters']]
+    for key in ('proxy', 'custom_format', 'filename_template'):
+        settings[key] = str(settings[key] or '').strip()
+    section_options('', settings['start_time'], settings['end_time'], settings['chapters'],
+                    filename_template=settings['filename_template'])
+    network_options(settings['proxy'], settings['custom_format'])
+    if not isinstance(settings['proxies'], (list, tuple)):
+        raise ValueError("proxies must be a list")
+    settings['proxies'] = [validate_proxy(str(proxy).strip()) for proxy in settings['proxies']]
+    return settings
+
+
+def estimate_download_bytes(info):
+    """Expected download size of an extracted info dict (0 if unknown)."""
+    if info.get('entries') is not None:
+        return sum(estimate_download_bytes(entry) for entry in info['entries'] if entry)
+    duration = info.get('duration')
+    return sum(_estimated_bytes(fmt, duration) for fmt in info.get('requested_formats') or [info])
+
+
+def probe_content_length(info):
+    """Content-Length of a single direct-HTTP format from a HEAD request, or None."""
+    if info.get('requested_formats') or info.get('protocol') not in ('http', 'https') or not info.get('url'):
+        return None
+    try:
+        response = shared_session().head(info['url'], headers=info.get('http_headers'),
+                                         allow_redirects=True, timeout=10)
+        return int(response.headers['Content-Length']) if response.ok else None
+    except Exception:
+        return None
+
+
+def prefetch_url(url, settings):
+    """
+    Extract one batch URL's metadata (formats selected, nothing downloaded).
+
+    Returns dict with 'info', 'est_bytes', 'duration' and 'host', or with
+    'error' (a batch result) when the URL is unavailable.
+    """
+    try:
+        info = run_download(url, "", settings, download=False)
+    except Exception as e:
+        error_type, error_solution = categorize_error(str(e))
+        return {'error': {"url": url, "title": "Failed", "status": "error",
+                          "error": f"{error_type}: {error_solution}"}}
+    est_bytes = int(estimate_download_bytes(info))
+    # Direct links rarely report a size; ask the server unless traffic must go through a proxy
+    if not est_bytes and not (settings.get('proxy') or job_proxies(settings)):
+        est_bytes = probe_content_length(info)
+    return {
+        'info': info,
+        'est_bytes': est_bytes or None,
+        'duration': info.get('duration'),
+        'host': urlparse(url).hostname or "",
+    }
+
+
+def prefetch_batch(jobs, state, settings, on_result=None, estimate=None):
+    """
+    Phase one of a scheduled batch: extract metadata for every job.
+
+    Runs PREFETCH_PARALLEL extractions at a time. Unavailable URLs are
+    recorded (and passed to on_result) as failures straight away; the rest
+    get their size estimate and host stored in state, and registered with
+    estimate (a BatchEstimate) when given. Returns the freshest
+    PREFETCH_INFO_CACHE info dicts by position, as (info, fetched_at).
+    """
+    infos = OrderedDict()
+    in_flight = {}
+    jobs = iter(jobs)
+
+    with ThreadPoolExecutor(max_workers=PREFETCH_PARALLEL) as executor:
+        def fill():
+            while len(in_flight) < PREFETCH_PARALLEL * BATCH_SUBMIT_WINDOW_FACTOR:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                position, job_url = job
+                in_flight[executor.submit(prefetch_url, job_url, settings)] = (position, job_url)
+
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                position, job_url = in_flight.pop(future)
+                meta = future.result()
+                if 'error' in meta:
+                    record_batch_result(state, position, meta['error'])
+                    if estimate is not None:
+                        estimate.finish(position)
+                    if on_result:
+                        on_result(position, meta['error'])
+                    continue
+                record_batch_estimate(state, position, meta['est_bytes'], meta['duration'], meta['host'])
+                if estimate is not None:
+                    estimate.add(position, job_url, meta['est_bytes'], meta['duration'])
+                infos[position] = (meta['info'], time.time())
+                if len(infos) > PREFETCH_INFO_CACHE:
+                    infos.popitem(last=False)
+            fill()
+
+    state.commit()
+    return infos
+
+
+def batch_estimate(total, settings):
+    """A BatchEstimate (see estimator) for a batch of total URLs run with settings."""
+    return estimator.BatchEstimate(total, settings.get('parallel', 3), transcode_codec(settings))
+
+
+def batch_parallelism_controller(settings):
+    """The ParallelismController for an auto_parallel batch, else None."""
+    if not settings.get('auto_parallel'):
+        return None
+    return autotune.ParallelismController(settings.get('parallel', 3), MAX_PARALLEL_DOWNLOADS)
+
+
+def run_batch(jobs, temp_dir, settings, state=None, on_result=None, estimate=None, on_tick=None,
+              controller=None, session=None, account=None):
+    """
+    Run (position, url) jobs through a bounded pool of download workers.
+
+    Only parallel * BATCH_SUBMIT_WINDOW_FACTOR futures exist at a time; the
+    jobs iterator is advanced (and any on-disk state written) in the calling
+    thread. Each result is recorded in state when given, then passed to
+    on_result(position, result), also in the calling thread.
+
+    With a schedule other than "In Order" (and state to keep estimates in),
+    every job's metadata is prefetched first (see prefetch_batch) and the
+    downloads then run in schedule order, reusing fresh prefetched info.
+
+    estimate (see batch_estimate) is kept up to date as jobs start,
+    progress and finish, for callers to read from any thread; on_tick() is
+    called in the calling thread at least every BATCH_TICK_SECONDS while
+    downloads run, e.g. to refresh a display of it.
+
+    With auto_parallel, a ParallelismController (see autotune; pass one in
+    as controller to watch it) starts at parallel and decides how many
+    downloads run at once, up to MAX_PARALLEL_DOWNLOADS.
+
+    Each download also waits for a slot in the process-wide scheduler,
+    sharing it fairly with other sessions' batches; session names the
+    share (default: this batch alone). With an account (see quotas), each
+    URL is checked against its byte and disk quotas before it starts (and
+    fails with a Quota Exceeded error if over), and downloads are recorded
+    to it; admitting the batch itself is up to the caller.
+    """
+    parallel = settings.get('parallel', 3)
+    session = session or uuid.uuid4().hex
+    if controller is None:
+        controller = batch_parallelism_controller(settings)
+    in_flight = {}
+    exhausted = False
+    infos = {}
+    prefetched = state is not None and settings.get('schedule', "In Order") != "In Order"
+    if prefetched:
+        infos = prefetch_batch(jobs, state, settings, on_result, estimate)
+        jobs = scheduled_batch_jobs(state, settings['schedule'])
+    jobs = iter(jobs)
+
+    def download(job_url, position, info):
+        hooks = []
+        if estimate is not None:
+            hooks.append(estimate.hook(position))
+        if controller is not None:
+            hooks.append(controller.hook())
+        with scheduler.slot(session):
+            if account is not None:
+                try:
+                    quotas.check(account)
+                except QuotaExceeded as e:
+                    return {"url": job_url, "title": "Failed", "status": "error", "error": f"Quota Exceeded: {e}"}
+            if estimate is not None:
+                estimate.start(position)
+            return download_single_url(job_url, temp_dir, settings, position, info, hooks, session)
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS if controller else parallel) as executor:
+        def fill_submit_window():
+            nonlocal exhausted
+            # An autotuned batch runs exactly its target; a fixed one keeps spare jobs queued
+            submit_window = controller.target if controller else parallel * BATCH_SUBMIT_WINDOW_FACTOR
+            while len(in_flight) < submit_window:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    return
+                position, job_url = job
+                info, fetched_at = infos.pop(position, (None, 0))
+                if time.time() - fetched_at > PREFETCH_INFO_TTL:
+                    info = None
+                if estimate is not None and not prefetched:
+                    estimate.add(position, job_url)
+                future = executor.submit(download, job_url, position, info)
+                in_flight[future] = position
+
+        fill_submit_window()
+        while in_flight:
+            done, _ = wait(in_flight, timeout=BATCH_TICK_SECONDS, return_when=FIRST_COMPLETED)
+            if controller is not None:
+                controller.update(busy=not exhausted)
+                if estimate is not None:
+                    estimate.parallel = controller.target
+            if on_tick:
+                on_tick()
+            for future in done:
+                position = in_flight.pop(future)
+                result = future.result()
+                if state is not None:
+                    record_batch_result(state, position, result)
+                if estimate is not None:
+                    estimate.finish(position)
+                if controller is not None:
+                    controller.record_result(result)
+                if account is not None and result['status'] == "success":
+                    quotas.record_download(account, sum(size for _, _, size in result.get('files', [])))
+                if on_result:
+                    on_result(position, result)
+            fill_submit_window()
+
+    if state is not None:
+        state.commit()
+
+
+# =============================================================================
+# JOBS - background batches for headless clients
+# =============================================================================
+
+JOBS_DIR = os.environ.get("YTDLP_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "ytdlp-jobs")
+
+# Job records by id; guarded by _jobs_lock
+_jobs = {}
+# Live BatchEstimate of each running job, by id
+_job_estimates = {}
+_jobs_lock = threading.Lock()
+
+
+def submit_job(urls, options=None, account=None):
+    """
+    Start a batch download in a background thread and return its job id.
+
+    With an account (see quotas), the job is admitted against its quotas
+    and its downloads are charged to it. Raises ValueError for invalid
+    options or an empty URL list, QuotaExceeded when over a quota.
+    """
+    urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+    if not urls:
+        raise ValueError("At least one URL is required")
+    settings = normalize_batch_settings(options)
+    job_id = uuid.uuid4().hex[:12]
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    if account is not None:
+        quotas.start_job(account, job_dir)
+    os.makedirs(job_dir, exist_ok=True)
+    job = {
+        'id': job_id,
+        'status': "queued",
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'settings': settings,
+        'total': len(urls),
+        'succeeded': 0,
+        'failed': 0,
+        'skipped': 0,
+        'error': None,
+        'dir': job_dir,
+        'account': account,
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+    threading.Thread(target=_run_job, args=(job_id, urls), daemon=True, name=f"job-{job_id}").start()
+    return job_id
+
+
+def _update_job(job_id, **changes):
+    with _jobs_lock:
+        _jobs[job_id].update(changes)
+
+
+def _run_job(job_id, urls):
+    job = _jobs[job_id]
+    settings = job['settings']
+    _update_job(job_id, status="running", started_at=time.time())
+    state = open_batch_state(job['dir'])
+    stats = new_canonicalize_stats()
+    estimate = batch_estimate(len(urls), settings)
+    with _jobs_lock:
+        _job_estimates[job_id] = estimate
+
+    def on_result(position, result):
+        key = 'succeeded' if result['status'] == "success" else 'failed'
+        with _jobs_lock:
+            job[key] += 1
+            job['skipped'] = stats['merged'] + stats.get('rejected', 0)
+            job['total'] = len(urls) + stats['expanded_videos'] - stats['playlists_expanded']
+            estimate.total = job['total'] - job['skipped']
+
+    try:
+        jobs = iter_batch_jobs(state, urls, settings['expand_playlists'], stats)
+        run_batch(jobs, job['dir'], settings, state=state, on_result=on_result, estimate=estimate,
+                  session=job['account'], account=job['account'])
+        _update_job(
+            job_id,
+            status="finished",
+            skipped=stats['merged'] + stats.get('rejected', 0),
+            finished_at=time.time()
+        )
+    except Exception as e:
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        with _jobs_lock:
+            _job_estimates.pop(job_id, None)
+        if job['account'] is not None:
+            quotas.finish_job(job['account'])
+        state.close()
+
+
+def delete_job(job_id, account=None):
+    """
+    Delete a finished job and its output files, freeing its disk quota.
+
+    Only the job's own account may delete it when an account is given.
+    Returns False for an unknown job; raises ValueError while it runs.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or (account is not None and job['account'] != account):
+            return False
+        if job['status'] in ("queued", "running"):
+            raise ValueError("Job is still running")
+        del _jobs[job_id]
+    shutil.rmtree(job['dir'], ignore_errors=True)
+    return True
+
+
+def _job_snapshot(job):
+    """Copy of a job record with its estimated seconds left ('eta_seconds', None once done)."""
+    snapshot = dict(job)
+    estimate = _job_estimates.get(job['id'])
+    snapshot['eta_seconds'] = round(estimate.remaining_seconds()) if estimate else None
+    return snapshot
+
+
+def get_job(job_id):
+    """Return a snapshot of a job record, or None for an unknown id."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _job_snapshot(job) if job else None
+
+
+def list_jobs():
+    with _jobs_lock:
+        return sorted((_job_snapshot(j) for j in _jobs.values()), key=lambda j: j['created_at'], reverse=True)
+
+
+def job_etas(job_id):
+    """Estimated seconds until each unfinished URL of a running job completes, by position."""
+    with _jobs_lock:
+        estimate = _job_estimates.get(job_id)
+    return estimate.etas() if estimate else {}
+
+
+def read_batch_results(state_dir, offset=0, limit=100, etas=None):
+    """
+    Read per-URL results from a batch state file.
+
+    Opens its own connection so it can be called while the batch is running.
+    etas (see job_etas) adds 'eta_seconds' to URLs still pending.
+    """
+    conn = sqlite3.connect(os.path.join(state_dir, "batch_state.sqlite"))
+    try:
+        rows = conn.execute(
+            "SELECT position, url, status, title, error, files, manifest FROM batch_urls "
+            "ORDER BY position LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+    finally:
+        conn.close()
+    results = []
+    for position, url, status, title, error, files_json, manifest_json in rows:
+        files = json.loads(files_json) if files_json else []
+        by_path = {entry['path']: entry for entry in json.loads(manifest_json or "[]")}
+        results.append({
+            'position': position,
+            'url': url,
+            'status': status,
+            'title': title,
+            'error': error,
+            'files': [
+                {'name': name, 'size': size, 'kind': by_path.get(path, {}).get('kind'),
+                 'sha256': by_path.get(path, {}).get('sha256')}
+                for name, path, size in files
+            ],
+        })
+        if etas and position in etas:
+            results[-1]['eta_seconds'] = round(etas[position])
+    return results
+
+
+def job_file_path(job_id, position, file_index):
+    """Resolve an output file of a job; returns (filename, path) or None."""
+    job = get_job(job_id)
+    if not job:
+        return None
+    conn = sqlite3.connect(os.path.join(job['dir'], "batch_state.sqlite"))
+    try:
+        row = conn.execute(
+            "SELECT files FROM batch_urls WHERE position = ? AND status = 'success'", (position,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row or not row[0]:
+        return None
+    files = json.loads(row[0])
+    if not 0 <= file_index < len(files):
+        return None
+    filename, file_path, _ = files[file_index]
+    if not os.path.isfile(file_path):
+        return None
+    return filename, file_path
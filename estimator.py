@@ -0,0 +1,218 @@
+"""
+Download time estimates from measured throughput.
+
+Every finished download records its host's throughput, job size and setup
+overhead; every post-processing run records how many seconds of media per
+second its codec gets through. BatchEstimate combines those histories with
+a batch's prefetched sizes and durations (see engine.prefetch_batch) into a
+remaining time and per-job ETAs, refreshed from the jobs' progress hooks
+while the batch runs.
+
+Histories are process-wide moving averages, so estimates sharpen as the
+server handles more jobs.
+"""
+import heapq
+import threading
+import time
+from urllib.parse import urlparse
+
+# Assumed until a host (or any host) has been measured
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+DEFAULT_JOB_BYTES = 50 * 1024 * 1024
+# Seconds of extraction and setup before a job's bytes start flowing
+DEFAULT_OVERHEAD = 5.0
+# Media seconds post-processed per wall-clock second, until a codec is measured
+DEFAULT_TRANSCODE_SPEED = 40.0
+# Smoothing factor for every history
+EWMA_ALPHA = 0.3
+
+_lock = threading.Lock()
+# host -> {'throughput', 'job_bytes', 'overhead', 'jobs'}
+_hosts = {}
+# codec -> media seconds per second
+_codecs = {}
+
+
+def _ewma(previous, value):
+    return value if previous is None else previous + EWMA_ALPHA * (value - previous)
+
+
+def url_host(url):
+    return (urlparse(url).hostname or "").lower()
+
+
+def record_download(host, nbytes, seconds, overhead=None):
+    """Record a finished job: bytes received from host over seconds of transfer."""
+    if nbytes <= 0 or seconds <= 0:
+        return
+    with _lock:
+        history = _hosts.setdefault(host, {'throughput': None, 'job_bytes': None, 'overhead': None, 'jobs': 0})
+        history['throughput'] = _ewma(history['throughput'], nbytes / seconds)
+        history['job_bytes'] = _ewma(history['job_bytes'], nbytes)
+        if overhead is not None:
+            history['overhead'] = _ewma(history['overhead'], overhead)
+        history['jobs'] += 1
+
+
+def record_transcode(codec, media_seconds, seconds):
+    """Record post-processing of media_seconds of media into codec in seconds."""
+    if media_seconds <= 0 or seconds <= 0:
+        return
+    with _lock:
+        _codecs[codec] = _ewma(_codecs.get(codec), media_seconds / seconds)
+
+
+def host_profile(host):
+    """
+    Throughput, typical job size and overhead expected from host.
+
+    Unmeasured hosts get the average of the measured ones, or the defaults.
+    """
+    with _lock:
+        history = _hosts.get(host)
+        measured = [h for h in _hosts.values() if h['jobs']]
+    profile = {'throughput': DEFAULT_THROUGHPUT, 'job_bytes': DEFAULT_JOB_BYTES, 'overhead': DEFAULT_OVERHEAD}
+    for key in profile:
+        if history and history[key] is not None:
+            profile[key] = history[key]
+        else:
+            values = [h[key] for h in measured if h[key] is not None]
+            if values:
+                profile[key] = sum(values) / len(values)
+    return profile
+
+
+def transcode_speed(codec):
+    with _lock:
+        return _codecs.get(codec) or DEFAULT_TRANSCODE_SPEED
+
+
+def estimate_job_seconds(host, est_bytes=None, duration=None, codec=None):
+    """Expected wall-clock seconds for one job from host."""
+    profile = host_profile(host)
+    seconds = profile['overhead'] + (est_bytes or profile['job_bytes']) / profile['throughput']
+    if codec and duration:
+        seconds += duration / transcode_speed(codec)
+    return seconds
+
+
+def schedule_finish_times(running, pending, parallel):
+    """
+    Finish time of each job when pending jobs start, in order, on the first
+    of `parallel` workers to free up; running jobs hold workers until their
+    remaining seconds pass. Both are lists of (key, seconds).
+
+    Returns the finish times by key and the workers' final free times.
+    """
+    workers = [seconds for _, seconds in running]
+    finish = dict(running)
+    workers += [0.0] * max(parallel - len(workers), 0)
+    heapq.heapify(workers)
+    for key, seconds in pending:
+        finished = heapq.heappop(workers) + seconds
+        finish[key] = finished
+        heapq.heappush(workers, finished)
+    return finish, workers
+
+
+def estimate_batch_seconds(urls, parallel, codec=None):
+    """Expected seconds for a batch of URLs before any metadata is known."""
+    pending = [(i, estimate_job_seconds(url_host(url), codec=codec)) for i, url in enumerate(urls)]
+    return max(schedule_finish_times([], pending, parallel)[0].values(), default=0.0)
+
+
+def format_seconds(seconds):
+    """Rough human duration: '40s', '12 min', '2 h 05 min'."""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} min"
+    return f"{seconds // 3600} h {seconds % 3600 // 60:02d} min"
+
+
+def throughput_stats():
+    """One dict per measured host, plus transcode speeds by codec."""
+    with _lock:
+        hosts = [dict(history, host=host) for host, history in _hosts.items()]
+        return {'hosts': hosts, 'codecs': dict(_codecs)}
+
+
+class BatchEstimate:
+    """
+    Live time estimate for one running batch.
+
+    add() registers a job with whatever is known about it, start() and the
+    hook(position) progress hook track it while it runs, and finish() drops
+    it. Jobs the batch has not streamed yet (total minus those registered)
+    are estimated from history alone.
+    """
+
+    def __init__(self, total, parallel, codec=None):
+        self._lock = threading.Lock()
+        self.total = total
+        self.parallel = parallel
+        self.codec = codec
+        self._jobs = {}
+        self._finished = 0
+
+    def add(self, position, url, est_bytes=None, duration=None):
+        seconds = estimate_job_seconds(url_host(url), est_bytes, duration, self.codec)
+        with self._lock:
+            job = self._jobs.setdefault(position, {'started': None, 'downloaded': 0, 'total_bytes': None, 'speed': None})
+            job.update(seconds=seconds, duration=duration)
+
+    def start(self, position):
+        with self._lock:
+            if position in self._jobs:
+                self._jobs[position]['started'] = time.time()
+
+    def finish(self, position):
+        with self._lock:
+            self._jobs.pop(position, None)
+            self._finished += 1
+
+    def hook(self, position):
+        """Progress hook feeding a job's bytes and speed into the estimate."""
+        def update(d):
+            if d['status'] != 'downloading':
+                return
+            with self._lock:
+                job = self._jobs.get(position)
+                if job is not None:
+                    job['downloaded'] = d.get('downloaded_bytes') or 0
+                    job['total_bytes'] = d.get('total_bytes') or d.get('total_bytes_estimate')
+                    job['speed'] = d.get('speed')
+        update.thread_safe = True
+        return update
+
+    def _remaining(self, job, now):
+        if job['speed'] and job['total_bytes']:
+            seconds = max(job['total_bytes'] - job['downloaded'], 0) / job['speed']
+            if self.codec and job['duration']:
+                seconds += job['duration'] / transcode_speed(self.codec)
+            return seconds
+        return max(job['seconds'] - (now - job['started']), 0.0)
+
+    def _schedule(self):
+        now = time.time()
+        with self._lock:
+            running = [(p, self._remaining(j, now)) for p, j in self._jobs.items() if j['started']]
+            pending = [(p, j['seconds']) for p, j in self._jobs.items() if not j['started']]
+            unseen = max(self.total - self._finished - len(self._jobs), 0)
+        finish, workers = schedule_finish_times(running, pending, self.parallel)
+        return finish, workers, unseen
+
+    def etas(self):
+        """Seconds until each registered job finishes, by position."""
+        return self._schedule()[0]
+
+    def remaining_seconds(self):
+        """Seconds until the whole batch is expected to finish."""
+        finish, workers, unseen = self._schedule()
+        remaining = max(finish.values(), default=0.0)
+        if unseen:
+            # Jobs not streamed yet are spread evenly over the workers once they free up
+            per_job = estimate_job_seconds("", codec=self.codec)
+            remaining = max(remaining, sum(workers) / len(workers) + unseen * per_job / self.parallel)
+        return remaining
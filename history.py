@@ -0,0 +1,188 @@
+"""
+Persistent download history.
+
+Every download the engine finishes, from any session, API job, CLI batch
+or worker, is one row in a SQLite database (YTDLP_HISTORY_DB): the full
+URL, its (extractor, id), title, options, file count and bytes, start and
+finish times and, for failures, the error and its category. The History
+tab pages through and searches it, and stats() aggregates throughput and
+failures over any period for capacity planning.
+
+Recording is best-effort: a history database that cannot be written never
+fails a download.
+"""
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+HISTORY_PATH = os.environ.get("YTDLP_HISTORY_DB") or os.path.join(
+    os.environ.get("YTDLP_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "ytdlp-jobs"), "history.sqlite"
+)
+# Rows per History tab page
+PAGE_SIZE = 20
+
+_lock = threading.Lock()
+_conn = None
+
+_LIKE_SPECIAL_RE = re.compile(r'[\\%_]')
+
+_COLUMNS = ("id", "url", "extractor", "media_id", "title", "status", "error_category", "error",
+            "files", "bytes", "started_at", "finished_at", "options", "session", "source")
+
+
+def _connection():
+    """The process's history connection, opened (and the schema created) on first use."""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(HISTORY_PATH)), exist_ok=True)
+        conn = sqlite3.connect(HISTORY_PATH, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                extractor TEXT,
+                media_id TEXT,
+                title TEXT,
+                status TEXT NOT NULL,
+                error_category TEXT,
+                error TEXT,
+                files INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                finished_at REAL NOT NULL,
+                options TEXT,
+                session TEXT,
+                source TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_started ON downloads (started_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_media ON downloads (extractor, media_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_status ON downloads (status, error_category)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_session ON downloads (session, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_title ON downloads (title COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_url ON downloads (url COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS downloads_media_id ON downloads (media_id)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def record(url, status, started_at, finished_at=None, extractor=None, media_id=None, title=None,
+           files=0, nbytes=0, error=None, error_category=None, options=None, session=None, source=None):
+    """Add one finished download (status 'success' or 'error') to the history."""
+    row = (url, extractor, media_id, title, status, error_category, error, files, nbytes,
+           started_at, finished_at or time.time(), json.dumps(options, default=str) if options else None,
+           session, source)
+    try:
+        with _lock:
+            conn = _connection()
+            conn.execute(
+                f"INSERT INTO downloads ({', '.join(_COLUMNS[1:])}) VALUES ({', '.join('?' * len(row))})", row
+            )
+            conn.commit()
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _where(query=None, status=None, session=None, since=None):
+    clauses, params = [], []
+    if query:
+        # Prefix LIKEs can use the NOCASE title and url indexes; a leading wildcard could not
+        prefix = _LIKE_SPECIAL_RE.sub(r'\\\g<0>', query) + '%'
+        clauses.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\' OR media_id = ?)")
+        params += [prefix, prefix, query]
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if session:
+        clauses.append("session = ?")
+        params.append(session)
+    if since:
+        clauses.append("started_at >= ?")
+        params.append(since)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def search(query=None, status=None, session=None, offset=0, limit=PAGE_SIZE):
+    """
+    One page of history, newest first, and the number of matching rows.
+
+    query matches the start of titles and URLs (case-insensitive) or an exact
+    media id; every branch is answered from an index.
+    """
+    where, params = _where(query, status, session)
+    with _lock:
+        conn = _connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM downloads{where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM downloads{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+    entries = []
+    for row in rows:
+        entry = dict(zip(_COLUMNS, row))
+        entry['options'] = json.loads(entry['options']) if entry['options'] else {}
+        entries.append(entry)
+    return entries, total
+
+
+def stats(since=None, session=None):
+    """
+    Aggregates over downloads started since a timestamp (default: all).
+
+    Returns totals, average throughput of successful downloads, failures by
+    error category, and per-extractor and per-day breakdowns.
+    """
+    where, params = _where(session=session, since=since)
+    with _lock:
+        conn = _connection()
+        downloads, successes, nbytes, seconds = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(status = 'success'), 0), "
+            "COALESCE(SUM(CASE WHEN status = 'success' THEN bytes END), 0), "
+            "COALESCE(SUM(CASE WHEN status = 'success' THEN finished_at - started_at END), 0) "
+            f"FROM downloads{where}", params
+        ).fetchone()
+        failure_where = where + (" AND " if where else " WHERE ") + "status != 'success'"
+        categories = conn.execute(
+            f"SELECT COALESCE(error_category, 'Unknown'), COUNT(*) FROM downloads{failure_where} "
+            "GROUP BY 1 ORDER BY 2 DESC", params
+        ).fetchall()
+        extractors = conn.execute(
+            "SELECT COALESCE(extractor, 'Unknown'), COUNT(*), SUM(status = 'success'), "
+            "COALESCE(SUM(CASE WHEN status = 'success' THEN bytes END), 0) "
+            f"FROM downloads{where} GROUP BY 1 ORDER BY 2 DESC LIMIT 10", params
+        ).fetchall()
+        days = conn.execute(
+            "SELECT date(started_at, 'unixepoch', 'localtime'), COUNT(*), SUM(status = 'success'), "
+            "COALESCE(SUM(CASE WHEN status = 'success' THEN bytes END), 0) "
+            f"FROM downloads{where} GROUP BY 1 ORDER BY 1", params
+        ).fetchall()
+    return {
+        'downloads': downloads,
+        'successes': successes,
+        'failures': downloads - successes,
+        'bytes': nbytes,
+        'seconds': seconds,
+        # Bytes per second of job wall time, including extraction and post-processing
+        'throughput': nbytes / seconds if seconds else None,
+        'failure_categories': categories,
+        'extractors': [
+            {'extractor': name, 'downloads': count, 'successes': ok, 'bytes': total}
+            for name, count, ok, total in extractors
+        ],
+        'days': [{'day': day, 'downloads': count, 'successes': ok, 'bytes': total} for day, count, ok, total in days],
+    }
+
+
+def clear(session=None):
+    """Delete history rows, only one session's when given."""
+    where, params = _where(session=session)
+    with _lock:
+        conn = _connection()
+        conn.execute(f"DELETE FROM downloads{where}", params)
+        conn.commit()
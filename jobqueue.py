@@ -0,0 +1,314 @@
+"""
+Shared job queue for spreading batch downloads across worker processes.
+
+The queue is a SQLite database that every node can open (a shared volume, or
+a local file for several workers on one host). The UI, API or CLI enqueue
+URLs; any number of `python cli.py worker` processes lease jobs, heartbeat
+while downloading and record results back for delivery.
+
+A job whose worker stops heartbeating is leased again once its lease expires,
+until it has been leased max_attempts times; then it fails.
+"""
+import json
+import os
+import platform
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import engine
+
+QUEUE_PATH = os.environ.get("YTDLP_QUEUE_DB") or os.path.join(engine.JOBS_DIR, "queue.sqlite")
+# Seconds a lease stays valid without a heartbeat
+DEFAULT_LEASE_SECONDS = 120
+# Workers renew leases this often, well inside the lease window
+HEARTBEAT_INTERVAL = 30
+# Seconds an idle worker waits before polling the queue again
+IDLE_POLL_INTERVAL = 5
+# Attempts per URL before a retryable failure becomes final
+DEFAULT_MAX_ATTEMPTS = 3
+# Error categories (from categorize_error) worth retrying on another node
+RETRYABLE_ERRORS = ("Network Error", "Rate Limit Error", "Proxy Error", "SSL Error")
+# Jobs inserted per enqueue transaction
+ENQUEUE_CHUNK = 500
+# Seconds a worker backs off when the queue stays locked past the connection timeout
+QUEUE_BUSY_BACKOFF = 5
+
+
+def open_queue(path=QUEUE_PATH):
+    """Open (creating if needed) the shared queue database."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Writers take short exclusive transactions; wait out other nodes' locks
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS queue_jobs (
+            id TEXT PRIMARY KEY,
+            batch_id TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            url TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            lease_owner TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            result TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            UNIQUE (batch_id, identity)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS queue_jobs_lease ON queue_jobs (status, lease_expires)")
+    conn.execute("CREATE INDEX IF NOT EXISTS queue_jobs_batch ON queue_jobs (batch_id, status)")
+    return conn
+
+
+def enqueue_urls(conn, urls, options=None, batch_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS, stats=None):
+    """
+    Validate, deduplicate and enqueue URLs as one batch; returns the batch id.
+
+    Unsupported URLs are skipped (counted in stats['rejected']); duplicates
+    within the batch are merged as in the local Batch tab. Validation and
+    playlist expansion run outside any transaction; jobs are inserted
+    ENQUEUE_CHUNK at a time in short ones, so workers are never locked out
+    for long (and see the first jobs while the rest are still being read).
+    """
+    settings = engine.normalize_batch_settings(options)
+    settings_json = json.dumps(settings)
+    batch_id = batch_id or uuid.uuid4().hex[:12]
+    if stats is None:
+        stats = engine.new_canonicalize_stats()
+    stats.setdefault('rejected', 0)
+
+    def valid_urls():
+        for url in urls:
+            if engine.validate_url(url)[0]:
+                yield url
+            else:
+                stats['rejected'] += 1
+
+    # Claims not yet written; duplicates of earlier chunks are caught by the UNIQUE key
+    pending = {}
+
+    def claim(identity, url):
+        key = json.dumps(list(identity))
+        if key in pending:
+            return False
+        pending[key] = (url, time.time())
+        return True
+
+    def flush():
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for identity, (url, now) in pending.items():
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO queue_jobs "
+                    "(id, batch_id, identity, url, settings, max_attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (uuid.uuid4().hex, batch_id, identity, url, settings_json, max_attempts, now, now)
+                )
+                if not cursor.rowcount:
+                    stats['merged'] += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        pending.clear()
+
+    for _ in engine.iter_unique_urls(valid_urls(), claim, settings['expand_playlists'], stats):
+        if len(pending) >= ENQUEUE_CHUNK:
+            flush()
+    if pending:
+        flush()
+    return batch_id
+
+
+def lease_jobs(conn, worker_id, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Atomically lease up to `limit` queued (or lease-expired) jobs for a worker.
+
+    Each lease counts as an attempt: a lease-expired job that has used up its
+    max_attempts is marked failed instead of being leased again, so a URL
+    that keeps killing its workers cannot cycle forever.
+    Returns a list of dicts with 'id', 'batch_id', 'url' and 'settings'.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exhausted = conn.execute(
+            "SELECT id, url, attempts FROM queue_jobs "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+            (now,)
+        ).fetchall()
+        for job_id, url, attempts in exhausted:
+            result = {"url": url, "title": "Failed", "status": "error",
+                      "error": f"Lease Expired: no worker finished this job in {attempts} attempts"}
+            conn.execute(
+                "UPDATE queue_jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                "result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), now, job_id)
+            )
+        rows = conn.execute(
+            "SELECT id, batch_id, url, settings FROM queue_jobs "
+            "WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+            "ORDER BY created_at LIMIT ?",
+            (now, limit)
+        ).fetchall()
+        for job_id, _, _, _ in rows:
+            conn.execute(
+                "UPDATE queue_jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, job_id)
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [
+        {'id': job_id, 'batch_id': batch_id, 'url': url, 'settings': json.loads(settings)}
+        for job_id, batch_id, url, settings in rows
+    ]
+
+
+def heartbeat(conn, worker_id, job_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Extend the leases a worker still owns; returns the ids it lost."""
+    now = time.time()
+    lost = []
+    for job_id in job_ids:
+        cursor = conn.execute(
+            "UPDATE queue_jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (now + lease_seconds, now, job_id, worker_id)
+        )
+        if not cursor.rowcount:
+            lost.append(job_id)
+    return lost
+
+
+def complete_job(conn, worker_id, job_id, result, node=None):
+    """
+    Record a worker's result for a leased job.
+
+    Retryable failures go back to the queue until max_attempts is reached.
+    Results from a worker that no longer owns the lease are ignored.
+    """
+    now = time.time()
+    result = dict(result, node=node or platform.node())
+    status = "done" if result['status'] == "success" else "failed"
+    retry = status == "failed" and str(result.get('error', '')).startswith(RETRYABLE_ERRORS)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT attempts, max_attempts FROM queue_jobs WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (job_id, worker_id)
+        ).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return False
+        attempts, max_attempts = row
+        if retry and attempts < max_attempts:
+            status = "queued"
+        conn.execute(
+            "UPDATE queue_jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+            "result = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result), now, job_id)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
+
+def batch_progress(conn, batch_id):
+    """Counts of a batch's jobs by status (queued/leased/done/failed)."""
+    counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+    counts.update(conn.execute(
+        "SELECT status, COUNT(*) FROM queue_jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+    ).fetchall())
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+def iter_batch_results(conn, batch_id, status=None):
+    """Yield finished job results of a batch (optionally one status) in enqueue order."""
+    query = "SELECT url, status, result FROM queue_jobs WHERE batch_id = ? AND result IS NOT NULL"
+    params = [batch_id]
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    for url, job_status, result in conn.execute(query + " ORDER BY created_at", params):
+        yield dict(json.loads(result), url=url, queue_status=job_status)
+
+
+def run_worker(queue_path=QUEUE_PATH, output_dir=None, parallel=3, worker_id=None,
+               lease_seconds=DEFAULT_LEASE_SECONDS, stop_event=None, on_result=None):
+    """
+    Lease and download queued jobs until stop_event is set.
+
+    Up to `parallel` jobs run at once in a thread pool; this thread alone
+    talks to the queue, leasing work, renewing leases every HEARTBEAT_INTERVAL
+    seconds and recording results. A queue that stays locked (another node
+    writing) is retried after QUEUE_BUSY_BACKOFF seconds, keeping finished
+    results until they are recorded. Outputs are written under output_dir,
+    which should be shared storage if other nodes must deliver the files.
+    """
+    worker_id = worker_id or f"{platform.node()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    output_dir = os.path.abspath(output_dir or os.path.join(engine.JOBS_DIR, "worker-output"))
+    stop_event = stop_event or threading.Event()
+    conn = open_queue(queue_path)
+    in_flight = {}
+    # (job, result) pairs finished but not yet recorded in the queue
+    unrecorded = []
+    last_heartbeat = time.time()
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        while not stop_event.is_set() or in_flight or unrecorded:
+            busy = False
+            while unrecorded:
+                job, result = unrecorded[0]
+                try:
+                    complete_job(conn, worker_id, job['id'], result)
+                except sqlite3.OperationalError:
+                    busy = True
+                    break
+                unrecorded.pop(0)
+                if on_result:
+                    on_result(job, result)
+
+            if not busy and not stop_event.is_set() and len(in_flight) < parallel:
+                try:
+                    jobs = lease_jobs(conn, worker_id, parallel - len(in_flight), lease_seconds)
+                except sqlite3.OperationalError:
+                    jobs, busy = [], True
+                for job in jobs:
+                    batch_dir = os.path.join(output_dir, job['batch_id'])
+                    future = executor.submit(
+                        engine.download_single_url, job['url'], batch_dir, job['settings'], job['id']
+                    )
+                    in_flight[future] = job
+
+            if not in_flight:
+                if busy:
+                    time.sleep(QUEUE_BUSY_BACKOFF)
+                else:
+                    stop_event.wait(IDLE_POLL_INTERVAL)
+                continue
+
+            timeout = QUEUE_BUSY_BACKOFF if busy else HEARTBEAT_INTERVAL
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                unrecorded.append((job, future.result()))
+
+            leased = [j['id'] for j in in_flight.values()] + [job['id'] for job, _ in unrecorded]
+            if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL and leased:
+                try:
+                    heartbeat(conn, worker_id, leased, lease_seconds)
+                    last_heartbeat = time.time()
+                except sqlite3.OperationalError:
+                    pass
+
+    conn.close()
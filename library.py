@@ -0,0 +1,227 @@
+"""
+Persistent output library.
+
+When YTDLP_LIBRARY_DIR is set, downloads run with the 'library' setting
+have their finished files renamed out of the job's temporary directory
+into the library instead of being deleted with it. Each video gets its
+own directory under two levels of hash shards,
+
+    <library>/3f/a2/Youtube-dQw4w9WgXcQ/<files>
+
+so no directory holds more than a few hundred entries however large the
+library grows. Moves are os.replace() renames, which are atomic and copy
+nothing when the library is on the same filesystem as the job directories
+(point YTDLP_JOBS_DIR and TMPDIR there); across filesystems a file is
+copied next to its destination and renamed into place, so readers never
+see a partial file either way.
+
+An index (library.sqlite in the library) maps (extractor, id), title and
+uploader to each video's directory and files, with their checksums.
+"""
+import errno
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+LIBRARY_DIR = os.environ.get("YTDLP_LIBRARY_DIR") or None
+INDEX_NAME = "library.sqlite"
+# Hex digits per shard level, and shard levels above each video's directory
+SHARD_WIDTH = 2
+SHARD_DEPTH = 2
+
+_lock = threading.Lock()
+_conn = None
+_conn_dir = None
+
+_UNSAFE_CHARS_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+_LIKE_SPECIAL_RE = re.compile(r'[\\%_]')
+_COLUMNS = ("extractor", "media_id", "title", "uploader", "duration", "webpage_url", "path", "files",
+            "bytes", "added_at")
+
+
+def enabled():
+    return bool(LIBRARY_DIR)
+
+
+def set_library_dir(path):
+    """Use path as the library (None disables it)."""
+    global LIBRARY_DIR
+    LIBRARY_DIR = os.path.abspath(path) if path else None
+
+
+def item_path(extractor, media_id):
+    """A video's directory relative to the library root."""
+    digest = hashlib.sha1(f"{extractor}:{media_id}".encode('utf-8')).hexdigest()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    name = _UNSAFE_CHARS_RE.sub('_', f"{extractor}-{media_id}")[:100]
+    return os.path.join(*shards, name)
+
+
+def move_file(src, dst):
+    """Atomically move src to dst, copying only when they are on different filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        staged = os.path.join(os.path.dirname(dst), f".{uuid.uuid4().hex}.part")
+        try:
+            shutil.copyfile(src, staged)
+            os.replace(staged, dst)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        os.remove(src)
+
+
+def _connection():
+    """The index connection for the current library, opened on first use."""
+    global _conn, _conn_dir
+    if _conn is None or _conn_dir != LIBRARY_DIR:
+        if _conn is not None:
+            _conn.close()
+        os.makedirs(LIBRARY_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(LIBRARY_DIR, INDEX_NAME), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                extractor TEXT NOT NULL,
+                media_id TEXT NOT NULL,
+                title TEXT,
+                uploader TEXT,
+                duration REAL,
+                webpage_url TEXT,
+                path TEXT NOT NULL,
+                files TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (extractor, media_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS items_title ON items (title COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS items_media ON items (media_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS items_uploader ON items (uploader COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS items_added ON items (added_at)")
+        conn.commit()
+        _conn, _conn_dir = conn, LIBRARY_DIR
+    return _conn
+
+
+def _item(row):
+    item = dict(zip(_COLUMNS, row))
+    item['files'] = json.loads(item['files'])
+    item['path'] = os.path.join(_conn_dir, item['path'])
+    return item
+
+
+def _videos(info):
+    """The video info dicts of a download: info itself, or a playlist's entries."""
+    if info.get('entries') is None:
+        yield info
+        return
+    for entry in info['entries']:
+        if entry:
+            yield from _videos(entry)
+
+
+def add(info, entries):
+    """
+    Move a finished download's files into the library and index them.
+
+    entries is the download's manifest (see manifest.py); the same entries
+    pointing into the library are returned. A playlist's files are filed
+    under each of its videos. Files whose video has no extractor and id
+    cannot be indexed and are left where they are.
+    """
+    if not LIBRARY_DIR or not entries:
+        return entries
+    videos = {(video.get('extractor_key'), str(video.get('id'))): video for video in _videos(info)}
+    by_video = {}
+    for entry in entries:
+        by_video.setdefault((entry.get('extractor'), str(entry.get('media_id'))), []).append(entry)
+    moved = []
+    for key, video_entries in by_video.items():
+        video = videos.get(key)
+        moved.extend(_add_video(video, video_entries) if video else video_entries)
+    return moved
+
+
+def _add_video(info, entries):
+    """File one video's entries under its own directory."""
+    extractor, media_id = info.get('extractor_key'), info.get('id')
+    if not extractor or media_id is None:
+        return entries
+    relative = item_path(extractor, media_id)
+    directory = os.path.join(LIBRARY_DIR, relative)
+    os.makedirs(directory, exist_ok=True)
+    moved = []
+    for entry in entries:
+        target = os.path.join(directory, entry['filename'])
+        move_file(entry['path'], target)
+        moved.append(dict(entry, path=target))
+
+    with _lock:
+        conn = _connection()
+        row = conn.execute(
+            "SELECT files FROM items WHERE extractor = ? AND media_id = ?", (extractor, str(media_id))
+        ).fetchone()
+        # Earlier downloads of the same video (another format, say) stay listed
+        indexed = {f['filename']: f for f in json.loads(row[0])} if row else {}
+        for entry in moved:
+            indexed[entry['filename']] = {key: entry[key] for key in ('filename', 'size', 'kind', 'sha256')}
+        files = sorted(indexed.values(), key=lambda f: f['filename'])
+        conn.execute(
+            f"INSERT OR REPLACE INTO items ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            (extractor, str(media_id), info.get('title'), info.get('uploader') or info.get('channel'),
+             info.get('duration'), info.get('webpage_url'), relative, json.dumps(files),
+             sum(f['size'] for f in files), time.time())
+        )
+        conn.commit()
+    return moved
+
+
+def lookup(extractor, media_id):
+    """The indexed item for a video, or None."""
+    if not LIBRARY_DIR:
+        return None
+    with _lock:
+        row = _connection().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM items WHERE extractor = ? AND media_id = ?",
+            (extractor, str(media_id))
+        ).fetchone()
+        return _item(row) if row else None
+
+
+def search(query=None, uploader=None, offset=0, limit=50):
+    """
+    Indexed items, newest first, and the number matching.
+
+    query matches the start of titles or an exact media id; uploader matches
+    the uploader name. Both are case-insensitive and answered from indexes.
+    """
+    if not LIBRARY_DIR:
+        return [], 0
+    clauses, params = [], []
+    if query:
+        # A prefix LIKE can use the NOCASE title index; a leading wildcard could not
+        clauses.append("(title LIKE ? ESCAPE '\\' OR media_id = ?)")
+        params += [_LIKE_SPECIAL_RE.sub(r'\\\g<0>', query) + '%', query]
+    if uploader:
+        clauses.append("uploader = ? COLLATE NOCASE")
+        params.append(uploader)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    with _lock:
+        conn = _connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM items{where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM items{where} ORDER BY added_at DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [_item(row) for row in rows], total
@@ -0,0 +1,97 @@
+"""
+Exact output manifests of downloads.
+
+yt-dlp runs its MoveFiles post-processor last for every video it
+downloads, with the final path of the media file and of every sidecar it
+kept (subtitles, thumbnails, extra renditions) in '__files_to_move'.
+OutputManifest listens for that hook, so a job's file list is exactly
+what yt-dlp produced: no leftover .part or temp files, and no directory
+scan.
+
+Checksums are opt-in (YTDLP_CHECKSUMS=1): hashing re-reads every finished
+file on the download thread, which costs as much disk I/O as the download
+wrote. When enabled, each file is hashed once as it is finalized, while it
+is still in the page cache, so later integrity checks and deduplication can
+compare checksums instead of re-reading files; otherwise 'sha256' is None.
+"""
+import hashlib
+import os
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+# Hash finished files for their manifest entries
+CHECKSUMS = os.environ.get("YTDLP_CHECKSUMS", "").lower() in ("1", "true", "yes")
+
+
+def file_checksum(path):
+    """SHA-256 hex digest of a file, read in CHUNK_SIZE blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def as_files(entries):
+    """(filename, path, size) tuples for manifest entries, as engine results carry them."""
+    return [(entry['filename'], entry['path'], entry['size']) for entry in entries]
+
+
+class OutputManifest:
+    """
+    Files one download produced, collected from yt-dlp post-processor hooks.
+
+    Pass hook to YoutubeDL.add_postprocessor_hook(); entries() then lists
+    one dict per file with 'filename', 'path', 'size', 'kind' (media,
+    subtitle, thumbnail, chapter or extra), 'format_id', 'sha256', and the
+    'extractor' and 'media_id' of the video it belongs to. 'sha256' is only
+    computed when checksums is true (default: CHECKSUMS).
+    """
+
+    def __init__(self, checksums=None):
+        self.checksums = CHECKSUMS if checksums is None else checksums
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def hook(self, d):
+        if d['status'] == 'finished' and d.get('postprocessor') == 'MoveFiles':
+            self._collect(d['info_dict'])
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def _collect(self, info):
+        # The hook gets the info dict as it was before the move; '__files_to_move'
+        # is shared with the post-processor and holds the final paths
+        final_dir = info.get('__finaldir') or os.path.dirname(info['filepath'])
+        kinds = {info['filepath']: "media"}
+        for sub in (info.get('requested_subtitles') or {}).values():
+            if sub.get('filepath'):
+                kinds[sub['filepath']] = "subtitle"
+        for thumbnail in info.get('thumbnails') or []:
+            if thumbnail.get('filepath'):
+                kinds[thumbnail['filepath']] = "thumbnail"
+        outputs = []
+        for old_path, new_path in (info.get('__files_to_move') or {}).items():
+            outputs.append((new_path or os.path.join(final_dir, os.path.basename(old_path)),
+                            kinds.get(old_path, "extra")))
+        for chapter in info.get('chapters') or []:
+            if chapter.get('filepath'):
+                outputs.append((chapter['filepath'], "chapter"))
+
+        for path, kind in outputs:
+            if not os.path.isfile(path):
+                continue
+            entry = {
+                'filename': os.path.basename(path),
+                'path': path,
+                'size': os.path.getsize(path),
+                'kind': kind,
+                'format_id': info.get('format_id') if kind in ("media", "chapter") else None,
+                'sha256': file_checksum(path) if self.checksums else None,
+                'extractor': info.get('extractor_key'),
+                'media_id': info.get('id'),
+            }
+            with self._lock:
+                self._entries[path] = entry
@@ -0,0 +1,325 @@
+"""
+Single-pass FFmpeg post-processing.
+
+yt-dlp runs audio extraction, metadata, thumbnail embedding and subtitle
+embedding as separate postprocessors, and each one rewrites the whole file.
+SinglePassFFmpegPP plans all of them into one ffmpeg invocation, which can
+also write extra renditions (other audio formats or lower resolutions) from
+the same decode of the downloaded file.
+
+Long flac transcodes can instead be split into time segments encoded by
+parallel ffmpeg processes and joined with the concat demuxer. Lossy codecs
+such as mp3 pad every encode with encoder delay and padding, which stream
+copy would keep at each join as an audible gap, so they are always encoded
+in one pass.
+"""
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from yt_dlp import YoutubeDL
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import ACODECS, FFmpegExtractAudioPP, FFmpegMetadataPP
+from yt_dlp.utils import ISO639Utils, PostProcessingError, float_or_none, prepend_extension, replace_extension
+
+# Containers that take a cover image as an attached_pic video stream
+ATTACHED_PIC_EXTS = {'mp3', 'm4a', 'mp4', 'mov', 'flac'}
+# Containers that take a cover image as an attachment
+ATTACHMENT_EXTS = {'mkv', 'mka'}
+# Subtitle codec to use when muxing into each container (None = copy as is)
+SUBTITLE_CODECS = {'mp4': 'mov_text', 'mov': 'mov_text', 'm4v': 'mov_text', 'mkv': None, 'webm': None}
+# Stream types kept by '-map 0 -dn -ignore_unknown'
+KEPT_STREAM_TYPES = {'video', 'audio', 'subtitle', 'attachment'}
+THUMBNAIL_MIMETYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+# Encoding for lower-resolution renditions ("720p", "360p", ...)
+VIDEO_RENDITION_EXT = 'mp4'
+VIDEO_RENDITION_OPTS = ('-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-c:a', 'aac')
+# Segment-parallel transcoding applies to media at least this long (seconds)...
+SEGMENT_MIN_DURATION = 20 * 60
+# ...cut into segments no shorter than this
+SEGMENT_MIN_SECONDS = 5 * 60
+# Codecs whose independently encoded segments join gaplessly with stream copy
+SEGMENTABLE_CODECS = ('flac',)
+
+
+def segment_count(duration, workers):
+    """Number of segments to split a transcode of `duration` seconds into."""
+    if not duration or not workers:
+        return 1
+    return max(1, min(workers, int(duration // SEGMENT_MIN_SECONDS)))
+
+
+class SinglePassFFmpegPP(FFmpegMetadataPP):
+    """
+    Extract audio, add metadata and chapters, and embed the thumbnail and
+    subtitles in a single ffmpeg run.
+
+    The source file is probed once. Steps that the output container cannot
+    hold (e.g. a cover in .opus) are skipped; their sidecar files remain.
+
+    renditions lists extra outputs written next to the main one from the same
+    decode: audio formats ("mp3", "opus", ...) and heights ("720p", ...).
+    Renditions at or above the source height are skipped.
+
+    With segment_workers set, a transcode to a SEGMENTABLE_CODECS format of
+    media longer than SEGMENT_MIN_DURATION runs as up to that many parallel
+    segment encodes; the final pass then only concatenates and tags.
+
+    audio_quality is FFmpegExtractAudio's preferredquality (0-10 VBR, or a
+    bitrate in kbit/s) for audio that is transcoded.
+    """
+
+    # Same encoder quality mapping as FFmpegExtractAudio
+    _quality_args = FFmpegExtractAudioPP._quality_args
+
+    def __init__(self, downloader=None, audio_codec=None, add_metadata=False,
+                 embed_thumbnail=False, embed_subtitles=False, renditions=(), segment_workers=None,
+                 audio_quality=None):
+        FFmpegMetadataPP.__init__(self, downloader, add_metadata=add_metadata,
+                                  add_chapters=add_metadata, add_infojson=False)
+        self._audio_codec = audio_codec
+        self._embed_thumbnail = embed_thumbnail
+        self._embed_subtitles = embed_subtitles
+        self._renditions = list(renditions)
+        self._segment_workers = segment_workers
+        self._preferredquality = float_or_none(audio_quality)
+
+    @PostProcessor._restrict_to(images=False)
+    def run(self, info):
+        self._fixup_chapters(info)
+        path = info['filepath']
+        probe = self.get_metadata_object(path)
+        streams = probe['streams']
+        inputs, input_options, options, files_to_delete = [path], [], [], []
+
+        if self._audio_codec:
+            ext, options = self._audio_options(streams, self._audio_codec)
+            kept_streams = 1
+            container = 'adts' if '-f' in options else ext
+        else:
+            ext = container = info['ext']
+            options = ['-map', '0', '-dn', '-ignore_unknown', '-c', 'copy']
+            kept_streams = sum(1 for s in streams if s.get('codec_type') in KEPT_STREAM_TYPES)
+        new_path = replace_extension(path, ext, info['ext'])
+        transcoding = '-c:a' in options and options[options.index('-c:a') + 1] != 'copy'
+
+        duration = float(probe.get('format', {}).get('duration') or info.get('duration') or 0)
+        if (transcoding and self._segment_workers and not self._renditions
+                and self._audio_codec in SEGMENTABLE_CODECS and duration >= SEGMENT_MIN_DURATION
+                and segment_count(duration, self._segment_workers) > 1):
+            concat_path, segment_paths = self.transcode_segments(path, self._audio_codec, duration)
+            # The main output now just joins the encoded segments
+            inputs[0], input_options = concat_path, ['-f', 'concat', '-safe', '0']
+            options[options.index('-c:a') + 1] = 'copy'
+            files_to_delete.extend([concat_path, *segment_paths])
+
+        # Chapters are read from an FFMETADATA file, which must be input 1;
+        # file-level tags are shared with every rendition
+        shared_options = []
+        if self._add_chapters and info.get('chapters'):
+            metadata_filename = replace_extension(path, 'meta')
+            shared_options.extend(itertools.chain.from_iterable(
+                self._get_chapter_opts(info['chapters'], metadata_filename)))
+            inputs.append(metadata_filename)
+            files_to_delete.append(metadata_filename)
+        if self._add_metadata:
+            for opt in self._get_metadata_opts(info):
+                if not opt[0].startswith('-metadata:s:'):
+                    shared_options.extend(opt)
+                # Per-stream tags are planned from the requested formats; drop
+                # those for streams that audio extraction leaves out
+                elif int(opt[0].rsplit(':', 1)[1]) < kept_streams:
+                    options.extend(opt)
+        options.extend(shared_options)
+
+        attach_thumbnail = None
+        thumbnail = self._thumbnail_path(info) if self._embed_thumbnail else None
+        if thumbnail and container in ATTACHED_PIC_EXTS:
+            options.extend(self._attached_pic_options(len(inputs), kept_streams, thumbnail, container))
+            inputs.append(thumbnail)
+            kept_streams += 1
+        elif thumbnail and container in ATTACHMENT_EXTS:
+            # -attach streams come after every mapped stream; added below
+            attach_thumbnail = thumbnail
+        elif thumbnail:
+            self.to_screen(f'Cannot embed a thumbnail in .{container}; keeping it as a separate file')
+
+        if self._embed_subtitles and info.get('requested_subtitles'):
+            if not self._audio_codec and container in SUBTITLE_CODECS:
+                for lang, sub in info['requested_subtitles'].items():
+                    if not sub.get('filepath') or not os.path.exists(sub['filepath']):
+                        continue
+                    if container == 'webm' and sub.get('ext') != 'vtt':
+                        continue
+                    options.extend(['-map', f'{len(inputs)}:0'])
+                    if SUBTITLE_CODECS[container]:
+                        options.extend([f'-c:{kept_streams}', SUBTITLE_CODECS[container]])
+                    lang = ISO639Utils.short2long(lang.split('-')[0]) or lang
+                    options.extend([f'-metadata:s:{kept_streams}', f'language={lang}'])
+                    inputs.append(sub['filepath'])
+                    kept_streams += 1
+            else:
+                self.to_screen(f'Cannot embed subtitles in .{container}; keeping them as separate files')
+
+        if attach_thumbnail:
+            thumbnail_ext = os.path.splitext(attach_thumbnail)[1][1:].lower()
+            options.extend([
+                '-attach', self._ffmpeg_filename_argument(attach_thumbnail),
+                f'-metadata:s:{kept_streams}', f'mimetype={THUMBNAIL_MIMETYPES.get(thumbnail_ext, "image/jpeg")}',
+                f'-metadata:s:{kept_streams}', f'filename=cover.{thumbnail_ext}',
+            ])
+
+        renditions = self._rendition_outputs(path, streams, shared_options, {new_path})
+
+        rewrite = (new_path != path or transcoding or len(inputs) > 1 or self._add_metadata
+                   or attach_thumbnail)
+        if not rewrite and not renditions:
+            self.to_screen('Nothing to post-process')
+            return [], info
+
+        temp_path = prepend_extension(new_path, 'temp')
+        outputs = [(prepend_extension(out, 'temp'), opts) for out, opts in renditions]
+        if rewrite:
+            outputs.insert(0, (temp_path, options))
+        self.to_screen(f'Post-processing "{path}" in one pass')
+        self.real_run_ffmpeg(
+            [(inputs[0], input_options)] + [(input_path, []) for input_path in inputs[1:]], outputs)
+        self._delete_downloaded_files(*files_to_delete)
+        for out, _ in renditions:
+            os.replace(prepend_extension(out, 'temp'), out)
+            # Kept with the main file by MoveFiles, and so listed in the job's manifest
+            info['__files_to_move'].setdefault(out, '')
+        if not rewrite:
+            return [], info
+        os.replace(temp_path, new_path)
+        info['filepath'] = new_path
+        info['ext'] = ext
+        return ([path] if new_path != path else []), info
+
+    def transcode_segments(self, path, codec, duration):
+        """
+        Encode the audio of path as codec in parallel time segments.
+
+        Each segment is a separate ffmpeg process. Returns the path of an
+        ffconcat file listing the segments, and the segment paths.
+        """
+        ext, acodec, more_opts = ACODECS[codec]
+        more_opts = [*more_opts, *self._quality_args(acodec)]
+        count = segment_count(duration, self._segment_workers)
+        length = duration / count
+        segment_paths = [prepend_extension(replace_extension(path, ext), f'part{i}') for i in range(count)]
+
+        def encode_segment(i):
+            seek = ['-ss', f'{i * length:.3f}']
+            if i < count - 1:
+                seek.extend(['-t', f'{length:.3f}'])
+            self.real_run_ffmpeg(
+                [(path, seek)], [(segment_paths[i], ['-map', '0:a:0', '-c:a', acodec, *more_opts])])
+
+        self.to_screen(f'Transcoding {count} segments of "{path}" in parallel')
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            list(executor.map(encode_segment, range(count)))
+
+        concat_path = f'{path}.concat'
+        with open(concat_path, 'w', encoding='utf-8') as f:
+            f.writelines(self._concat_spec(segment_paths))
+        return concat_path, segment_paths
+
+    def _audio_options(self, streams, codec):
+        """Output extension and ffmpeg options to extract the audio as codec."""
+        audio_streams = [s for s in streams if s.get('codec_type') == 'audio']
+        if not audio_streams:
+            raise PostProcessingError('no audio stream to extract')
+        filecodec = audio_streams[0].get('codec_name')
+        if filecodec == 'aac' and codec == 'm4a':
+            # Lossless, but in another container
+            ext, _, more_opts = ACODECS['m4a']
+            acodec = 'copy'
+        elif codec == filecodec:
+            ext, _, more_opts = ACODECS[filecodec]
+            acodec = 'copy'
+        else:
+            ext, acodec, more_opts = ACODECS[codec]
+            more_opts = [*more_opts, *self._quality_args(acodec)]
+        return ext, ['-map', '0:a:0', '-c:a', acodec, *more_opts]
+
+    def _rendition_outputs(self, path, streams, shared_options, used_paths):
+        """(output path, ffmpeg options) for each extra rendition."""
+        source_height = max((s.get('height') or 0 for s in streams if s.get('codec_type') == 'video'), default=0)
+        outputs = []
+        for rendition in self._renditions:
+            if rendition in ACODECS:
+                ext, options = self._audio_options(streams, rendition)
+            else:
+                height = int(rendition.rstrip('p'))
+                if height >= source_height:
+                    self.to_screen(f'Skipping the {rendition} rendition; the source is {source_height}p')
+                    continue
+                ext = VIDEO_RENDITION_EXT
+                options = ['-map', '0:v:0', '-map', '0:a:0?', '-vf', f'scale=-2:{height}', *VIDEO_RENDITION_OPTS]
+            out_path = replace_extension(path, ext)
+            if out_path in used_paths:
+                out_path = replace_extension(path, f'{rendition}.{ext}')
+            used_paths.add(out_path)
+            outputs.append((out_path, options + shared_options))
+        return outputs
+
+    def _attached_pic_options(self, input_index, stream_index, thumbnail, container):
+        thumbnail_ext = os.path.splitext(thumbnail)[1][1:].lower()
+        # mp3/mp4 covers must be JPEG or PNG; convert anything else in the same pass
+        codec = 'copy' if thumbnail_ext in ('jpg', 'jpeg', 'png') else 'mjpeg'
+        options = [
+            '-map', f'{input_index}:0',
+            f'-c:{stream_index}', codec,
+            f'-disposition:{stream_index}', 'attached_pic',
+        ]
+        if container == 'mp3':
+            options.extend(['-id3v2_version', '3',
+                            f'-metadata:s:{stream_index}', 'title=Album cover',
+                            f'-metadata:s:{stream_index}', 'comment=Cover (front)'])
+        return options
+
+    @staticmethod
+    def _thumbnail_path(info):
+        for thumbnail in reversed(info.get('thumbnails') or []):
+            if thumbnail.get('filepath') and os.path.exists(thumbnail['filepath']):
+                return thumbnail['filepath']
+        return None
+
+
+def benchmark_transcode(path, codec='flac', workers=None):
+    """
+    Time a single-process transcode of path's audio against the
+    segment-parallel path. Outputs are deleted afterwards.
+
+    Returns a dict with the media duration, segment count and wall-clock
+    seconds for each path.
+    """
+    workers = workers or os.cpu_count()
+    pp = SinglePassFFmpegPP(YoutubeDL({'quiet': True, 'no_warnings': True}),
+                            audio_codec=codec, segment_workers=workers)
+    duration = float(pp.get_metadata_object(path)['format']['duration'])
+    ext, acodec, more_opts = ACODECS[codec]
+    single_path = replace_extension(path, f'single.{ext}')
+    segmented_path = replace_extension(path, f'segmented.{ext}')
+
+    started = time.perf_counter()
+    pp.real_run_ffmpeg([(path, [])], [(single_path, ['-map', '0:a:0', '-c:a', acodec, *more_opts])])
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    concat_path, segment_paths = pp.transcode_segments(path, codec, duration)
+    pp.real_run_ffmpeg([(concat_path, ['-f', 'concat', '-safe', '0'])], [(segmented_path, ['-c', 'copy'])])
+    segmented_seconds = time.perf_counter() - started
+
+    for temp_path in (single_path, segmented_path, concat_path, *segment_paths):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {
+        'duration': duration,
+        'segments': len(segment_paths),
+        'single_seconds': round(single_seconds, 2),
+        'segmented_seconds': round(segmented_seconds, 2),
+        'speedup': round(single_seconds / segmented_seconds, 2) if segmented_seconds else None,
+    }
@@ -0,0 +1,159 @@
+"""
+Proxy pool with health checks and latency-based selection.
+
+Every proxy a job can use is tracked process-wide: latency from periodic
+health checks, throughput from finished downloads, and recent outcomes.
+choose() hands each job the proxy with the lowest expected cost, counting
+jobs already assigned to it, so a large batch spreads across egress points.
+A proxy that fails EVICT_AFTER times in a row is evicted for
+EVICT_SECONDS; health checks readmit it early once it answers again.
+
+A server-wide pool can be configured with YTDLP_PROXIES (comma or
+whitespace separated); jobs may also bring their own list.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import requests
+
+DEFAULT_PROXIES = [p for p in re.split(r'[\s,]+', os.environ.get("YTDLP_PROXIES", "")) if p]
+# Small endpoint fetched through each proxy to measure latency
+HEALTH_CHECK_URL = os.environ.get("YTDLP_PROXY_CHECK_URL", "https://www.youtube.com/generate_204")
+HEALTH_CHECK_INTERVAL = 60
+HEALTH_CHECK_TIMEOUT = 10
+# Consecutive failures before a proxy is evicted, and for how long
+EVICT_AFTER = 3
+EVICT_SECONDS = 5 * 60
+# Outcomes kept per proxy for its error rate
+OUTCOME_WINDOW = 20
+# Weight of the recent error rate in a proxy's cost
+ERROR_WEIGHT = 4
+# Transfer size used to turn throughput into seconds when comparing proxies
+SCORE_BYTES = 8 * 1024 * 1024
+# Seconds every job costs regardless of proxy, so load spreads even between unmeasured proxies
+JOB_BASE_COST = 1.0
+# Smoothing factor for latency and throughput averages
+EWMA_ALPHA = 0.3
+
+
+def _ewma(previous, value):
+    return value if previous is None else previous + EWMA_ALPHA * (value - previous)
+
+
+class ProxyPool:
+    """Process-wide health and load state for every known proxy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._proxies = {}
+        self._checker = None
+
+    def add(self, proxies):
+        """Start tracking proxies (and health-checking them in the background)."""
+        with self._lock:
+            for proxy in proxies:
+                self._proxies.setdefault(proxy, {
+                    'latency': None,
+                    'throughput': None,
+                    'outcomes': deque(maxlen=OUTCOME_WINDOW),
+                    'failures': 0,
+                    'evicted_until': 0,
+                    'active': 0,
+                })
+            if self._proxies and self._checker is None:
+                self._checker = threading.Thread(target=self._check_forever, daemon=True)
+                self._checker.start()
+
+    def choose(self, proxies, exclude=()):
+        """
+        Assign the cheapest healthy proxy among `proxies`, skipping `exclude`.
+
+        Returns None when every candidate is evicted or excluded. Call
+        release() when the job is done with it.
+        """
+        self.add(proxies)
+        now = time.time()
+        with self._lock:
+            candidates = [p for p in proxies
+                          if p not in exclude and self._proxies[p]['evicted_until'] <= now]
+            if not candidates:
+                return None
+            proxy = min(candidates, key=lambda p: self._cost(self._proxies[p]))
+            self._proxies[proxy]['active'] += 1
+            return proxy
+
+    def release(self, proxy):
+        with self._lock:
+            state = self._proxies.get(proxy)
+            if state and state['active'] > 0:
+                state['active'] -= 1
+
+    def report(self, proxy, ok, latency=None, throughput=None):
+        """Record a health check or download outcome for a proxy."""
+        with self._lock:
+            state = self._proxies.get(proxy)
+            if state is None:
+                return
+            state['outcomes'].append(ok)
+            if latency is not None:
+                state['latency'] = _ewma(state['latency'], latency)
+            if throughput:
+                state['throughput'] = _ewma(state['throughput'], throughput)
+            if ok:
+                state['failures'] = 0
+                state['evicted_until'] = 0
+            else:
+                state['failures'] += 1
+                if state['failures'] >= EVICT_AFTER:
+                    state['evicted_until'] = time.time() + EVICT_SECONDS
+
+    def stats(self):
+        """One dict per proxy: latency, throughput, error rate, load and eviction."""
+        now = time.time()
+        with self._lock:
+            return [{
+                'proxy': proxy,
+                'latency': state['latency'],
+                'throughput': state['throughput'],
+                'error_rate': self._error_rate(state),
+                'active': state['active'],
+                'evicted': state['evicted_until'] > now,
+            } for proxy, state in self._proxies.items()]
+
+    def check(self, proxy):
+        """Fetch HEALTH_CHECK_URL through a proxy and record the result."""
+        started = time.time()
+        try:
+            response = requests.get(HEALTH_CHECK_URL, proxies={'http': proxy, 'https': proxy},
+                                    timeout=HEALTH_CHECK_TIMEOUT)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        self.report(proxy, ok, latency=time.time() - started if ok else None)
+        return ok
+
+    @staticmethod
+    def _error_rate(state):
+        outcomes = state['outcomes']
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def _cost(self, state):
+        # Unmeasured proxies count as instant, so new ones get tried first
+        cost = JOB_BASE_COST + (state['latency'] or 0.0)
+        if state['throughput']:
+            cost += SCORE_BYTES / state['throughput']
+        return cost * (1 + ERROR_WEIGHT * self._error_rate(state)) * (1 + state['active'])
+
+    def _check_forever(self):
+        while True:
+            with self._lock:
+                proxies = list(self._proxies)
+            for proxy in proxies:
+                self.check(proxy)
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+
+pool = ProxyPool()
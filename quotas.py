@@ -0,0 +1,161 @@
+"""
+Per-account download quotas and usage accounting.
+
+An account is a browser session (app.py) or an API key (api.py). Starting
+a job is refused while the account already runs MAX_JOBS jobs, has
+downloaded BYTES_PER_WINDOW in the last WINDOW_SECONDS, or keeps
+DISK_BYTES in its output directories; running batches check the byte and
+disk quotas again before each URL. Finished downloads are recorded with
+record_download().
+
+Limits come from the environment; setting one to 0 disables it.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MAX_JOBS = int(os.environ.get("YTDLP_QUOTA_JOBS") or 3)
+BYTES_PER_WINDOW = int(float(os.environ.get("YTDLP_QUOTA_WINDOW_GB") or 20) * 1024 ** 3)
+WINDOW_SECONDS = int(os.environ.get("YTDLP_QUOTA_WINDOW_SECONDS") or 3600)
+DISK_BYTES = int(float(os.environ.get("YTDLP_QUOTA_DISK_GB") or 10) * 1024 ** 3)
+# Seconds a measured directory size is reused before walking it again
+DISK_SCAN_INTERVAL = 10
+
+
+class QuotaExceeded(ValueError):
+    """An account is over one of its quotas; the message says which."""
+
+
+def directory_size(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _gb(nbytes):
+    return f"{nbytes / 1024 ** 3:.1f} GB"
+
+
+class QuotaManager:
+    """Usage and limits of every account in the process."""
+
+    def __init__(self, max_jobs=MAX_JOBS, bytes_per_window=BYTES_PER_WINDOW,
+                 window_seconds=WINDOW_SECONDS, disk_bytes=DISK_BYTES):
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+        self.bytes_per_window = bytes_per_window
+        self.window_seconds = window_seconds
+        self.disk_bytes = disk_bytes
+        self._accounts = {}
+
+    def start_job(self, account, directory=None):
+        """
+        Admit a job for account, counting it until finish_job().
+
+        directory is where the job writes; its size counts towards the
+        account's disk quota for as long as it exists. Raises QuotaExceeded.
+        """
+        disk = self._disk_usage(account)
+        with self._lock:
+            usage = self._account(account)
+            if self.max_jobs and usage['jobs'] >= self.max_jobs:
+                raise QuotaExceeded(f"{usage['jobs']} jobs already running (limit {self.max_jobs})")
+            self._check(usage, disk)
+            usage['jobs'] += 1
+            if directory:
+                usage['dirs'][os.path.abspath(directory)] = (0, 0)
+
+    def finish_job(self, account):
+        with self._lock:
+            usage = self._account(account)
+            usage['jobs'] = max(usage['jobs'] - 1, 0)
+
+    @contextmanager
+    def admit(self, account, directory=None):
+        """start_job() for the duration of a with block."""
+        self.start_job(account, directory)
+        try:
+            yield
+        finally:
+            self.finish_job(account)
+
+    def check(self, account):
+        """Raise QuotaExceeded if account is over its byte or disk quota."""
+        disk = self._disk_usage(account)
+        with self._lock:
+            self._check(self._account(account), disk)
+
+    def record_download(self, account, nbytes):
+        now = time.time()
+        with self._lock:
+            usage = self._account(account)
+            usage['window'].append((now, nbytes))
+            usage['downloads'] += 1
+            usage['bytes'] += nbytes
+
+    def usage(self, account):
+        """Current usage of an account next to its limits."""
+        disk = self._disk_usage(account)
+        with self._lock:
+            usage = self._account(account)
+            return {
+                'jobs': usage['jobs'],
+                'max_jobs': self.max_jobs,
+                'window_bytes': self._window_bytes(usage),
+                'bytes_per_window': self.bytes_per_window,
+                'window_seconds': self.window_seconds,
+                'disk_bytes': disk,
+                'disk_limit': self.disk_bytes,
+                'downloads': usage['downloads'],
+                'bytes': usage['bytes'],
+            }
+
+    def _account(self, account):
+        return self._accounts.setdefault(account, {
+            'jobs': 0, 'window': deque(), 'dirs': {}, 'downloads': 0, 'bytes': 0,
+        })
+
+    def _window_bytes(self, usage):
+        cutoff = time.time() - self.window_seconds
+        while usage['window'] and usage['window'][0][0] < cutoff:
+            usage['window'].popleft()
+        return sum(nbytes for _, nbytes in usage['window'])
+
+    def _check(self, usage, disk):
+        if self.bytes_per_window:
+            window_bytes = self._window_bytes(usage)
+            if window_bytes >= self.bytes_per_window:
+                raise QuotaExceeded(
+                    f"{_gb(window_bytes)} downloaded in the last {self.window_seconds // 60} minutes "
+                    f"(limit {_gb(self.bytes_per_window)})"
+                )
+        if self.disk_bytes and disk >= self.disk_bytes:
+            raise QuotaExceeded(f"{_gb(disk)} of output kept on disk (limit {_gb(self.disk_bytes)})")
+
+    def _disk_usage(self, account):
+        """Bytes in an account's output directories, re-measured every DISK_SCAN_INTERVAL."""
+        now = time.time()
+        with self._lock:
+            dirs = dict(self._account(account)['dirs'])
+        total = 0
+        for path, (size, measured_at) in dirs.items():
+            if now - measured_at >= DISK_SCAN_INTERVAL:
+                size = directory_size(path) if os.path.isdir(path) else None
+                with self._lock:
+                    tracked = self._account(account)['dirs']
+                    if size is None:
+                        tracked.pop(path, None)
+                    elif path in tracked:
+                        tracked[path] = (size, now)
+            total += size or 0
+        return total
+
+
+quotas = QuotaManager()
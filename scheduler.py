@@ -0,0 +1,130 @@
+"""
+Server-wide fair-share scheduling of downloads.
+
+Every download in the process (Streamlit sessions, API jobs, CLI batches)
+runs inside a slot() of the one DownloadScheduler, which caps concurrent
+downloads at MAX_DOWNLOADS however many batches are running. A batch's
+own parallelism only bounds how many of its downloads ask for a slot.
+
+When a slot frees up it goes to the waiting request that is most behind:
+interactive single downloads first, then the session with the fewest
+running downloads per unit of weight, oldest request first on ties. So
+five users running batches share the budget evenly, and a user grabbing
+one video does not queue behind them; INTERACTIVE_RESERVE slots are kept
+for interactive downloads alone so they rarely wait at all.
+
+Weights come from YTDLP_SCHEDULER_WEIGHTS, e.g. "key:3fa2c1d0b9e8=3,ip:10.0.0.7=0.5":
+API work is shared per account ("key:<fingerprint>" or "ip:<address>", as
+GET /usage reports it); sessions without a weight get 1.
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_DOWNLOADS = int(os.environ.get("YTDLP_MAX_DOWNLOADS") or 12)
+# Slots batch downloads may not take
+INTERACTIVE_RESERVE = 2
+
+
+def parse_weights(spec):
+    """{session: weight} from a "session=weight,..." list; raises ValueError if malformed."""
+    weights = {}
+    for item in (spec or "").split(','):
+        if not item.strip():
+            continue
+        session, _, weight = item.strip().rpartition('=')
+        try:
+            value = float(weight)
+        except ValueError:
+            value = 0
+        if not session or value <= 0:
+            raise ValueError(f"Invalid scheduler weight {item.strip()!r}: expected SESSION=WEIGHT with WEIGHT > 0")
+        weights[session] = value
+    return weights
+
+
+SESSION_WEIGHTS = parse_weights(os.environ.get("YTDLP_SCHEDULER_WEIGHTS"))
+
+
+class DownloadScheduler:
+    """Process-wide download slots, shared fairly between sessions."""
+
+    def __init__(self, max_downloads=MAX_DOWNLOADS, interactive_reserve=INTERACTIVE_RESERVE, weights=None):
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self.max_downloads = max_downloads
+        self.interactive_reserve = interactive_reserve
+        self.weights = dict(SESSION_WEIGHTS if weights is None else weights)
+        self._running = {}
+        self._waiting = []
+
+    @contextmanager
+    def slot(self, session, interactive=False, weight=None):
+        """
+        Run the body as one of the process's downloads, waiting for a slot.
+
+        session groups requests that share one fair share (a browser
+        session, an API account); weight scales its share (default: the
+        session's configured weight, else 1).
+        """
+        request = {'ticket': next(self._tickets), 'session': session, 'interactive': interactive,
+                   'weight': weight, 'since': time.time()}
+        with self._cond:
+            if request['weight'] is None:
+                request['weight'] = self.weights.get(session, 1.0)
+            self._waiting.append(request)
+            while not self._grantable(request):
+                self._cond.wait()
+            self._waiting.remove(request)
+            self._running[session] = self._running.get(session, 0) + 1
+            # Another slot may be free for the next in line
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[session] -= 1
+                if not self._running[session]:
+                    del self._running[session]
+                self._cond.notify_all()
+
+    def set_limit(self, max_downloads):
+        with self._cond:
+            self.max_downloads = max(int(max_downloads), 1)
+            self._cond.notify_all()
+
+    def set_weights(self, weights):
+        """Replace the per-session weights; requests already waiting keep theirs."""
+        with self._cond:
+            self.weights = dict(weights)
+
+    def stats(self):
+        """Slot use: limit, running and waiting downloads per session, longest wait."""
+        now = time.time()
+        with self._cond:
+            waiting = {}
+            for request in self._waiting:
+                waiting[request['session']] = waiting.get(request['session'], 0) + 1
+            return {
+                'max_downloads': self.max_downloads,
+                'weights': dict(self.weights),
+                'running': dict(self._running),
+                'waiting': waiting,
+                'longest_wait': max((now - r['since'] for r in self._waiting), default=0.0),
+            }
+
+    def _grantable(self, request):
+        in_use = sum(self._running.values())
+        limit = self.max_downloads if request['interactive'] else self.max_downloads - self.interactive_reserve
+        if in_use >= max(limit, 1):
+            return False
+        return min(self._waiting, key=self._priority) is request
+
+    def _priority(self, request):
+        share = self._running.get(request['session'], 0) / request['weight']
+        return (not request['interactive'], share, request['ticket'])
+
+
+scheduler = DownloadScheduler()
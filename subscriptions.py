@@ -0,0 +1,328 @@
+"""
+Incremental sync of playlists and channels.
+
+A subscription is a playlist or channel URL with download settings and an
+output directory. Its archive records every (extractor, id) already fetched
+for it, so a sync enumerates the playlist lazily, newest entries first on
+channels, stops once KNOWN_STREAK_TO_STOP archived entries in a row have
+been seen, and downloads only the entries that are new (plus earlier
+failures, up to MAX_ATTEMPTS). A daily mirror of a large channel costs one
+playlist page instead of a full re-download.
+
+Playlists that grow at the end (oldest first) cannot stop early; they are
+still enumerated in full, but only the delta is downloaded.
+
+Subscriptions live in a SQLite database (YTDLP_SYNC_DB); those with an
+interval are synced by run_scheduler(), e.g. `python cli.py sync --watch`.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import yt_dlp
+
+import engine
+import manifest
+
+SYNC_PATH = os.environ.get("YTDLP_SYNC_DB") or os.path.join(engine.JOBS_DIR, "subscriptions.sqlite")
+# Archived entries seen in a row after which enumeration stops
+KNOWN_STREAK_TO_STOP = 10
+# Syncs that may retry a failed entry before it is left alone
+MAX_ATTEMPTS = 3
+# Seconds the scheduler sleeps between checks for due subscriptions
+SCHEDULER_POLL_INTERVAL = 60
+# url/url_transparent results followed to reach the playlist (channel -> videos tab)
+MAX_REDIRECTS = 3
+# Directory under a subscription's output where jobs download before being moved in
+STAGING_DIR = ".sync-staging"
+
+
+def open_subscriptions(path=SYNC_PATH):
+    """Open (creating if needed) the subscriptions database."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            output_dir TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            interval_seconds INTEGER NOT NULL DEFAULT 0,
+            last_sync REAL,
+            last_result TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive (
+            subscription_id INTEGER NOT NULL,
+            extractor TEXT NOT NULL,
+            media_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            title TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (subscription_id, extractor, media_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS archive_status ON archive (subscription_id, status)")
+    conn.commit()
+    return conn
+
+
+def add_subscription(conn, url, output_dir, options=None, interval_seconds=0):
+    """Subscribe to a playlist or channel URL; returns the subscription id."""
+    is_valid, message = engine.validate_url(url)
+    if not is_valid:
+        raise ValueError(message)
+    if not engine.is_playlist_candidate(url):
+        raise ValueError("Only playlist and channel URLs can be synced")
+    settings = engine.normalize_batch_settings(options)
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO subscriptions (url, output_dir, settings, interval_seconds, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (url, os.path.abspath(output_dir), json.dumps(settings), max(int(interval_seconds), 0), time.time())
+    )
+    conn.commit()
+    if not cursor.rowcount:
+        raise ValueError(f"Already subscribed to {url}")
+    return cursor.lastrowid
+
+
+def remove_subscription(conn, subscription_id):
+    """Drop a subscription and its archive (downloaded files are kept)."""
+    cursor = conn.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
+    conn.execute("DELETE FROM archive WHERE subscription_id = ?", (subscription_id,))
+    conn.commit()
+    if not cursor.rowcount:
+        raise ValueError(f"No subscription {subscription_id}")
+
+
+def _subscription(row):
+    sub_id, url, output_dir, settings, interval_seconds, last_sync, last_result = row
+    return {
+        'id': sub_id, 'url': url, 'output_dir': output_dir, 'settings': json.loads(settings),
+        'interval_seconds': interval_seconds, 'last_sync': last_sync,
+        'last_result': json.loads(last_result) if last_result else None,
+    }
+
+
+_SUBSCRIPTION_COLUMNS = "id, url, output_dir, settings, interval_seconds, last_sync, last_result"
+
+
+def get_subscription(conn, subscription_id):
+    row = conn.execute(
+        f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE id = ?", (subscription_id,)
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"No subscription {subscription_id}")
+    return _subscription(row)
+
+
+def list_subscriptions(conn):
+    """All subscriptions, each with its count of archived downloads."""
+    archived = dict(conn.execute(
+        "SELECT subscription_id, COUNT(*) FROM archive WHERE status = 'done' GROUP BY subscription_id"
+    ).fetchall())
+    rows = conn.execute(f"SELECT {_SUBSCRIPTION_COLUMNS} FROM subscriptions ORDER BY id").fetchall()
+    subs = [_subscription(row) for row in rows]
+    for sub in subs:
+        sub['archived'] = archived.get(sub['id'], 0)
+    return subs
+
+
+def due_subscriptions(conn, now=None):
+    """Subscriptions with an interval whose next sync is due."""
+    now = now or time.time()
+    return [
+        sub for sub in list_subscriptions(conn)
+        if sub['interval_seconds'] and (sub['last_sync'] or 0) + sub['interval_seconds'] <= now
+    ]
+
+
+def iter_playlist_entries(url):
+    """
+    Lazily yield (identity, url, title) for the videos of a playlist URL.
+
+    The playlist is extracted flat and unprocessed, so its pages are only
+    fetched as the caller consumes entries; stop iterating to stop fetching.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        for _ in range(MAX_REDIRECTS):
+            if not info or info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+        if not info or info.get('_type') != 'playlist':
+            raise ValueError("URL is not a playlist or channel")
+        for entry in info.get('entries') or []:
+            if not entry or entry.get('_type') == 'playlist':
+                continue
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if not entry_url:
+                continue
+            if entry.get('ie_key') and entry.get('id'):
+                identity = (entry['ie_key'], str(entry['id']))
+            else:
+                identity = engine.url_identity(entry_url)
+            yield identity, entry_url, entry.get('title')
+
+
+def new_entries(conn, subscription, full=False, stats=None):
+    """
+    Entries of a subscription's playlist missing from its archive.
+
+    Enumeration stops after KNOWN_STREAK_TO_STOP archived entries in a row,
+    unless full. Returns a list of (identity, url, title).
+    """
+    if stats is None:
+        stats = {}
+    stats.update(enumerated=0, stopped_early=False)
+    # Failed entries are archived too; they are retried only through sync_subscription's capped path
+    archived = set(conn.execute(
+        "SELECT extractor, media_id FROM archive WHERE subscription_id = ?", (subscription['id'],)
+    ).fetchall())
+    entries = []
+    seen = set()
+    streak = 0
+    for identity, entry_url, title in iter_playlist_entries(subscription['url']):
+        stats['enumerated'] += 1
+        if identity in archived:
+            streak += 1
+            if not full and streak >= KNOWN_STREAK_TO_STOP:
+                stats['stopped_early'] = True
+                break
+            continue
+        streak = 0
+        if identity not in seen:
+            seen.add(identity)
+            entries.append((identity, entry_url, title))
+    return entries
+
+
+def _record_entry(conn, subscription_id, identity, url, result):
+    status = "done" if result['status'] == "success" else "error"
+    conn.execute(
+        "INSERT INTO archive (subscription_id, extractor, media_id, url, title, status, error, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (subscription_id, extractor, media_id) DO UPDATE SET "
+        "url = excluded.url, title = excluded.title, status = excluded.status, error = excluded.error, "
+        "attempts = attempts + 1, updated_at = excluded.updated_at",
+        (subscription_id, identity[0], identity[1], url, result.get('title'), status,
+         result.get('error'), time.time())
+    )
+    conn.commit()
+
+
+def _move_outputs(result, staging_dir, output_dir):
+    """
+    Move a successful job's files out of its task directory into output_dir.
+
+    Files the engine already moved into the library (see library.py) stay there.
+    """
+    entries = []
+    for entry in result.get('manifest', []):
+        if os.path.commonpath([entry['path'], staging_dir]) == staging_dir:
+            target = os.path.join(output_dir, entry['filename'])
+            os.replace(entry['path'], target)
+            entry = dict(entry, path=target)
+        entries.append(entry)
+    return dict(result, files=manifest.as_files(entries), manifest=entries)
+
+
+def sync_subscription(conn, subscription_id, full=False, on_result=None):
+    """
+    Download a subscription's new entries and retry its earlier failures.
+
+    Files land directly in the subscription's output directory; each entry
+    is archived as it finishes, so an interrupted sync resumes where it
+    stopped. on_result(result) is called per entry. Returns a summary dict.
+    """
+    subscription = get_subscription(conn, subscription_id)
+    settings = subscription['settings']
+    output_dir = subscription['output_dir']
+    staging_dir = os.path.join(output_dir, STAGING_DIR)
+    # Partial files of an interrupted sync are never picked up as outputs
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir, exist_ok=True)
+    stats = {}
+    started = time.time()
+
+    entries = new_entries(conn, subscription, full, stats)
+    retries = [
+        ((extractor, media_id), url, title)
+        for extractor, media_id, url, title in conn.execute(
+            "SELECT extractor, media_id, url, title FROM archive "
+            "WHERE subscription_id = ? AND status = 'error' AND attempts < ? ORDER BY updated_at",
+            (subscription_id, MAX_ATTEMPTS)
+        ).fetchall()
+    ]
+    jobs = entries + retries
+    summary = {'new': len(entries), 'retried': len(retries), 'downloaded': 0, 'failed': 0,
+               'enumerated': stats['enumerated'], 'stopped_early': stats['stopped_early']}
+
+    def on_batch_result(position, result):
+        identity, url, _ = jobs[position]
+        if result['status'] == "success":
+            result = _move_outputs(result, staging_dir, output_dir)
+            summary['downloaded'] += 1
+        else:
+            summary['failed'] += 1
+        _record_entry(conn, subscription_id, identity, url, result)
+        if on_result:
+            on_result(result)
+
+    engine.run_batch(
+        ((position, url) for position, (_, url, _) in enumerate(jobs)),
+        staging_dir, settings, on_result=on_batch_result, session=f"sync:{subscription_id}",
+    )
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    summary['seconds'] = round(time.time() - started, 1)
+    conn.execute(
+        "UPDATE subscriptions SET last_sync = ?, last_result = ? WHERE id = ?",
+        (started, json.dumps(summary), subscription_id)
+    )
+    conn.commit()
+    return summary
+
+
+def run_scheduler(path=SYNC_PATH, stop_event=None, on_sync=None, on_result=None):
+    """
+    Sync due subscriptions until stop_event is set.
+
+    Checks every SCHEDULER_POLL_INTERVAL seconds; on_sync(subscription,
+    summary) is called after each sync, with an 'error' summary if it failed.
+    """
+    stop_event = stop_event or threading.Event()
+    conn = open_subscriptions(path)
+    try:
+        while not stop_event.is_set():
+            for subscription in due_subscriptions(conn):
+                if stop_event.is_set():
+                    break
+                try:
+                    summary = sync_subscription(conn, subscription['id'], on_result=on_result)
+                except Exception as e:
+                    error_type, _ = engine.categorize_error(str(e))
+                    summary = {'error': f"{error_type}: {e}"}
+                    # Wait a full interval before trying this subscription again
+                    conn.execute("UPDATE subscriptions SET last_sync = ?, last_result = ? WHERE id = ?",
+                                 (time.time(), json.dumps(summary), subscription['id']))
+                    conn.commit()
+                if on_sync:
+                    on_sync(subscription, summary)
+            stop_event.wait(SCHEDULER_POLL_INTERVAL)
+    finally:
+        conn.close()
@@ -0,0 +1,608 @@
+"""
+Parallel ranged HTTP transfer and adaptive fragment concurrency.
+
+yt-dlp fetches a progressive (non-fragmented) format over one connection,
+so a single slow TCP stream caps the whole download. ParallelHttpFD splits
+large files into byte ranges fetched over several connections, all drawn
+from one keep-alive pool shared by every download in the process, so jobs
+hitting the same CDN host reuse warm connections instead of handshaking
+again.
+
+HLS/DASH formats are fetched fragment by fragment; a FragmentController
+per download gates how many fragments are in flight and moves that number
+up or down with measured throughput.
+
+Both draw on one ConnectionBudget shared by all active transfers: a
+transfer always gets its minimum, grows only into connections nobody else
+holds, and gives connections back when new transfers push the budget over
+its total. Small files and servers without range support use yt-dlp's own
+downloader.
+
+Bytes are metered by a BandwidthAllocator: a process-wide cap split fairly
+between running transfers (re-split whenever one starts or finishes), with
+an optional per-job limit on top.
+"""
+import itertools
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import yt_dlp
+from yt_dlp.downloader import get_suitable_downloader
+from yt_dlp.downloader.fragment import FragmentFD
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.utils import ContentTooShortError, determine_protocol
+
+# Files smaller than this are not worth splitting
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+# Bytes fetched by one ranged request
+CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CONNECTIONS = 2
+MAX_CONNECTIONS = 8
+# A connection is added only while it raises total throughput by this factor
+SCALE_UP_GAIN = 1.15
+# Seconds between throughput measurements (and progress reports)
+MEASURE_INTERVAL = 2.0
+# Attempts per byte range before the transfer fails
+CHUNK_RETRIES = 3
+# Keep-alive connections held per host, and hosts kept in the pool
+POOL_MAXSIZE = 32
+POOL_HOSTS = 16
+READ_BLOCK = 256 * 1024
+# Connections all active transfers may hold together
+CONNECTION_BUDGET = 16
+# Fragments in flight per HLS/DASH download: start, floor and ceiling
+FRAGMENT_START_CONNECTIONS = 2
+FRAGMENT_MIN_CONNECTIONS = 1
+FRAGMENT_MAX_CONNECTIONS = 8
+# Process-wide bandwidth cap in KB/s (0 = unlimited)
+BANDWIDTH_CAP_KBPS = int(os.environ.get("YTDLP_BANDWIDTH_CAP") or 0)
+# Seconds of unused allowance a transfer may burst with
+BANDWIDTH_BURST_SECONDS = 0.5
+
+_session = None
+_session_lock = threading.Lock()
+# host -> connection count that last gave the best throughput
+_host_connections = {}
+_host_lock = threading.Lock()
+
+
+def shared_session():
+    """The requests.Session whose keep-alive pool every transfer shares."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Shared across jobs and accounts: cookies come from each job's own
+            # cookiejar per request, and none a response sets are kept
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def host_connection_stats():
+    """Snapshot of the learned connection count per host."""
+    with _host_lock:
+        return dict(_host_connections)
+
+
+class ConnectionBudget:
+    """Connections held by active transfers, against one shared total."""
+
+    def __init__(self, total):
+        self.total = total
+        self._lock = threading.Lock()
+        self._held = {}
+
+    def reserve(self, owner, count):
+        """Grant a transfer's minimum connections, even over budget."""
+        with self._lock:
+            self._held[owner] = self._held.get(owner, 0) + count
+
+    def try_grow(self, owner):
+        """Take one more connection if the budget has a spare one."""
+        with self._lock:
+            if sum(self._held.values()) >= self.total:
+                return False
+            self._held[owner] = self._held.get(owner, 0) + 1
+            return True
+
+    def over_share(self, owner):
+        """Whether the budget is oversubscribed and owner holds more than its fair share."""
+        with self._lock:
+            if sum(self._held.values()) <= self.total:
+                return False
+            return self._held.get(owner, 0) > max(self.total // len(self._held), 1)
+
+    def shrink(self, owner):
+        with self._lock:
+            if self._held.get(owner, 0) > 0:
+                self._held[owner] -= 1
+
+    def release(self, owner):
+        with self._lock:
+            self._held.pop(owner, None)
+
+    def stats(self):
+        with self._lock:
+            return {'total': self.total, 'held': sum(self._held.values()), 'transfers': len(self._held)}
+
+
+_budget = ConnectionBudget(CONNECTION_BUDGET)
+
+
+def connection_budget_stats():
+    """Connections currently held against the shared budget."""
+    return _budget.stats()
+
+
+class BandwidthAllocator:
+    """
+    Token buckets for running transfers under one process-wide cap.
+
+    Each transfer's rate is its share of the cap, water-filled so transfers
+    with a lower per-job limit leave the rest to the others, and recomputed
+    whenever a transfer registers or unregisters. Rates are in bytes/s;
+    0 means unlimited.
+    """
+
+    def __init__(self, cap=0):
+        self.cap = cap
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._ids = itertools.count()
+
+    def set_cap(self, cap):
+        with self._lock:
+            self.cap = max(int(cap or 0), 0)
+            self._reallocate()
+
+    def register(self, limit=0):
+        """Start metering a transfer; returns its handle for consume()/unregister()."""
+        with self._lock:
+            handle = next(self._ids)
+            self._transfers[handle] = {'limit': max(int(limit or 0), 0), 'rate': 0,
+                                       'tokens': 0.0, 'stamp': time.monotonic()}
+            self._reallocate()
+            return handle
+
+    def unregister(self, handle):
+        with self._lock:
+            self._transfers.pop(handle, None)
+            self._reallocate()
+
+    def consume(self, handle, nbytes):
+        """Account for bytes a transfer received, sleeping while it is over its rate."""
+        with self._lock:
+            transfer = self._transfers.get(handle)
+            if not transfer or not transfer['rate']:
+                return
+            rate = transfer['rate']
+            now = time.monotonic()
+            tokens = transfer['tokens'] + (now - transfer['stamp']) * rate
+            transfer['tokens'] = min(tokens, rate * BANDWIDTH_BURST_SECONDS) - nbytes
+            transfer['stamp'] = now
+            delay = -transfer['tokens'] / rate
+        if delay > 0:
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {'cap': self.cap, 'transfers': len(self._transfers),
+                    'rates': [t['rate'] for t in self._transfers.values()]}
+
+    def _reallocate(self):
+        transfers = sorted(self._transfers.values(), key=lambda t: t['limit'] or float('inf'))
+        remaining = self.cap
+        for index, transfer in enumerate(transfers):
+            if not self.cap:
+                transfer['rate'] = transfer['limit']
+                continue
+            share = remaining / (len(transfers) - index)
+            transfer['rate'] = min(transfer['limit'], share) if transfer['limit'] else share
+            remaining -= transfer['rate']
+
+
+_bandwidth = BandwidthAllocator(BANDWIDTH_CAP_KBPS * 1024)
+
+
+def set_bandwidth_cap(kbps):
+    """Set the process-wide bandwidth cap in KB/s (0 = unlimited)."""
+    _bandwidth.set_cap((kbps or 0) * 1024)
+
+
+def bandwidth_stats():
+    """Current cap and per-transfer rates, in bytes/s."""
+    return _bandwidth.stats()
+
+
+def wants_parallel_transfer(info, params):
+    """Whether a format is a single large http(s) file worth splitting."""
+    if info.get('requested_formats') or params.get('test'):
+        return False
+    if determine_protocol(info) not in ('http', 'https'):
+        return False
+    size = info.get('filesize') or info.get('filesize_approx')
+    # Unknown sizes are probed by the downloader itself
+    return not size or size >= PARALLEL_MIN_SIZE
+
+
+class _FileTooLarge(Exception):
+    """A download of unknown size passed max_filesize."""
+
+
+class ParallelHttpFD(HttpFD):
+    """HttpFD that fetches large range-capable files over several connections."""
+
+    FD_NAME = 'parallelhttp'
+    # Set by TransferYoutubeDL; the parallel path meters its own bytes
+    bandwidth_handle = None
+    meters_itself = False
+
+    def real_download(self, filename, info_dict):
+        url = info_dict['url']
+        headers = dict(info_dict.get('http_headers') or {})
+        headers['Accept-Encoding'] = 'identity'
+        cookie = self.ydl.cookiejar.get_cookie_header(url)
+        if cookie:
+            headers['Cookie'] = cookie
+
+        request_opts = {
+            'timeout': self.params.get('socket_timeout') or 20,
+            'verify': not self.params.get('nocheckcertificate'),
+        }
+        proxy = self.params.get('proxy')
+        if proxy:
+            request_opts['proxies'] = {'http': proxy, 'https': proxy}
+
+        try:
+            size = self._probe_size(url, headers, request_opts)
+        except requests.RequestException:
+            size = None
+        if size and not self._size_allowed(size):
+            return False
+        if not size or size < PARALLEL_MIN_SIZE:
+            try:
+                return super().real_download(filename, info_dict)
+            except _FileTooLarge as e:
+                self.to_screen(f'\r[download] {e}. Aborting.')
+                try:
+                    os.remove(self.temp_name(filename))
+                except OSError:
+                    pass
+                return False
+
+        self.meters_itself = True
+        self.report_destination(filename)
+        tmpfilename = self.temp_name(filename)
+        with open(tmpfilename, 'wb') as f:
+            f.truncate(size)
+
+        host = urlparse(url).netloc
+        with _host_lock:
+            connections = _host_connections.get(host, MIN_CONNECTIONS)
+        state = {
+            'lock': threading.Lock(),
+            'ranges': [(start, min(start + CHUNK_SIZE, size) - 1)
+                       for start in reversed(range(0, size, CHUNK_SIZE))],
+            'attempts': {},
+            'downloaded': 0,
+            'error': None,
+            # Connections to close once their current range is done
+            'retire': 0,
+        }
+        threads = []
+
+        def add_connection():
+            thread = threading.Thread(
+                target=self._transfer_ranges, args=(url, headers, request_opts, tmpfilename, state),
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        # The first connections are always granted; more only from spare budget
+        connections = min(connections, len(state['ranges']))
+        _budget.reserve(self, connections)
+        for _ in range(connections):
+            add_connection()
+
+        started = last_time = time.time()
+        last_bytes, last_rate, settled = 0, None, False
+        try:
+            while any(t.is_alive() for t in threads):
+                next(t for t in threads if t.is_alive()).join(MEASURE_INTERVAL)
+                now = time.time()
+                downloaded = state['downloaded']
+                rate = (downloaded - last_bytes) / max(now - last_time, 1e-6)
+                last_bytes, last_time = downloaded, now
+
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': size,
+                    'filename': filename,
+                    'tmpfilename': tmpfilename,
+                    'elapsed': now - started,
+                    'speed': rate,
+                    'eta': self.calc_eta(rate or None, size - downloaded),
+                }, info_dict)
+
+                # Scale up while each extra connection still pays for itself
+                if settled or state['error'] or not state['ranges']:
+                    continue
+                if last_rate is not None and rate < last_rate * SCALE_UP_GAIN:
+                    # The last connection added did not pay for itself: retire one
+                    with state['lock']:
+                        state['retire'] += 1
+                    _budget.shrink(self)
+                    connections -= 1
+                    settled = True
+                elif connections < MAX_CONNECTIONS and _budget.try_grow(self):
+                    last_rate = rate
+                    connections += 1
+                    add_connection()
+                else:
+                    settled = connections >= MAX_CONNECTIONS
+        finally:
+            _budget.release(self)
+
+        if state['error']:
+            raise state['error']
+
+        with _host_lock:
+            _host_connections[host] = max(connections, MIN_CONNECTIONS)
+
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': size,
+            'total_bytes': size,
+            'filename': filename,
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+
+    def _size_allowed(self, size):
+        """Whether a known size is within min_filesize/max_filesize; reports it like HttpFD when not."""
+        min_size, max_size = self.params.get('min_filesize'), self.params.get('max_filesize')
+        if min_size is not None and size < min_size:
+            self.to_screen(
+                f'\r[download] File is smaller than min-filesize ({size} bytes < {min_size} bytes). Aborting.')
+            return False
+        if max_size is not None and size > max_size:
+            self.to_screen(
+                f'\r[download] File is larger than max-filesize ({size} bytes > {max_size} bytes). Aborting.')
+            return False
+        return True
+
+    def _hook_progress(self, status, info_dict):
+        # HttpFD only checks max_filesize against a Content-Length; without one, stop
+        # as soon as the bytes received pass it
+        max_size = self.params.get('max_filesize')
+        if (max_size is not None and status.get('status') == 'downloading' and not status.get('total_bytes')
+                and (status.get('downloaded_bytes') or 0) > max_size):
+            raise _FileTooLarge(f"File is larger than max-filesize (> {max_size} bytes)")
+        super()._hook_progress(status, info_dict)
+
+    def _probe_size(self, url, headers, request_opts):
+        """Total size if the server honours byte ranges, else None."""
+        response = shared_session().get(
+            url, headers=dict(headers, Range='bytes=0-0'), stream=True, **request_opts
+        )
+        with response:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code != 206 or '/' not in content_range:
+                return None
+            total = content_range.rsplit('/', 1)[1]
+            return int(total) if total.isdigit() else None
+
+    def _transfer_ranges(self, url, headers, request_opts, tmpfilename, state):
+        """One connection: fetch queued byte ranges until none are left."""
+        session = shared_session()
+        with open(tmpfilename, 'r+b') as f:
+            while True:
+                with state['lock']:
+                    if state['error'] or not state['ranges']:
+                        return
+                    if state['retire']:
+                        state['retire'] -= 1
+                        return
+                    start, end = state['ranges'].pop()
+
+                written = 0
+                try:
+                    response = session.get(
+                        url, headers=dict(headers, Range=f'bytes={start}-{end}'), stream=True,
+                        **request_opts
+                    )
+                    with response:
+                        if response.status_code != 206:
+                            raise requests.HTTPError(
+                                f'Range request returned HTTP {response.status_code}', response=response
+                            )
+                        f.seek(start)
+                        for block in response.iter_content(READ_BLOCK):
+                            block = block[:end + 1 - start - written]
+                            f.write(block)
+                            written += len(block)
+                            with state['lock']:
+                                state['downloaded'] += len(block)
+                            _bandwidth.consume(self.bandwidth_handle, len(block))
+                    if written != end + 1 - start:
+                        raise ContentTooShortError(written, end + 1 - start)
+                except (requests.RequestException, ContentTooShortError, OSError) as e:
+                    with state['lock']:
+                        state['downloaded'] -= written
+                        attempts = state['attempts'][start] = state['attempts'].get(start, 0) + 1
+                        if attempts < CHUNK_RETRIES:
+                            state['ranges'].append((start, end))
+                        elif not state['error']:
+                            state['error'] = e
+                            return
+
+
+class FragmentController:
+    """
+    Gate on the fragments one HLS/DASH download has in flight.
+
+    Starts at FRAGMENT_START_CONNECTIONS; after each MEASURE_INTERVAL it adds
+    a slot while throughput keeps rising, drops one when throughput falls,
+    and hands slots back when other transfers need their share of the budget.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.limit = FRAGMENT_START_CONNECTIONS
+        budget.reserve(self, self.limit)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._window_start = time.time()
+        self._window_bytes = 0
+        self._last_rate = None
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, nbytes):
+        with self._cond:
+            self._active -= 1
+            self._window_bytes += nbytes
+            self._adjust()
+            self._cond.notify_all()
+
+    def close(self):
+        self.budget.release(self)
+
+    def _adjust(self):
+        now = time.time()
+        elapsed = now - self._window_start
+        if elapsed < MEASURE_INTERVAL:
+            return
+        rate = self._window_bytes / elapsed
+        self._window_start, self._window_bytes = now, 0
+
+        if self.limit > FRAGMENT_MIN_CONNECTIONS and self.budget.over_share(self):
+            self.limit -= 1
+            self.budget.shrink(self)
+        elif self._last_rate is None or rate >= self._last_rate * SCALE_UP_GAIN:
+            if self.limit < FRAGMENT_MAX_CONNECTIONS and self.budget.try_grow(self):
+                self.limit += 1
+        elif rate * SCALE_UP_GAIN < self._last_rate and self.limit > FRAGMENT_MIN_CONNECTIONS:
+            self.limit -= 1
+            self.budget.shrink(self)
+        self._last_rate = rate
+
+
+class AdaptiveFragmentMixin:
+    """Routes a FragmentFD's fragment requests through a FragmentController."""
+
+    def real_download(self, filename, info_dict):
+        self._fragment_controller = FragmentController(_budget)
+        try:
+            return super().real_download(filename, info_dict)
+        finally:
+            self._fragment_controller.close()
+
+    def _download_fragment(self, ctx, frag_url, info_dict, headers=None, request_data=None):
+        controller = self._fragment_controller
+        controller.acquire()
+        nbytes = 0
+        try:
+            success = super()._download_fragment(ctx, frag_url, info_dict, headers, request_data)
+            if success:
+                nbytes = self.filesize_or_none(ctx['fragment_filename_sanitized']) or 0
+            return success
+        finally:
+            controller.release(nbytes)
+
+
+_adaptive_fds = {}
+
+
+def adaptive_fragment_downloader(fd_class):
+    """The adaptive-concurrency variant of a FragmentFD subclass."""
+    if fd_class not in _adaptive_fds:
+        _adaptive_fds[fd_class] = type(f'Adaptive{fd_class.__name__}', (AdaptiveFragmentMixin, fd_class), {})
+    return _adaptive_fds[fd_class]
+
+
+class TransferYoutubeDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL that routes large direct-file formats through ParallelHttpFD
+    and native HLS/DASH downloads through an adaptive fragment downloader,
+    metering every download against the bandwidth allocator.
+
+    rate_limit is this instance's per-job limit in bytes/s (0 = none).
+    Fragments run concurrently only when every progress hook has a true
+    'thread_safe' attribute, since their progress is reported from the
+    fragment threads.
+    """
+
+    def __init__(self, params=None, auto_init=True, rate_limit=0):
+        super().__init__(params, auto_init)
+        self.rate_limit = rate_limit
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test or name == '-' or not info.get('url'):
+            return super().dl(name, info, subtitle, test)
+
+        params = self.params
+        fd_class = get_suitable_downloader(info, params)
+        if subtitle:
+            pass
+        elif fd_class is HttpFD and wants_parallel_transfer(info, params):
+            fd_class = ParallelHttpFD
+        # An explicit concurrent_fragment_downloads keeps yt-dlp's fixed pool, and hooks
+        # that must not run on fragment threads keep fragments sequential
+        elif (issubclass(fd_class, FragmentFD) and not params.get('concurrent_fragment_downloads')
+              and all(getattr(hook, 'thread_safe', False) for hook in self._progress_hooks)):
+            fd_class = adaptive_fragment_downloader(fd_class)
+            # The pool only needs enough threads; the controller decides how many run
+            params = dict(params, concurrent_fragment_downloads=FRAGMENT_MAX_CONNECTIONS)
+
+        fd = fd_class(self, params)
+        handle = _bandwidth.register(self.rate_limit)
+        fd.bandwidth_handle = handle
+        fd.add_progress_hook(self._metering_hook(fd, handle))
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info["url"]}"')
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        try:
+            return fd.download(name, new_info, subtitle)
+        finally:
+            _bandwidth.unregister(handle)
+
+    @staticmethod
+    def _metering_hook(fd, handle):
+        """Progress hook feeding the bytes an fd reports to the bandwidth allocator."""
+        received = {}
+        lock = threading.Lock()
+
+        def hook(status):
+            if status.get('status') != 'downloading' or getattr(fd, 'meters_itself', False):
+                return
+            key = status.get('tmpfilename') or status.get('filename')
+            downloaded = status.get('downloaded_bytes') or 0
+            with lock:
+                delta = downloaded - received.get(key, 0)
+                received[key] = downloaded
+            if delta > 0:
+                # Sleeping here holds back the thread that received the bytes
+                _bandwidth.consume(handle, delta)
+
+        return hook
@@ -0,0 +1,119 @@
+"""
+Pool of initialized YoutubeDL instances, keyed by options profile.
+
+Creating a YoutubeDL registers every extractor and builds a cookie jar and
+HTTP request stack; for batches of short clips that setup rivals the
+download itself. Jobs with the same options profile (see
+engine.ydl_profile) instead check out an idle instance, swap in their own
+output template, progress hooks and postprocessors, and hand it back when
+they finish, so its extractors and open connections carry over.
+
+An instance is used by one job at a time; one that raised is closed
+rather than reused. Profiles are shared across accounts, so each checkout
+starts from the profile's own cookies: whatever an earlier job's responses
+set is dropped.
+"""
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from yt_dlp.cookies import load_cookies
+from yt_dlp.utils import POSTPROCESS_WHEN
+
+from transfer import TransferYoutubeDL
+
+# Idle instances kept per profile, and profiles kept before the least recently used is closed
+MAX_IDLE_PER_PROFILE = 10
+MAX_PROFILES = 8
+
+_lock = threading.Lock()
+_idle = OrderedDict()
+_stats = {'created': 0, 'reused': 0}
+
+
+@contextmanager
+def checkout(key, params, outtmpl, progress_hooks=(), rate_limit=0):
+    """
+    Yield a TransferYoutubeDL for profile `key`, reusing an idle one if any.
+
+    params are the profile's YoutubeDL params (used only to create a new
+    instance); outtmpl, progress_hooks and rate_limit are per job.
+    """
+    ydl = _take(key)
+    if ydl is None:
+        ydl = TransferYoutubeDL(dict(params))
+        with _lock:
+            _stats['created'] += 1
+    else:
+        _reset_cookies(ydl)
+    _prepare(ydl, outtmpl, progress_hooks, rate_limit)
+    try:
+        yield ydl
+    except BaseException:
+        ydl.close()
+        raise
+    _give_back(key, ydl)
+
+
+def pool_stats():
+    """Instances created and reused so far, and idle instances per profile."""
+    with _lock:
+        return dict(_stats, idle=sum(len(instances) for instances in _idle.values()), profiles=len(_idle))
+
+
+def close_all():
+    with _lock:
+        instances = [ydl for idle in _idle.values() for ydl in idle]
+        _idle.clear()
+    for ydl in instances:
+        ydl.close()
+
+
+def _take(key):
+    with _lock:
+        idle = _idle.get(key)
+        if not idle:
+            return None
+        _idle.move_to_end(key)
+        _stats['reused'] += 1
+        return idle.pop()
+
+
+def _give_back(key, ydl):
+    evicted = []
+    with _lock:
+        idle = _idle.setdefault(key, [])
+        _idle.move_to_end(key)
+        if len(idle) < MAX_IDLE_PER_PROFILE:
+            idle.append(ydl)
+        else:
+            evicted.append(ydl)
+        while len(_idle) > MAX_PROFILES:
+            evicted.extend(_idle.popitem(last=False)[1])
+    for instance in evicted:
+        instance.close()
+
+
+def _prepare(ydl, outtmpl, progress_hooks, rate_limit):
+    """Reset an instance's per-job state and install this job's."""
+    ydl.params['outtmpl'] = dict(outtmpl)
+    ydl._parse_outtmpl()
+    ydl._progress_hooks = list(progress_hooks)
+    ydl._postprocessor_hooks = []
+    ydl._pps = {when: [] for when in POSTPROCESS_WHEN}
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    ydl.rate_limit = rate_limit
+
+
+def _reset_cookies(ydl):
+    """Drop cookies an earlier job collected, keeping the profile's cookie file or browser cookies."""
+    # Cleared in place: the request handlers hold a reference to this jar
+    ydl.cookiejar.clear()
+    if ydl.params.get('cookiefile') or ydl.params.get('cookiesfrombrowser'):
+        for cookie in load_cookies(ydl.params.get('cookiefile'), ydl.params.get('cookiesfrombrowser'), ydl):
+            ydl.cookiejar.set_cookie(cookie)
+
+
+atexit.register(close_all)